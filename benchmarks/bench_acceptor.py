@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+
+# Measures the cost of the acceptor handlers as the number of instances started by the acceptor grows: for each
+# history size a fresh acceptor first handles that many instances, then the time spent handling the Prepare and the
+# Propose of the next instances is reported per message.
+# The replies are sent to multicast groups nobody listens to, so that only the acceptor side is measured.
+#
+# Usage: ./benchmarks/bench_acceptor.py [number of measured instances per history size]
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from paxos import Acceptor, Network, NetworkGroup
+from paxos.codec import RemoteSender
+from paxos.message import Prepare, Propose
+from paxos.role import Role
+
+BENCH_NETWORK = Network(2,
+                        NetworkGroup(('239.0.0.1', 15000)),
+                        NetworkGroup(('239.0.0.1', 16000)),
+                        NetworkGroup(('239.0.0.1', 17000)),
+                        NetworkGroup(('239.0.0.1', 18000)))
+
+HISTORY_SIZES = [0, 1000, 10000, 50000, 100000]
+MESSAGES_PER_ITERATION = 64
+
+PROPOSER = RemoteSender(1, Role.PROPOSER)
+
+
+def handle(acceptor: Acceptor, first: int, last: int) -> None:
+    for instance in range(first, last):
+        acceptor.dispatch(Prepare(PROPOSER, Role.ACCEPTOR, (2, instance, False)))
+        acceptor.dispatch(Propose(PROPOSER, Role.ACCEPTOR, (2, 'value{0}'.format(instance), instance, False)))
+        if instance % MESSAGES_PER_ITERATION == 0:
+            acceptor.flush()
+    acceptor.flush()
+
+
+if __name__ == '__main__':
+    measured = int(sys.argv[1]) if len(sys.argv) >= 2 else 2000
+
+    print("{0:>10} {1:>14} {2:>14}".format("history", "us/message", "messages/s"))
+    for history in HISTORY_SIZES:
+        acceptor = Acceptor(1, BENCH_NETWORK, 0.0, 0.0)
+        handle(acceptor, 1, history + 1)
+
+        start = time.perf_counter()
+        handle(acceptor, history + 1, history + measured + 1)
+        elapsed = time.perf_counter() - start
+
+        messages = 2 * measured
+        print("{0:10} {1:14.2f} {2:14.0f}".format(history, elapsed / messages * 1e6, messages / elapsed))
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+
+# Compares the binary wire codec with the pickle serialization previously used by Node.send and Node.listen:
+# bytes per message and encode/decode throughput for every message type.
+#
+# Usage: ./benchmarks/bench_codec.py [number of iterations per message type]
+
+import os
+import pickle
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from paxos.codec import RemoteSender, encode, decode
+from paxos.role import Role
+from paxos.ballot import make_ballot
+from paxos.message import Prepare, Promise, Propose, Accept, ClientPropose, Decide, RequestAck, DecideAck, \
+    HeartBeat, CatchupRequest, CatchupResponse, PrepareRange, PromiseRange
+
+
+def sample_messages():
+    proposer = RemoteSender(1, Role.PROPOSER)
+    acceptor = RemoteSender(2, Role.ACCEPTOR)
+    learner = RemoteSender(1, Role.LEARNER)
+    client = RemoteSender(1, Role.CLIENT)
+    round_id = make_ballot(3, 1)
+    return [
+        Prepare(proposer, Role.ACCEPTOR, (round_id, 1234)),
+        Promise(acceptor, Role.PROPOSER, (round_id, make_ballot(2, 2), 31337, 1234)),
+        Propose(proposer, Role.ACCEPTOR, (round_id, 31337, 1234)),
+        Accept(acceptor, Role.LEARNER, (round_id, 31337, 1234)),
+        ClientPropose(client, Role.PROPOSER, ('31337', 1234)),
+        Decide(proposer, Role.LEARNER, (31337, 1234)),
+        RequestAck(proposer, Role.CLIENT, 1234),
+        DecideAck(learner, Role.PROPOSER, 1234),
+        HeartBeat(proposer, Role.PROPOSER, 1),
+        CatchupRequest(learner, Role.LEARNER, (2, 1200, 1500, [(1250, 1260), (1300, 1300)])),
+        CatchupResponse(learner, Role.LEARNER, {instance: 20000 + instance for instance in range(1, 251)}),
+        PrepareRange(proposer, Role.ACCEPTOR, (round_id, 1200)),
+        PromiseRange(acceptor, Role.PROPOSER, (round_id, 1200, 0, 1,
+                                               [(instance, make_ballot(2, 2), 31337) for instance in range(1200, 1216)])),
+    ]
+
+
+def throughput(function, iterations: int) -> float:
+    return iterations / timeit.timeit(function, number=iterations)
+
+
+if __name__ == '__main__':
+    iterations = int(sys.argv[1]) if len(sys.argv) >= 2 else 20000
+
+    print("{0:18} {1:>8} {2:>8} {3:>12} {4:>12} {5:>12} {6:>12}".format(
+        "message", "pickle B", "codec B", "pickle enc/s", "codec enc/s", "pickle dec/s", "codec dec/s"))
+
+    for message in sample_messages():
+        pickled = pickle.dumps(message)
+        encoded = encode(message)
+        view = memoryview(encoded)
+        # Catch-up responses are much bigger, scale the iterations down to keep the run short
+        n = iterations if len(pickled) < 1024 else max(iterations // 100, 1)
+
+        print("{0:18} {1:8} {2:8} {3:12.0f} {4:12.0f} {5:12.0f} {6:12.0f}".format(
+            message.message_type.name,
+            len(pickled),
+            len(encoded),
+            throughput(lambda: pickle.dumps(message), n),
+            throughput(lambda: encode(message), n),
+            throughput(lambda: pickle.loads(pickled), n),
+            throughput(lambda: decode(view), n)))
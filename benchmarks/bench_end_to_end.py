@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+
+# End-to-end benchmark suite built on the scenarios of test_runs: the nodes of run.sh run in the network simulator
+# (see paxos/simulator.py), where every iteration of a node takes the time it actually took to run, as if each node
+# had a core of its own. For every scenario it reports the instances decided per second, the commit latency of the
+# instances (from the first request of a client to the first decision of a learner) at the 50th, 99th and 99.9th
+# percentiles, and the datagrams sent by the nodes per decided instance, sweeping the loss ratio, the number of
+# acceptors and the number of clients. Each client requests its own range of instances, so the load grows with the
+# clients. The results are also written as JSON, with the commit they were measured on, to compare versions.
+#
+# With --virtual the iterations take no time: the results depend only on the seed and the latency measures the
+# protocol alone (round trips, timeouts and retransmissions over the simulated network delay).
+#
+# Usage: ./benchmarks/bench_end_to_end.py [options], see ./benchmarks/bench_end_to_end.py --help
+
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, NamedTuple, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from paxos import Acceptor, Client, Learner, Network, NetworkGroup, Proposer
+from paxos.simulator import NetworkConditions, Simulator
+
+# Virtual time (in sec) the clients are started after the other nodes, and a run has to decide all the instances
+CLIENT_DELAY = 0.5
+RUN_TIMEOUT = 60.0
+
+
+class Scenario(NamedTuple):
+    name: str
+    loss: float = 0.0
+    acceptors: int = 3
+    clients: int = 2
+    # Acceptors actually started, all of them by default (test_2 runs 2 acceptors out of 3)
+    running_acceptors: Optional[int] = None
+    # Crash the last acceptor once this fraction of the instances is decided (test_5)
+    crash_acceptor: Optional[float] = None
+    # Start the second learner and the second client once the first client's instances are decided (test_6)
+    catchup: bool = False
+
+
+SWEEPS = {
+    'scenarios': [Scenario('test_1'),
+                  Scenario('test_2_two_acceptors', running_acceptors=2),
+                  Scenario('test_4_loss10', loss=0.1),
+                  Scenario('test_4_loss20', loss=0.2),
+                  Scenario('test_5_kill_acceptor', crash_acceptor=1 / 3),
+                  Scenario('test_6_catchup', catchup=True)],
+    'loss': [Scenario('loss', loss=loss) for loss in (0.0, 0.05, 0.1, 0.2)],
+    'acceptors': [Scenario('acceptors', acceptors=acceptors) for acceptors in (3, 5, 7)],
+    'clients': [Scenario('clients', clients=clients) for clients in (1, 2, 4, 8)],
+}
+
+
+def percentile(sorted_values: List[float], fraction: float) -> Optional[float]:
+    # Nearest rank
+    if not sorted_values:
+        return None
+    return sorted_values[min(int(fraction * len(sorted_values)), len(sorted_values) - 1)]
+
+
+def run(scenario: Scenario, values: int, seed: int, virtual: bool, directory: str) -> Dict:
+    """
+    Runs a scenario, the learners writing their decision logs in directory
+    """
+    simulator = Simulator(seed, NetworkConditions(loss=scenario.loss), processing_time=not virtual)
+    network = Network(scenario.acceptors // 2 + 1,
+                      NetworkGroup(('239.0.0.1', 5000)),
+                      NetworkGroup(('239.0.0.1', 6000)),
+                      NetworkGroup(('239.0.0.1', 7000)),
+                      NetworkGroup(('239.0.0.1', 8000)),
+                      acceptor_count=scenario.acceptors)
+    instances = values * scenario.clients
+
+    running_acceptors = scenario.running_acceptors or scenario.acceptors
+    acceptors = [simulator.add(Acceptor(i, network, 0.0, 0.0, **simulator.node_options()))
+                 for i in range(1, running_acceptors + 1)]
+    learners = [Learner(i, network, 0.0, 0.0, os.path.join(directory, 'learner{0}_decided_value'.format(i)),
+                        **simulator.node_options())
+                for i in (1, 2)]
+    for i in range(1, 5):
+        simulator.add(Proposer(i, network, 0.0, 0.0, False, False, **simulator.node_options()))
+    clients = [Client(i, network, 0.0, 0.0, first_instance=(i - 1) * values + 1,
+                      values=[str(simulator.random.randint(0, 32767)) for _ in range(values)],
+                      **simulator.node_options())
+               for i in range(1, scenario.clients + 1)]
+
+    # Time of the first request and of the first decision of every instance
+    requested_at: Dict[int, float] = {}
+    decided_at: Dict[int, float] = {}
+    for client in clients:
+        def request_value(value, client=client, request_value=client.request_value):
+            request_value(value)
+            requested_at.setdefault(client._instance_id, simulator.now)
+        client.request_value = request_value
+    for learner in learners:
+        def record_decision(instance, value, record_decision=learner.record_decision):
+            record_decision(instance, value)
+            decided_at.setdefault(instance, simulator.now)
+        learner.record_decision = record_decision
+
+    deadline = simulator.now + RUN_TIMEOUT
+    started = time.perf_counter()
+    late = learners[1:] + clients[1:] if scenario.catchup else []
+    for learner in learners:
+        if learner not in late:
+            simulator.add(learner)
+    for client in clients:
+        if client not in late:
+            simulator.add(client, at=simulator.now + CLIENT_DELAY)
+    if scenario.crash_acceptor is not None:
+        simulator.run(deadline, lambda: len(decided_at) >= scenario.crash_acceptor * instances)
+        simulator.crash(acceptors[-1])
+    if late:
+        simulator.run(deadline, lambda: learners[0]._decided_values.watermark >= values)
+        for node in late:
+            simulator.add(node)
+    terminated = simulator.run(deadline, lambda: all(learner._decided_values.watermark >= instances
+                                                     for learner in learners))
+    wall_time = time.perf_counter() - started
+    simulator.shutdown()
+
+    latencies = sorted((decided_at[instance] - requested_at[instance]) * 1000.0
+                       for instance in decided_at if instance in requested_at)
+    first_request = min(requested_at.values(), default=simulator.now)
+    duration = max(decided_at.values(), default=first_request) - first_request
+    return {
+        'scenario': scenario.name,
+        'loss': scenario.loss,
+        'acceptors': scenario.acceptors,
+        'running_acceptors': running_acceptors,
+        'clients': scenario.clients,
+        'seed': seed,
+        'instances': instances,
+        'decided': len(decided_at),
+        'terminated': terminated,
+        'duration': duration,
+        'instances_per_sec': len(decided_at) / duration if duration > 0 else None,
+        'latency_ms': {
+            'p50': percentile(latencies, 0.5),
+            'p99': percentile(latencies, 0.99),
+            'p999': percentile(latencies, 0.999),
+            'max': latencies[-1] if latencies else None,
+        },
+        'messages_per_decision': simulator.transmitted / max(len(decided_at), 1),
+        'deliveries_per_decision': (simulator.sent - simulator.dropped) / max(len(decided_at), 1),
+        'wall_time': wall_time,
+    }
+
+
+def column(value: Optional[float], width: int, precision: int) -> str:
+    return '{0:{1}.{2}f}'.format(value, width, precision) if value is not None else '-'.rjust(width)
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="End-to-end throughput and latency benchmark suite")
+    parser.add_argument('--values', type=int, default=1000, help="number of values requested by each client")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--sweeps', default=','.join(SWEEPS),
+                        help="comma separated sweeps to run, out of {0}".format(', '.join(SWEEPS)))
+    parser.add_argument('--virtual', action='store_true', help="iterations of the nodes take no virtual time")
+    parser.add_argument('--output', default='bench_end_to_end.json', help="path of the JSON results")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    results = []
+    print("{0:22} {1:>5} {2:>4} {3:>4} {4:>10} {5:>12} {6:>9} {7:>9} {8:>9} {9:>10}".format(
+        "scenario", "loss", "acc", "cli", "decided", "instances/s", "p50 ms", "p99 ms", "p999 ms", "msgs/inst"))
+    with tempfile.TemporaryDirectory() as directory:
+        for sweep in args.sweeps.split(','):
+            for scenario in SWEEPS[sweep]:
+                result = run(scenario, args.values, args.seed, args.virtual, tempfile.mkdtemp(dir=directory))
+                result['sweep'] = sweep
+                results.append(result)
+                latency = result['latency_ms']
+                print("{0:22} {1:5.2f} {2:4} {3:4} {4:>10} {5} {6} {7} {8} {9:10.2f}".format(
+                    scenario.name, scenario.loss, scenario.acceptors, scenario.clients,
+                    "{0}/{1}".format(result['decided'], result['instances']),
+                    column(result['instances_per_sec'], 12, 0), column(latency['p50'], 9, 2),
+                    column(latency['p99'], 9, 2), column(latency['p999'], 9, 2), result['messages_per_decision']))
+
+    with open(args.output, 'w') as file:
+        json.dump({
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'values': args.values,
+            'seed': args.seed,
+            'virtual': args.virtual,
+            'results': results,
+        }, file, indent=2)
+    print("Results written to {0}".format(args.output))
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+
+# Compares the two decision fan-out modes as the number of acceptors and learners grows: with direct fan-out every
+# acceptor sends its Accept messages to the proposers and to the learners, which count the quorums themselves, with
+# leader fan-out the Accept messages go only to the proposers and the leader sends the decisions to the learners.
+# The nodes run in this process connected by the loopback bus of bench_stable_leader.py; the cost of a mode is the
+# number of datagrams sent and of messages received by all the nodes per instance, the latency is the number of
+# network hops until all the learners know the decision.
+#
+# Usage: ./benchmarks/bench_fanout.py [number of instances] [requests in flight] [batch size]
+
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from paxos import Proposer, Acceptor, Learner, Role
+from paxos.codec import encode
+from paxos.message import ClientPropose
+from bench_stable_leader import CLIENT, Loopback, bench_network
+
+
+def run(instances: int, window: int, batch_size: int, acceptor_count: int, learner_count: int, leader_fanout: bool,
+        directory: str):
+    network = bench_network(acceptor_count)
+    bus = Loopback()
+    proposer = Proposer(1, network, 0.0, 0.0, disable_timeout=True, leader_fanout=leader_fanout, batch_size=batch_size)
+    acceptors = [Acceptor(i, network, 0.0, 0.0, leader_fanout=leader_fanout, batch_size=batch_size)
+                 for i in range(1, acceptor_count + 1)]
+    learners = [Learner(i, network, 0.0, 0.0, decision_log_path=os.path.join(directory, 'learner{0}'.format(i)),
+                        batch_size=batch_size)
+                for i in range(1, learner_count + 1)]
+    for node in [proposer] + acceptors + learners:
+        bus.attach(node)
+        node.on_start()
+    # Let the leader complete its phase 1 before the first request
+    for _ in range(3):
+        bus.step()
+    bus.messages = bus.deliveries = 0
+
+    requested_at = {}
+    latencies = []
+    next_instance = 1
+    steps = 0
+    while len(latencies) < instances:
+        while next_instance <= instances and len(requested_at) < window:
+            bus.pending.append((encode(ClientPropose(CLIENT, Role.PROPOSER, (next_instance, next_instance))), None))
+            requested_at[next_instance] = steps
+            next_instance += 1
+
+        bus.step()
+        steps += 1
+        for instance in [instance for instance in requested_at
+                         if all(instance in learner._decided_values for learner in learners)]:
+            latencies.append(steps - requested_at.pop(instance))
+        assert steps < 100 * instances, "No progress"
+
+    for learner in learners:
+        learner.on_stop()
+    return sum(latencies) / len(latencies), bus.messages / instances, bus.deliveries / instances
+
+
+if __name__ == '__main__':
+    instances = int(sys.argv[1]) if len(sys.argv) >= 2 else 2000
+    window = int(sys.argv[2]) if len(sys.argv) >= 3 else 64
+    batch_size = int(sys.argv[3]) if len(sys.argv) >= 4 else 64
+
+    print("{0} instances, {1} requests in flight, batches of {2}".format(instances, window, batch_size))
+    print("{0:>9} {1:>8} {2:>8} {3:>14} {4:>14} {5:>16}".format("acceptors", "learners", "fan-out", "latency hops",
+                                                                 "sent/inst", "received/inst"))
+    for acceptor_count, learner_count in [(3, 1), (3, 3), (5, 3), (5, 5), (7, 7)]:
+        for name, leader_fanout in [("direct", False), ("leader", True)]:
+            with tempfile.TemporaryDirectory() as directory:
+                latency, sent, received = run(instances, window, batch_size, acceptor_count, learner_count,
+                                              leader_fanout, directory)
+            print("{0:9} {1:8} {2:>8} {3:14.2f} {4:14.2f} {5:16.2f}".format(acceptor_count, learner_count, name,
+                                                                            latency, sent, received))
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+
+# Measures the per-message cost of the message objects: building a message from a node and reading its fields, as
+# done by every send and every handler, and the whole handling of a received datagram by an acceptor (decode,
+# dispatch to the handler and reply).
+# The replies are sent to multicast groups nobody listens to, so that only the acceptor side is measured.
+#
+# Usage: ./benchmarks/bench_messages.py [number of iterations]
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from paxos import Acceptor, Network, NetworkGroup
+from paxos.codec import RemoteSender, encode, decode
+from paxos.message import Prepare, Accept
+from paxos.role import Role
+
+BENCH_NETWORK = Network(2,
+                        NetworkGroup(('239.0.0.1', 15000)),
+                        NetworkGroup(('239.0.0.1', 16000)),
+                        NetworkGroup(('239.0.0.1', 17000)),
+                        NetworkGroup(('239.0.0.1', 18000)))
+
+
+def build_and_read(node) -> None:
+    message = Accept(sender=node, receiver_role=Role.LEARNER, payload=(2, 'value', 10))
+    message.sender_id, message.sender_role, message.receiver_role, message.message_type, message.payload
+
+
+def handle_datagram(acceptor: Acceptor, datagram: memoryview) -> None:
+    acceptor.dispatch(decode(datagram))
+    acceptor.flush()
+
+
+if __name__ == '__main__':
+    iterations = int(sys.argv[1]) if len(sys.argv) >= 2 else 50000
+    acceptor = Acceptor(1, BENCH_NETWORK, 0.0, 0.0)
+
+    proposer = RemoteSender(1, Role.PROPOSER)
+    rounds = iter(range(2, 2 + iterations))
+    # Every Prepare is for a higher round, so that the acceptor always replies with a Promise
+    datagrams = [memoryview(encode(Prepare(proposer, Role.ACCEPTOR, (next(rounds), 1, False))))
+                 for _ in range(iterations)]
+    pending = iter(datagrams)
+
+    benchmarks = [
+        ("build and read message", lambda: build_and_read(acceptor)),
+        ("node id and role", lambda: (acceptor.id, acceptor.role, acceptor.net[Role.PROPOSER])),
+        ("acceptor handles Prepare", lambda: handle_datagram(acceptor, next(pending))),
+    ]
+
+    print("{0:26} {1:>12} {2:>14}".format("operation", "us/op", "ops/s"))
+    for name, function in benchmarks:
+        elapsed = timeit.timeit(function, number=iterations)
+        print("{0:26} {1:12.2f} {2:14.0f}".format(name, elapsed / iterations * 1e6, iterations / elapsed))
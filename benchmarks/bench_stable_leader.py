@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+
+# Compares the stable leader, which runs phase 1 once for all the instances, with the per-instance phase 1 path,
+# and the stable leader in thrifty mode, which sends its Propose messages to a quorum of acceptors only.
+# A proposer, the acceptors and a learner run in this process connected by a loopback bus: every message is
+# encoded and decoded as on the wire, and the bus delivers all the pending messages in steps, so the latency of an
+# instance is measured in network hops (delivery steps between the client request and the decision at the learner)
+# while the throughput measures the processing cost of the nodes. The load of an acceptor is the number of
+# instances it handles per instance decided, a batched message counting once per instance it carries.
+#
+# Usage: ./benchmarks/bench_stable_leader.py [number of instances] [requests in flight] [number of acceptors]
+#                                            [phase 2 quorum size, a majority by default]
+
+import os
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from paxos import Proposer, Acceptor, Learner, Network, NetworkGroup, Role
+from paxos.codec import RemoteSender, encode, decode
+from paxos.message import ClientPropose
+
+
+def bench_network(acceptors: int, phase2_quorum: int = None) -> Network:
+    # The phase 1 quorum is the smallest one intersecting the phase 2 quorums
+    majority = acceptors // 2 + 1
+    phase2_quorum = phase2_quorum if phase2_quorum is not None else majority
+    return Network(majority,
+                   NetworkGroup(('239.0.0.1', 15000)),
+                   NetworkGroup(('239.0.0.1', 16000)),
+                   NetworkGroup(('239.0.0.1', 17000)),
+                   NetworkGroup(('239.0.0.1', 18000)),
+                   acceptor_count=acceptors,
+                   phase1_quorum=acceptors - phase2_quorum + 1,
+                   phase2_quorum=phase2_quorum)
+
+
+CLIENT = RemoteSender(1, Role.CLIENT)
+
+
+class Loopback:
+    """
+    In-memory network replacing the sockets of the nodes attached to it
+    """
+
+    def __init__(self) -> None:
+        self.pending = []
+        self.nodes = defaultdict(list)
+        self.messages = 0
+        self.acceptor_entries = 0
+        # Messages received by the nodes, a multicast message counting once per receiver
+        self.deliveries = 0
+
+    def attach(self, node) -> None:
+        node.send = lambda message, addresses=None: self.pending.append((encode(message), addresses))
+        self.nodes[node.role].append(node)
+
+    def step(self) -> None:
+        """
+        Delivers all the pending messages, then lets every node flush its batches as at the end of a loop iteration
+        """
+        pending, self.pending = self.pending, []
+        self.messages += len(pending)
+        for datagram, addresses in pending:
+            message = decode(memoryview(datagram))
+            for node in self.nodes[message.receiver_role]:
+                # Messages sent to single acceptors are delivered only to them
+                if addresses is None or node.net.acceptor_address(node.id) in addresses:
+                    node.dispatch(message)
+                    self.deliveries += 1
+                    if node.role is Role.ACCEPTOR:
+                        self.acceptor_entries += len(message.payload) if isinstance(message.payload, list) else 1
+        for nodes in self.nodes.values():
+            for node in nodes:
+                node.update_clock()
+                node.flush()
+
+
+def run(instances: int, window: int, acceptor_count: int, phase2_quorum: int, stable_leader: bool, thrifty: bool,
+        decision_log: str):
+    network = bench_network(acceptor_count, phase2_quorum)
+    bus = Loopback()
+    proposer = Proposer(1, network, 0.0, 0.0, disable_timeout=True, disable_pre_execution=not stable_leader,
+                        thrifty=thrifty)
+    acceptors = [Acceptor(i, network, 0.0, 0.0) for i in range(1, acceptor_count + 1)]
+    learner = Learner(1, network, 0.0, 0.0, decision_log_path=decision_log)
+    for node in [proposer, learner] + acceptors:
+        bus.attach(node)
+        node.on_start()
+
+    requested_at = {}
+    latencies = []
+    next_instance = 1
+    steps = 0
+    start = time.perf_counter()
+    while len(latencies) < instances:
+        # Keep the window of requests in flight full
+        while next_instance <= instances and len(requested_at) < window:
+            bus.pending.append((encode(ClientPropose(CLIENT, Role.PROPOSER, (next_instance, next_instance))), None))
+            requested_at[next_instance] = steps
+            next_instance += 1
+
+        bus.step()
+        steps += 1
+        for instance in [instance for instance in requested_at if instance in learner._decided_values]:
+            latencies.append(steps - requested_at.pop(instance))
+        assert steps < 100 * instances, "No progress"
+    elapsed = time.perf_counter() - start
+
+    learner.on_stop()
+    return (instances / elapsed, sum(latencies) / len(latencies), bus.messages / instances,
+            bus.acceptor_entries / acceptor_count / instances)
+
+
+if __name__ == '__main__':
+    instances = int(sys.argv[1]) if len(sys.argv) >= 2 else 5000
+    window = int(sys.argv[2]) if len(sys.argv) >= 3 else 64
+    acceptor_count = int(sys.argv[3]) if len(sys.argv) >= 4 else 3
+    phase2_quorum = int(sys.argv[4]) if len(sys.argv) >= 5 else None
+
+    with tempfile.TemporaryDirectory() as directory:
+        network = bench_network(acceptor_count, phase2_quorum)
+        print("{0} instances, {1} requests in flight, {2} acceptors, quorums of {3} (phase 1) and {4} (phase 2)"
+              .format(instances, window, acceptor_count, network.phase1_quorum_size, network.phase2_quorum_size))
+        print("{0:22} {1:>14} {2:>14} {3:>16} {4:>14}".format("mode", "instances/s", "latency hops", "messages/inst",
+                                                              "acceptor load"))
+        for name, stable_leader, thrifty in [("per-instance phase 1", False, False), ("stable leader", True, False),
+                                             ("stable leader thrifty", True, True)]:
+            throughput, latency, messages, acceptor_load = run(instances, window, acceptor_count, phase2_quorum,
+                                                               stable_leader, thrifty,
+                                                               os.path.join(directory, name.replace(' ', '_')))
+            print("{0:22} {1:14.0f} {2:14.2f} {3:16.2f} {4:14.2f}".format(name, throughput, latency, messages,
+                                                                          acceptor_load))
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+# Measures the throughput of an acceptor handling Propose messages without write-ahead log, with a write-ahead log
+# synced once per loop iteration (group commit) and with a write-ahead log synced after every accepted value.
+# The replies are sent to multicast groups nobody listens to, so that only the acceptor side is measured.
+#
+# Usage: ./benchmarks/bench_wal.py [number of instances] [messages handled per loop iteration]
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from paxos import Acceptor, Network, NetworkGroup
+from paxos.codec import RemoteSender
+from paxos.message import PrepareRange, Propose
+from paxos.role import Role
+
+BENCH_NETWORK = Network(2,
+                        NetworkGroup(('239.0.0.1', 15000)),
+                        NetworkGroup(('239.0.0.1', 16000)),
+                        NetworkGroup(('239.0.0.1', 17000)),
+                        NetworkGroup(('239.0.0.1', 18000)))
+
+
+def run(acceptor: Acceptor, instances: int, per_iteration: int) -> float:
+    proposer = RemoteSender(1, Role.PROPOSER)
+    # The promise of a leader round for all the instances lets every Propose start its instance directly from phase 2
+    acceptor.dispatch(PrepareRange(proposer, Role.ACCEPTOR, (2, 1)))
+    acceptor.flush()
+
+    start = time.perf_counter()
+    for instance in range(1, instances + 1):
+        acceptor.dispatch(Propose(proposer, Role.ACCEPTOR, (2, 'value{0}'.format(instance), instance)))
+        if instance % per_iteration == 0:
+            acceptor.flush()
+    acceptor.flush()
+    assert acceptor.metrics.counters['accepted'] == instances, "Every Propose should be accepted"
+    return instances / (time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    instances = int(sys.argv[1]) if len(sys.argv) >= 2 else 5000
+    per_iteration = int(sys.argv[2]) if len(sys.argv) >= 3 else 64
+
+    with tempfile.TemporaryDirectory() as directory:
+        configurations = [
+            ("in memory", {}),
+            ("WAL, group commit", {'wal': os.path.join(directory, 'group'), 'group_commit': True}),
+            ("WAL, sync per message", {'wal': os.path.join(directory, 'single'), 'group_commit': False}),
+        ]
+
+        print("{0} instances, {1} messages per loop iteration".format(instances, per_iteration))
+        print("{0:24} {1:>12} {2:>10}".format("configuration", "accepts/s", "slowdown"))
+        baseline = None
+        for name, options in configurations:
+            acceptor = Acceptor(1, BENCH_NETWORK, 0.0, 0.0, **options)
+            throughput = run(acceptor, instances, per_iteration)
+            baseline = baseline or throughput
+            print("{0:24} {1:12.0f} {2:9.1f}x".format(name, throughput, baseline / throughput))
@@ -1,11 +1,11 @@
 #!/usr/bin/env python3
 
 import sys
-import pickle
 from typing import List, Dict
 from os import  path
 
 from utils import ColoredString
+from paxos.storage import DecisionLog
 
 def load_proposed_values(n_clients: int) -> List[List[int]]:
     proposed_values: List[List[int]] = [[] for i in range(n_clients)]
@@ -30,8 +30,10 @@ def load_decided_values(n_learners: int, max_instance: int) -> List[Dict[int,int
             print("File {0} not found! Exiting".format('results/learner{0}_decided_value'.format(i)))
             return None
 
-        with open('results/learner{0}_decided_value'.format(i), "rb") as file:
-            decided_values.append(pickle.load(file=file))
+        # Stream the records of the append-only decision log of the learner
+        decided_values.append({})
+        for instance, value in DecisionLog.read_decisions('results/learner{0}_decided_value'.format(i)):
+            decided_values[i-1][instance] = value
 
         for instance in range(1, max_instance+1):
             if instance not in decided_values[i-1]:
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+
+# Launches a local Multi-Paxos execution without fixed delays: every node is started from main.py as a subprocess
+# and reports its status to the control channel of the launcher (a UDP socket on localhost). Each role is started
+# once the previous ones are ready, the clients once a leader completed its phase 1, and the run ends as soon as all
+# the learners decided every requested instance, or when the timeout expires.
+#
+# Usage: ./launcher.py <number of values per client> [options], see ./launcher.py --help
+#
+# For example the following runs 1000 values per client with 10% loss, then checks the results:
+#
+#     ./launcher.py 1000 --plr=0.1 --check
+
+import argparse
+import json
+import os
+import random
+import select
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import time
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from paxos.shard import shard_of
+
+CONFIG_PATH = './paxos/paxos.conf'
+RESULT_DIR = './results'
+# Roles of the nodes, in the order they are started
+ROLES = ['acceptor', 'learner', 'proposer', 'client']
+
+# Key of a node: (role, ID, shard)
+NodeKey = Tuple[str, int, int]
+
+
+class Cluster:
+    """
+    Nodes of a local execution and the status they reported to the control channel
+    """
+    # Time (in sec) a node has to exit once terminated, then it is killed
+    STOP_TIMEOUT = 5.0
+
+    def __init__(self, args: argparse.Namespace) -> None:
+        self.args = args
+        self.processes: Dict[NodeKey, subprocess.Popen] = {}
+
+        self.control = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.control.bind(('127.0.0.1', 0))
+        self.control_address = '127.0.0.1:{0}'.format(self.control.getsockname()[1])
+
+        self.ready: Set[NodeKey] = set()
+        self.stopped: Set[NodeKey] = set()
+        # Shards with a leader proposer ready to propose
+        self.leaders: Set[int] = set()
+        # Watermark reported by every learner: all the instances up to it are decided
+        self.watermarks: Dict[NodeKey, int] = {}
+        self.client_reports: Dict[NodeKey, dict] = {}
+
+    # ---- Nodes ---- #
+
+    def start(self, role: str, node_id: int, shard: int, positional: List[str] = (), stdin_path: str = None) -> None:
+        args = self.args
+        command = [sys.executable, '-u', './main.py', role, str(node_id), CONFIG_PATH, str(args.quorum_size),
+                   str(args.plr), '0'] + list(positional) + ['--control=' + self.control_address] + args.option + \
+            getattr(args, role + '_option')
+        if args.shards > 1:
+            command += ['--shards={0}'.format(args.shards), '--shard={0}'.format(shard)]
+
+        log_name = '{0}{1}.log'.format(role, node_id) if args.shards == 1 else \
+            '{0}{1}_shard{2}.log'.format(role, node_id, shard)
+        with open(os.path.join(RESULT_DIR, 'logs', log_name), 'w') as log:
+            stdin = open(stdin_path) if stdin_path is not None else subprocess.DEVNULL
+            self.processes[(role, node_id, shard)] = subprocess.Popen(command, stdin=stdin, stdout=log,
+                                                                      stderr=subprocess.STDOUT)
+            if stdin_path is not None:
+                stdin.close()
+
+    def start_role(self, role: str, count: int, positional: List[str] = (),
+                   stdin_path: Callable[[int], Optional[str]] = lambda node_id: None) -> List[NodeKey]:
+        keys = []
+        for shard in range(self.args.shards):
+            for node_id in range(1, count + 1):
+                self.start(role, node_id, shard, positional if node_id == 1 else (), stdin_path(node_id))
+                keys.append((role, node_id, shard))
+        return keys
+
+    def stop(self) -> None:
+        """
+        Terminates all the nodes, which stop as if their lifetime was over, and waits for them to exit
+        """
+        for process in self.processes.values():
+            if process.poll() is None:
+                process.send_signal(signal.SIGTERM)
+        deadline = time.monotonic() + Cluster.STOP_TIMEOUT
+        for key, process in self.processes.items():
+            try:
+                process.wait(max(deadline - time.monotonic(), 0.0))
+            except subprocess.TimeoutExpired:
+                print("{0} {1} of shard {2} did not stop, killing it".format(*key))
+                process.kill()
+                process.wait()
+        self.control.close()
+
+    # ---- Control channel ---- #
+
+    def poll(self, timeout: float) -> None:
+        """
+        Handles the status reported by the nodes in the next timeout seconds
+        """
+        readable, _, _ = select.select([self.control], [], [], max(timeout, 0.0))
+        while readable:
+            status = json.loads(self.control.recv(65536).decode('utf-8'))
+            key = (status['role'], status['id'], status['shard'])
+            event = status['event']
+            if event == 'ready':
+                self.ready.add(key)
+            elif event == 'stopped':
+                self.stopped.add(key)
+            elif event == 'leader':
+                self.leaders.add(key[2])
+            elif event == 'progress':
+                self.watermarks[key] = status['watermark']
+            elif event == 'done':
+                self.client_reports[key] = status
+            readable, _, _ = select.select([self.control], [], [], 0.0)
+
+    def wait_for(self, condition: Callable[[], bool], timeout: float, what: str) -> bool:
+        deadline = time.monotonic() + timeout
+        while not condition():
+            now = time.monotonic()
+            if now >= deadline:
+                print("Timed out waiting for {0}".format(what))
+                return False
+            exited = [key for key, process in self.processes.items() if process.poll() is not None]
+            if exited:
+                print("{0} {1} of shard {2} exited with code {3}".format(*exited[0],
+                                                                         self.processes[exited[0]].returncode))
+                return False
+            self.poll(min(deadline - now, 0.1))
+        return True
+
+    def all_ready(self, keys: List[NodeKey]) -> Callable[[], bool]:
+        return lambda: all(key in self.ready for key in keys)
+
+    def all_decided(self, learners: List[NodeKey]) -> Callable[[], bool]:
+        args = self.args
+        # The clients request a value for each of the same instances, and a client of a shard only the ones of its
+        # shard
+        expected = [sum(1 for instance in range(1, args.values + 1) if shard_of(instance, args.shards) == shard)
+                    for shard in range(args.shards)]
+        return lambda: all(self.watermarks.get(key, 0) >= expected[key[2]] for key in learners)
+
+
+def generate_values(count: int, path: str) -> None:
+    # Same values as generate.sh
+    with open(path, 'w') as file:
+        for _ in range(count):
+            file.write('{0}\n'.format(random.randint(0, 32767)))
+
+
+def run(args: argparse.Namespace) -> bool:
+    if os.path.isdir(RESULT_DIR):
+        shutil.rmtree(RESULT_DIR)
+    os.makedirs(os.path.join(RESULT_DIR, 'logs'))
+    random.seed(args.seed)
+    for client in range(1, args.clients + 1):
+        generate_values(args.values, os.path.join(RESULT_DIR, 'propose{0}.txt'.format(client)))
+
+    cluster = Cluster(args)
+    start = time.monotonic()
+    decided = False
+    try:
+        acceptors = cluster.start_role('acceptor', args.acceptors)
+        learners = cluster.start_role('learner', args.learners)
+        if not cluster.wait_for(cluster.all_ready(acceptors + learners), args.ready_timeout,
+                                "the acceptors and learners"):
+            return False
+
+        proposers = cluster.start_role('proposer', args.proposers,
+                                       positional=[str(int(args.no_timeouts)), str(int(args.no_preexecution))])
+        if not cluster.wait_for(lambda: cluster.all_ready(proposers)() and len(cluster.leaders) == args.shards,
+                                args.ready_timeout, "the leader proposers"):
+            return False
+        ready_time = time.monotonic()
+        print("Cluster ready in {0:.2f} sec".format(ready_time - start))
+
+        cluster.start_role('client', args.clients,
+                           stdin_path=lambda node_id: os.path.join(RESULT_DIR, 'propose{0}.txt'.format(node_id)))
+        decided = cluster.wait_for(cluster.all_decided(learners), args.timeout, "the learners to decide")
+        if decided:
+            print("All the learners decided {0} instances in {1:.2f} sec".format(args.values,
+                                                                                time.monotonic() - ready_time))
+    finally:
+        cluster.stop()
+
+    for key, report in sorted(cluster.client_reports.items()):
+        print("Client {1} of shard {2}: {3} requests acknowledged in {4:.3f} sec".format(*key, report['acked'],
+                                                                                       report['elapsed']))
+    print("Total time {0:.2f} sec".format(time.monotonic() - start))
+
+    if args.shards > 1:
+        import merge_shards
+        for learner in range(1, args.learners + 1):
+            merge_shards.merge_learner(learner, args.shards)
+    if args.check:
+        subprocess.call([sys.executable, './check_results.py', str(args.learners), str(args.clients)])
+    return decided
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run a local Multi-Paxos execution")
+    parser.add_argument('values', type=int, help="number of values requested by each client")
+    parser.add_argument('--plr', type=float, default=0.0, help="package loss ratio of all the nodes")
+    parser.add_argument('--acceptors', type=int, default=3)
+    parser.add_argument('--learners', type=int, default=2)
+    parser.add_argument('--proposers', type=int, default=4)
+    parser.add_argument('--clients', type=int, default=2)
+    parser.add_argument('--quorum-size', type=int, default=2)
+    parser.add_argument('--shards', type=int, default=1)
+    parser.add_argument('--no-timeouts', action='store_true', help="disable the round timeouts of proposer 1")
+    parser.add_argument('--no-preexecution', action='store_true',
+                        help="disable the phase 1 pre-execution (stable leader) of proposer 1")
+    parser.add_argument('--option', action='append', default=[], metavar='--NAME=VALUE',
+                        help="option passed to every node, e.g. --option=--batch-size=16, only for the options "
+                             "supported by all the roles")
+    for role in ROLES:
+        parser.add_argument('--{0}-option'.format(role), action='append', default=[], metavar='--NAME=VALUE',
+                            help="option passed to the {0}s only".format(role))
+    parser.add_argument('--timeout', type=float, default=60.0,
+                        help="maximum time (in sec) the learners have to decide all the values")
+    parser.add_argument('--ready-timeout', type=float, default=10.0,
+                        help="maximum time (in sec) the nodes have to get ready")
+    parser.add_argument('--seed', type=int, default=None, help="seed of the generated values")
+    parser.add_argument('--check', action='store_true', help="run check_results.py at the end")
+
+    sys.exit(0 if run(parser.parse_args()) else 1)
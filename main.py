@@ -2,46 +2,120 @@
 
 # ---- IMPORTS ---- #
 from paxos import Role, Network, NetworkGroup, Client, Proposer, Acceptor, Learner, Node
+from paxos.profiling import PROFILER_MODES, Profiler
+from paxos.shard import check_addresses, shard_group
+import signal
 import sys
 import os
 
 # ---- OBTAINING PARAMETERS ---- #
 #print('Obtaining parameters')
 
-assert len(sys.argv) >= 5, \
+# Optional settings can be given anywhere after the role in the form --name=value; for each known option the
+# type used to parse its value and the roles accepting it are defined
+ALL_ROLES = ['client', 'proposer', 'acceptor', 'learner']
+NODE_OPTIONS = {
+    # Maximum number of instances carried by a batched Prepare/Promise/Propose/Accept
+    'batch-size': (int, ALL_ROLES),
+    # Maximum time (in sec) a batch waits to be filled, 0 flushes it at every loop iteration
+    'batch-delay': (float, ALL_ROLES),
+    # Maximum number of requests waiting for an ACK at the same time
+    'window': (int, ['client']),
+    # Path of the write-ahead log making the state of the acceptor durable, none by default
+    'wal': (str, ['acceptor']),
+    # Whether the write-ahead log is synced once per loop iteration (1, default) or after every change (0)
+    'group-commit': (lambda value: bool(int(value)), ['acceptor']),
+    # Address (host:port) of the control channel of the launcher the node reports its status to
+    'control': (str, ALL_ROLES),
+    # Directory the node writes snapshots of its metrics to, none by default
+    'metrics': (str, ALL_ROLES),
+    # Directory the node writes the trace of the instances it handles to, none by default
+    'trace': (str, ALL_ROLES),
+    # Send the Propose messages of the leader to a quorum of acceptors only, 0 or 1
+    'thrifty': (lambda value: bool(int(value)), ['proposer']),
+    # Send the Accept messages only to the proposers, the leader relaying the decisions to the learners, 0 or 1;
+    # to be set on all the proposers and acceptors
+    'leader-fanout': (lambda value: bool(int(value)), ['proposer', 'acceptor']),
+}
+
+# Settings of the network, which must be the same for all the nodes
+NETWORK_OPTIONS = {
+    # Number of acceptors, 2 * quorum size - 1 by default
+    'acceptor-count': int,
+    # Number of promises completing phase 1 and of accepts deciding a value, the quorum size by default; the sum of the
+    # two must be greater than the number of acceptors
+    'phase1-quorum': int,
+    'phase2-quorum': int,
+    # Sharded deployment: number of independent Paxos groups and group of the node, from 0
+    'shards': int,
+    'shard': int,
+}
+
+# Settings of the profiler of the node, see paxos/profiling.py
+PROFILE_OPTIONS = {
+    # Profiler started with the node, cprofile or sample; without it SIGUSR1 starts and stops the cprofile one
+    'profile': str,
+    # Directory the profiles are written to, results/profile by default
+    'profile-dir': str,
+    # CPU time (in sec) between two samples of the sampling profiler
+    'profile-interval': float,
+}
+
+node_options = {}
+network_options = {}
+profile_options = {}
+argv = []
+for arg in sys.argv:
+    if arg.startswith('--') and '=' in arg:
+        name, value = arg[2:].split('=', 1)
+        if name in NETWORK_OPTIONS:
+            network_options[name.replace('-', '_')] = NETWORK_OPTIONS[name](value)
+            continue
+        if name in PROFILE_OPTIONS:
+            profile_options[name.replace('-', '_')] = PROFILE_OPTIONS[name](value)
+            continue
+        assert name in NODE_OPTIONS, 'Unknown option --{0}, expected one of {1}'.format(
+            name, list(NODE_OPTIONS) + list(NETWORK_OPTIONS) + list(PROFILE_OPTIONS))
+        assert argv[1:2] and argv[1] in NODE_OPTIONS[name][1], \
+            'Option --{0} is only supported by {1}'.format(name, NODE_OPTIONS[name][1])
+        node_options[name.replace('-', '_')] = NODE_OPTIONS[name][0](value)
+    else:
+        argv.append(arg)
+
+assert len(argv) >= 5, \
     'There must be at least 5 program arguments (including the program name)'
 (self_role,
  self_id,
  config_path,
- quorum_size) = (sys.argv[1],
-                  int(sys.argv[2]),
-                  sys.argv[3],
-                  int(sys.argv[4]))
+ quorum_size) = (argv[1],
+                  int(argv[2]),
+                  argv[3],
+                  int(argv[4]))
 
-if len(sys.argv) >= 6:
-    plr = float(sys.argv[5])
+if len(argv) >= 6:
+    plr = float(argv[5])
 else:
     plr = 0.0
 
-if len(sys.argv) >= 7:
-    lifetime = float(sys.argv[6])
+if len(argv) >= 7:
+    lifetime = float(argv[6])
 else:
     lifetime = 0.0
 
 if self_role == "proposer":
-    if len(sys.argv) >= 8:
-        disable_timeouts = bool(int(sys.argv[7]))
+    if len(argv) >= 8:
+        disable_timeouts = bool(int(argv[7]))
     else:
         disable_timeouts = False
 
-    if len(sys.argv) >= 9:
-        disable_preexecution = bool(int(sys.argv[8]))
+    if len(argv) >= 9:
+        disable_preexecution = bool(int(argv[8]))
     else:
         disable_preexecution = False
 
 if self_role == "client":
-    if len(sys.argv) >= 8:
-        first_instance = int(sys.argv[7])
+    if len(argv) >= 8:
+        first_instance = int(argv[7])
     else:
         first_instance = 1
 
@@ -57,6 +131,9 @@ assert os.path.isfile(config_path), \
 assert quorum_size > 0, \
     'Argument at index 4 must define the size of the quorum of acceptors in the network, and must be bigger than 0'
 
+assert profile_options.get('profile', 'cprofile') in PROFILER_MODES, \
+    'Option --profile must be one of {0}'.format(PROFILER_MODES)
+
 """
 print(f'''
 Current paxos state: 
@@ -71,18 +148,36 @@ print('Performing network setup')
 """
 
 network: Network = None
+shard = network_options.get('shard', 0)
 with open(config_path) as file:
+    # Lines with a fourth column give the address of a group of that shard, the groups of a shard without their own
+    # line are derived from the default ones
     groups = {}
+    shard_groups = {}
     for line in file:
-        if line == '':
+        if line.strip() == '':
+            continue
+        group, addr, port, *columns = line.split()
+        if columns and int(columns[0]) != 0:
+            shard_groups.setdefault(int(columns[0]), {})[group] = NetworkGroup((addr, int(port)))
             continue
-        group, addr, port, *_ = line.split()
         groups[group] = NetworkGroup((addr, int(port)))
-    network = Network(quorum_size,
-                      groups['clients'],
-                      groups['proposers'],
-                      groups['acceptors'],
-                      groups['learners'])
+
+    # The networks of all the shards are built to check that none of their addresses overlap
+    networks = []
+    for other_shard in range(network_options.get('shards', 1)):
+        own_groups = shard_groups.get(other_shard, {})
+        other_groups = {group: own_groups.get(group, shard_group(address, other_shard))
+                        for group, address in groups.items()}
+        networks.append(Network(quorum_size,
+                                other_groups['clients'],
+                                other_groups['proposers'],
+                                other_groups['acceptors'],
+                                other_groups['learners'],
+                                **dict(network_options, shard=other_shard)))
+    assert 0 <= shard < len(networks), "Shard should be between 0 and {0}".format(len(networks) - 1)
+    check_addresses(networks)
+    network = networks[shard]
 
 assert network is not None, 'Failed to parse network config file'
 
@@ -106,11 +201,46 @@ Current network state:
 """
 
 # ---- SETTING UP INSTANCE ---- #
-paxos_node: Node = (Client(self_id, network, plr, lifetime, first_instance) if self_role == 'client'
-                    else Proposer(self_id, network, plr, lifetime, disable_timeouts, disable_preexecution) if self_role == 'proposer'
-                    else Acceptor(self_id, network, plr, lifetime) if self_role == 'acceptor'
-                    else Learner(self_id, network, plr, lifetime)
+paxos_node: Node = (Client(self_id, network, plr, lifetime, first_instance, **node_options) if self_role == 'client'
+                    else Proposer(self_id, network, plr, lifetime, disable_timeouts, disable_preexecution, **node_options) if self_role == 'proposer'
+                    else Acceptor(self_id, network, plr, lifetime, **node_options) if self_role == 'acceptor'
+                    else Learner(self_id, network, plr, lifetime, **node_options)
                     )
 
+# ---- PROFILING ---- #
+# The profiler runs together with the timing of the message handlers, and writes its results whenever it is stopped
+profiler = Profiler(profile_options.get('profile', 'cprofile'),
+                    os.path.join(profile_options.get('profile_dir', 'results/profile'), paxos_node.file_name),
+                    profile_options.get('profile_interval', Profiler.SAMPLE_INTERVAL))
+
+
+def start_profiling() -> None:
+    paxos_node.time_handlers(True)
+    profiler.start()
+
+
+def stop_profiling() -> None:
+    profiler.stop()
+    paxos_node.time_handlers(False)
+    profiler.dump(paxos_node.handler_timings)
+
+
+def toggle_profiling(signum, frame) -> None:
+    if profiler.running:
+        stop_profiling()
+    else:
+        start_profiling()
+
+
+signal.signal(signal.SIGUSR1, toggle_profiling)
+if 'profile' in profile_options:
+    start_profiling()
+
 # ---- RUNNING THE INSTANCE ---- #
+# Terminating the process interrupts the node, which stops as if its lifetime was over
+signal.signal(signal.SIGTERM, signal.default_int_handler)
 paxos_node.run()
+
+# The profile covers the whole lifetime of the node, if profiled until its end
+if profiler.running:
+    stop_profiling()
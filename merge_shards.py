@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+
+# Merges the decision logs written by the learners of a sharded deployment into the globally ordered decision log of
+# each learner ID, results/learner<ID>_decided_value, which can then be checked with check_results.py.
+
+import os
+import sys
+from typing import List
+
+from paxos.shard import merge_decisions
+from paxos.storage import DecisionLog
+
+
+def merge_learner(learner: int, shards: int) -> None:
+    shard_logs: List[str] = ['results/shard{0}/learner{1}_decided_value'.format(shard, learner)
+                             for shard in range(shards)]
+    shard_decisions = []
+    for path in shard_logs:
+        if not os.path.exists(path):
+            print("File {0} not found, no value decided in its shard".format(path))
+            shard_decisions.append([])
+        else:
+            shard_decisions.append(DecisionLog.read_decisions(path))
+
+    merged_path = 'results/learner{0}_decided_value'.format(learner)
+    for path in (merged_path, merged_path + '.idx'):
+        if os.path.exists(path):
+            os.remove(path)
+
+    merged_log = DecisionLog(merged_path)
+    decided = 0
+    prefix = 0
+    for instance, value in merge_decisions(shard_decisions):
+        merged_log.append_decision(instance, value)
+        decided += 1
+        if instance == prefix + 1:
+            prefix = instance
+    merged_log.close()
+    print("Learner {0}: {1} decided instances, decided up to instance {2} without gaps".format(learner, decided, prefix))
+
+
+if __name__ == '__main__':
+    assert len(sys.argv) >= 3, 'Usage: n_shards n_learners'
+
+    n_shards: int = int(sys.argv[1])
+    n_learners: int = int(sys.argv[2])
+    for learner in range(1, n_learners + 1):
+        merge_learner(learner, n_shards)
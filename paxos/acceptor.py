@@ -1,123 +1,326 @@
-from typing import NoReturn, Dict, List
+from typing import Iterable, List, Optional, Tuple
 import time
 
 from .role import Role
-from .network import Network
-from .node import NodeID, Node, MessageT
+from .network import Network, NetworkGroup
+from .node import NodeID, Node
 from .message_type import MessageType
 from .message import RoundID, PaxosValue, InstanceID
 from .message import PreparePayload, Prepare, PromisePayload, Promise, ProposePayload, Propose, AcceptPayload, Accept, Message
+from .message import PrepareBatch, PromiseBatch, ProposeBatch, AcceptBatch, PrepareRange, PromiseRange, AcceptedEntry
+from .message import LeaseRequest, LeaseGrant, LeaseGrantPayload
+from .ballot import ballot_proposer
+from .lease import LEASE_DURATION
+from .instance_table import InstanceRecord, InstanceTable
+from .storage import AcceptorLog
+from .tracing import TraceEvent
 
 
 class Acceptor(Node):
-    def __init__(self, id: NodeID, network: Network, plr: float, lifetime: float) -> None:
-        super().__init__(id, Role.ACCEPTOR, network, plr, lifetime)
-        self._started_instances: List[InstanceID] = []
-        # Latest round the acceptor has participated in for each instance
-        self._latest_round_ID: Dict[InstanceID, RoundID] = {}
-        # Accepted value, if any, for each started instance
-        self._accepted_value: Dict[InstanceID, PaxosValue] = {}
-        # Round in which the accepted value was accepted for each started instance
-        self._accepted_round_ID: Dict[InstanceID, RoundID] = {}
+    # Maximum number of accepted values reported by a single PromiseRange message
+    PROMISE_RANGE_MAX_ENTRIES = 128
+    # Records the write-ahead log may hold beyond two per instance not truncated before it is compacted
+    WAL_COMPACTION_RECORDS = 100000
 
-        self._preprepared_promise = False
-        self._preprepared_promise_round: RoundID = None
+    def __init__(self, id: NodeID, network: Network, plr: float, lifetime: float, wal: str = None,
+                 group_commit: bool = True, leader_fanout: bool = False, **node_options) -> None:
+        super().__init__(id, Role.ACCEPTOR, network, plr, lifetime, **node_options)
+        # A leader in thrifty mode sends its Propose messages only to some of the acceptors
+        self.join(network.acceptor_address(id))
+        # Promised round, accepted round and accepted value of each started instance
+        self._instances = InstanceTable()
 
+        # Round promised to a stable leader for all the instances starting from the first one of the range, None if
+        # no range was ever promised
+        self._range_round: RoundID = RoundID(0)
+        self._range_first: Optional[InstanceID] = None
+
+        # Proposer holding the leader lease granted by this acceptor, if any, and when the lease expires
+        self._lease_holder: Optional[NodeID] = None
+        self._lease_expiry: float = 0.0
+
+        # With a write-ahead log every change of the state is logged before replying: the replies are held back until
+        # the log is synced, once per loop iteration with group commit or after every change without it
+        self._wal: Optional[AcceptorLog] = None
+        self._group_commit = group_commit
+        self._held_replies: List[Tuple[Message, Optional[Iterable[NetworkGroup]]]] = []
+        if wal is not None:
+            self._wal = AcceptorLog(wal)
+            replayed = self.replay_wal()
+            if replayed:
+                self.log_warning("Recovered the state of {0} instances from {1} log records"
+                                 .format(len(self._instances), replayed))
+                # Leases are not logged: a lease granted before the restart may still be valid, so no Prepare is
+                # promised until it would have expired
+                self._lease_holder = NodeID(0)
+                self._lease_expiry = self.now + LEASE_DURATION
+
+        # With leader fan-out the Accept messages go only to the proposers, the leader relays the decisions to the
+        # learners
+        self._leader_fanout = leader_fanout
+
+        # Replies to all the instances handled in a loop iteration are sent together
+        self._promise_batcher = self.batcher(Promise, PromiseBatch, Role.PROPOSER)
+        self._accept_proposers_batcher = self.batcher(Accept, AcceptBatch, Role.PROPOSER)
+        self._accept_learners_batcher = self.batcher(Accept, AcceptBatch, Role.LEARNER)
+
+        # Time taken to make the logged changes durable
+        self._wal_sync_latency = self.metrics.histogram('wal_sync_latency')
+        self.metrics.gauge('instances', lambda: len(self._instances))
+        self.metrics.gauge('low_water_mark', lambda: self._instances.low_water_mark)
+        self.metrics.gauge('range_round', lambda: self._range_round)
 
         # Dictionary containing the callbacks to be executed for each type of message received
         self._message_callbacks = {
-            MessageType.PREPARE: self.promise_parallel,
-            MessageType.PROPOSE: self.accept_parallel
+            MessageType.PREPARE: self.prepare_callback,
+            MessageType.PREPARE_BATCH: self.prepare_batch_callback,
+            MessageType.PROPOSE: self.propose_callback,
+            MessageType.PROPOSE_BATCH: self.propose_batch_callback,
+            MessageType.PREPARE_RANGE: self.prepare_range_callback,
+            MessageType.LEASE_REQUEST: self.lease_request_callback
         }
 
+    def prepare_callback(self, prepare_message: Prepare) -> None:
+        self.promise_parallel(prepare_message.payload)
+
+    def prepare_batch_callback(self, prepare_batch: PrepareBatch) -> None:
+        for payload in prepare_batch.payload:
+            self.promise_parallel(payload)
+
+    def propose_callback(self, propose_message: Propose) -> None:
+        self.accept_parallel(propose_message.payload)
+
+    def propose_batch_callback(self, propose_batch: ProposeBatch) -> None:
+        for payload in propose_batch.payload:
+            self.accept_parallel(payload)
+
+    def prepare_range_callback(self, prepare_range: PrepareRange) -> None:
+        round_id: RoundID = prepare_range.payload[0]
+        first: InstanceID = prepare_range.payload[1]
+
+        # A retransmitted Prepare of the promised round is answered again
+        if round_id < self._range_round or self.lease_blocks(round_id):
+            return
+        records = list(self._instances.items_from(first))
+        if any(record.promised_round > round_id for _, record in records):
+            return
+
+        if round_id != self._range_round or self._range_first is None or first < self._range_first:
+            self._range_round = round_id
+            # Instances before the new range stay covered by the previous promise
+            self._range_first = first if self._range_first is None else min(first, self._range_first)
+            if self._wal is not None:
+                self._wal.log_promise_range(self._range_first, round_id)
+                self.wal_appended()
+
+        accepted: List[AcceptedEntry] = [AcceptedEntry((instance, record.accepted_round, record.accepted_value))
+                                         for instance, record in records if record.accepted_round > 0]
+        max_entries = Acceptor.PROMISE_RANGE_MAX_ENTRIES
+        chunks = max(-(-len(accepted) // max_entries), 1)
+        for index in range(chunks):
+            chunk = accepted[index * max_entries:(index + 1) * max_entries]
+            self.send(PromiseRange(sender=self,
+                                   receiver_role=Role.PROPOSER,
+                                   payload=(round_id, first, index, chunks, chunk)))
+        self.log_debug("Sending Promise for round {0} and all instances from {1}, reporting {2} accepted values"
+                       .format(round_id, first, len(accepted)))
+
+    def promised_round(self, instance: InstanceID, record: InstanceRecord) -> RoundID:
+        """
+        Highest round promised for an instance, either by itself or as part of the range of a stable leader
+        """
+        if self._range_first is None or instance < self._range_first:
+            return record.promised_round
+        return max(record.promised_round, self._range_round)
 
-    def promise_parallel(self, prepare_message: Prepare):
-        payload: PreparePayload = prepare_message.payload
+    def promise_parallel(self, payload: PreparePayload):
         round_id: RoundID = payload[0]
         instance: InstanceID = payload[1]
-        preprepare: bool = payload[2]
-        self._preprepared_promise = preprepare
-
-
-        # If this instance is new add it to the list of started instances
-        if instance not in self._started_instances:
-            self._started_instances.append(instance)
-            self._latest_round_ID[instance] = RoundID(0)
-            self._accepted_value[instance] = None
-            self._accepted_round_ID[instance] = RoundID(0)
-
-        if round_id > self._latest_round_ID[instance]:
-            self._latest_round_ID[instance] = round_id
-
-            promise_message: Promise = Promise(sender=self,
-                                               receiver_role=Role.PROPOSER,
-                                               payload=PromisePayload((self._latest_round_ID[instance],
-                                                                       self._accepted_round_ID[instance],
-                                                                       self._accepted_value[instance],
-                                                                       instance))
-                                               )
-            self.send(message=promise_message)
+
+        # If this instance is new add it to the started instances, unless it was truncated
+        record = self._instances.get(instance)
+        if record is None:
+            record = self._instances.start(instance)
+
+        if record is not None and round_id > self.promised_round(instance, record) and not self.lease_blocks(round_id):
+            record.promised_round = round_id
+            if self._wal is not None:
+                self._wal.log_promise(instance, round_id)
+                self.wal_appended()
+
+            self.metrics.increment('promised')
+            self.trace(TraceEvent.ACCEPTOR_PROMISE, instance)
+            self._promise_batcher.add(PromisePayload((record.promised_round,
+                                                      record.accepted_round,
+                                                      record.accepted_value,
+                                                      instance)))
             self.log_debug("Sending Promise for round {0} and instance {1}"
-                     .format(self._latest_round_ID[instance], instance)
+                     .format(record.promised_round, instance)
                      )
+        else:
+            self.metrics.increment('prepares_refused')
 
-        if preprepare:
-            self._preprepared_promise_round = round_id
-
-    def accept_parallel(self, propose_message: Propose):
-        payload: ProposePayload = propose_message.payload
+    def accept_parallel(self, payload: ProposePayload):
         round_id: RoundID = payload[0]
         proposed_value: PaxosValue = payload[1]
         instance: InstanceID = payload[2]
-        preprepared_promise = payload[3]
 
-        if preprepared_promise and self._preprepared_promise and instance not in self._started_instances:
-            self._started_instances.append(instance)
-            self._latest_round_ID[instance] = self._preprepared_promise_round
-            self._accepted_value[instance] = None
-            self._accepted_round_ID[instance] = RoundID(0)
+        # Instances covered by the promise given to a stable leader are started by its Propose
+        record = self._instances.get(instance)
+        if record is None and self._range_first is not None and instance >= self._range_first:
+            record = self._instances.start(instance)
 
         # Not received a promise for this instance yet, ignore
-        if instance not in self._started_instances:
+        if record is None:
+            self.metrics.increment('proposals_refused')
             return
 
-        if round_id >= self._latest_round_ID[instance]:
-            if self._accepted_value[instance] is not proposed_value:
+        # A proposer promised the round before the lease was granted cannot get a value decided while it is valid either
+        if round_id >= self.promised_round(instance, record) and not self.lease_blocks(round_id):
+            if record.accepted_value is not proposed_value:
                 self.log_debug("Accepted value {0} for round {1} and instance {2}"
                          .format(proposed_value, round_id, instance)
                          )
 
-            self._accepted_value[instance] = proposed_value
-            self._accepted_round_ID[instance] = round_id
-            accept_message_proposers: Accept = Accept(sender=self,
-                                            receiver_role=Role.PROPOSER,
-                                            payload=AcceptPayload(
-                                                (self._accepted_round_ID[instance],
-                                                 self._accepted_value[instance],
-                                                 instance))
-                                            )
-            self.send(accept_message_proposers)
-
-            accept_message_learners: Accept = Accept(sender=self,
-                                                      receiver_role=Role.LEARNER,
-                                                      payload=AcceptPayload(
-                                                          (self._accepted_round_ID[instance],
-                                                           self._accepted_value[instance],
-                                                           instance))
-                                                      )
-            self.send(accept_message_learners)
-
-
-    def run(self) -> NoReturn:
-        self.log_info("Start running...")
-        start = time.time()
-
-        while True:
-            if self.lifetime > 0.0:
-                if time.time()-start > self.lifetime:
-                    self.log_warning("Terminating...")
-                    break
-
-            message: MessageT = self.listen()
-            if message is not None and message.message_type in self._message_callbacks:
-                self._message_callbacks[message.message_type](message)
+            record.accepted_value = proposed_value
+            record.accepted_round = round_id
+            if self._wal is not None:
+                self._wal.log_accept(instance, round_id, proposed_value)
+                self.wal_appended()
+            accept_payload = AcceptPayload((record.accepted_round,
+                                            record.accepted_value,
+                                            instance))
+            self._accept_proposers_batcher.add(accept_payload)
+            if not self._leader_fanout:
+                self._accept_learners_batcher.add(accept_payload)
+            self.metrics.increment('accepted')
+            self.trace(TraceEvent.ACCEPTOR_ACCEPT, instance)
+        else:
+            self.metrics.increment('proposals_refused')
+
+    # ---- Leader lease ---- #
+
+    def lease_request_callback(self, lease_request: LeaseRequest) -> None:
+        sequence: int = lease_request.payload[0]
+        leader_round: RoundID = lease_request.payload[1]
+        decided_watermark: InstanceID = lease_request.payload[2]
+        proposer_id = lease_request.sender_id
+
+        # A proposer behind the leader round promised by this acceptor is no longer the leader
+        if leader_round < self._range_round:
+            return
+        # The instances up to the ACK watermark of the leader are known to the learners, so they can be forgotten
+        self.truncate(decided_watermark)
+        if self._lease_holder not in (None, proposer_id) and self.now < self._lease_expiry:
+            return
+
+        self._lease_holder = proposer_id
+        self._lease_expiry = self.now + LEASE_DURATION
+        self.send(LeaseGrant(sender=self,
+                             receiver_role=Role.PROPOSER,
+                             payload=LeaseGrantPayload((proposer_id, sequence, self._instances.low_water_mark))))
+
+    def lease_blocks(self, round_id: RoundID) -> bool:
+        """
+        Whether a Prepare or a Propose for the round must be refused because the lease is held by another proposer
+        """
+        return (self._lease_holder is not None and self._lease_holder != ballot_proposer(round_id)
+                and self.now < self._lease_expiry)
+
+    def truncate(self, low_water_mark: InstanceID) -> None:
+        """
+        Forgets all the instances up to low_water_mark, which must be known to be decided by the learners
+        """
+        if low_water_mark <= self._instances.low_water_mark:
+            return
+        self._instances.truncate(low_water_mark)
+        self.metrics.increment('truncations')
+        if self._wal is not None:
+            self._wal.log_truncate(low_water_mark)
+            self.wal_appended()
+            if self._wal.records > Acceptor.WAL_COMPACTION_RECORDS + 2 * len(self._instances):
+                self.compact_wal()
+
+    # ---- Write-ahead log ---- #
+
+    def replay_wal(self) -> int:
+        """
+        Rebuilds the state of the acceptor from the records of the write-ahead log, returns the number of records
+        """
+        replayed = 0
+        for kind, instance, round_id, value in self._wal.replay():
+            replayed += 1
+            if kind == AcceptorLog.PROMISE_RANGE:
+                self._range_first = instance
+                self._range_round = round_id
+                continue
+            if kind == AcceptorLog.TRUNCATE:
+                self._instances.truncate(instance)
+                continue
+
+            record = self._instances.get(instance)
+            if record is None:
+                record = self._instances.start(instance)
+                if record is None:
+                    continue
+
+            if kind == AcceptorLog.PROMISE:
+                record.promised_round = round_id
+            else:
+                record.accepted_value = value
+                record.accepted_round = round_id
+        return replayed
+
+    def compact_wal(self) -> None:
+        """
+        Rewrites the write-ahead log with only the records needed to rebuild the current state
+        """
+        self.sync_wal()
+        records = [AcceptorLog.truncate_record(self._instances.low_water_mark)]
+        if self._range_first is not None:
+            records.append(AcceptorLog.promise_range_record(self._range_first, self._range_round))
+        for instance, record in self._instances.items_from(InstanceID(0)):
+            if record.promised_round:
+                records.append(AcceptorLog.promise_record(instance, record.promised_round))
+            if record.accepted_value is not None:
+                records.append(AcceptorLog.accept_record(instance, record.accepted_round, record.accepted_value))
+        logged = self._wal.records
+        self._wal.rewrite(records)
+        self.metrics.increment('wal_compactions')
+        self.log_info("Compacted the write-ahead log from {0} to {1} records".format(logged, len(records)))
+
+    def wal_appended(self) -> None:
+        if not self._group_commit:
+            self.sync_wal()
+
+    def sync_wal(self) -> None:
+        """
+        Makes the logged changes durable and releases the replies that were waiting for them
+        """
+        if self._wal.dirty:
+            started = time.perf_counter()
+            self._wal.sync()
+            self._wal_sync_latency.observe(time.perf_counter() - started)
+        held, self._held_replies = self._held_replies, []
+        for message, addresses in held:
+            super().send(message, addresses)
+
+    # ---- Node hooks ---- #
+
+    def send(self, message: Message, addresses: Iterable[NetworkGroup] = None) -> None:
+        # A reply may depend on any change logged so far, so it waits for the next sync
+        if self._wal is not None and self._wal.dirty:
+            self._held_replies.append((message, addresses))
+        else:
+            super().send(message, addresses)
+
+    def flush(self) -> None:
+        # A single fsync covers all the messages handled in this iteration, then the batched replies are sent
+        if self._wal is not None:
+            self.sync_wal()
+        super().flush()
+
+    def on_stop(self) -> None:
+        if self._wal is not None:
+            self.flush()
+            self._wal.close()
@@ -0,0 +1,34 @@
+# Ballot numbers (round IDs) of the proposers.
+#
+# A ballot is a 64-bit unsigned integer made of a counter in the high 48 bits and the ID of the proposer that owns it
+# in the low 16 bits, so ballots of different proposers never collide and compare as plain integers: a higher counter
+# always wins, ties are broken by the proposer ID. Ballot 0 means "no ballot", e.g. no value accepted yet.
+
+from paxos.message import RoundID
+
+BALLOT_PROPOSER_BITS = 16
+BALLOT_COUNTER_BITS = 48
+
+MAX_PROPOSER_ID = (1 << BALLOT_PROPOSER_BITS) - 1
+MAX_BALLOT_COUNTER = (1 << BALLOT_COUNTER_BITS) - 1
+
+
+def make_ballot(counter: int, proposer_id: int) -> RoundID:
+    assert 0 <= counter <= MAX_BALLOT_COUNTER, "Ballot counter out of range"
+    assert 0 < proposer_id <= MAX_PROPOSER_ID, "Proposer ID should be between 1 and {0}".format(MAX_PROPOSER_ID)
+    return RoundID((counter << BALLOT_PROPOSER_BITS) | proposer_id)
+
+
+def ballot_counter(ballot: RoundID) -> int:
+    return ballot >> BALLOT_PROPOSER_BITS
+
+
+def ballot_proposer(ballot: RoundID) -> int:
+    return ballot & MAX_PROPOSER_ID
+
+
+def next_ballot(highest_seen: RoundID, proposer_id: int) -> RoundID:
+    """
+    Smallest ballot of the proposer higher than every ballot seen so far
+    """
+    return make_ballot(ballot_counter(highest_seen) + 1, proposer_id)
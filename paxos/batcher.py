@@ -0,0 +1,80 @@
+from typing import Callable, List, Optional, TYPE_CHECKING
+
+from paxos.role import Role
+from paxos.timer import Timer
+
+if TYPE_CHECKING:
+    from paxos.node import Node
+
+
+class Batcher:
+    """
+    Collects the payloads of outgoing messages of the same type and sends them to the receiver group in a single
+    batched datagram.
+    The batch is flushed when it reaches max_size payloads, when max_delay seconds elapsed since its first payload
+    was added or, if max_delay is 0, at the end of the node loop iteration in which it was filled.
+    With max_size lower than 2 batching is disabled and every payload is sent right away as a single message.
+    If addresses is given, the messages are sent only to the addresses it returns when they are sent, or to the whole
+    group when it returns None.
+    """
+
+    def __init__(self,
+                 node: 'Node',
+                 single_class: type,
+                 batch_class: type,
+                 receiver_role: Role,
+                 max_size: int,
+                 max_delay: float,
+                 addresses: Callable[[], Optional[List]] = None) -> None:
+        self.__node = node
+        self.__single_class = single_class
+        self.__batch_class = batch_class
+        self.__receiver_role = receiver_role
+        self.__max_size = max_size
+        self.__max_delay = max_delay
+        self.__addresses = addresses
+
+        self.__pending: List = []
+        self.__timer: Optional[Timer] = None
+
+    @property
+    def flush_on_iteration_end(self) -> bool:
+        return self.__max_delay <= 0.0
+
+    def add(self, payload) -> None:
+        if self.__max_size < 2:
+            self.__send(self.__single_class(sender=self.__node, receiver_role=self.__receiver_role, payload=payload))
+            return
+
+        self.__pending.append(payload)
+        if len(self.__pending) >= self.__max_size:
+            self.flush()
+        elif self.__timer is None and self.__max_delay > 0.0:
+            self.__timer = self.__node.schedule(self.__max_delay, self.__on_timeout)
+
+    def flush(self) -> None:
+        """
+        Sends all the pending payloads, if any
+        """
+        if self.__timer is not None:
+            self.__node.cancel(self.__timer)
+            self.__timer = None
+        if not self.__pending:
+            return
+
+        pending, self.__pending = self.__pending, []
+        if len(pending) == 1:
+            message = self.__single_class(sender=self.__node, receiver_role=self.__receiver_role, payload=pending[0])
+        else:
+            message = self.__batch_class(sender=self.__node, receiver_role=self.__receiver_role, payload=pending)
+        self.__send(message)
+
+    def __send(self, message) -> None:
+        if self.__addresses is None:
+            self.__node.send(message)
+        else:
+            self.__node.send(message, self.__addresses())
+
+    def __on_timeout(self) -> None:
+        self.__timer = None
+        self.flush()
@@ -1,26 +1,76 @@
-from typing import NoReturn
 from .role import Role
 from .network import Network
-from .node import NodeID, Node, MessageT
-from .message import PaxosValue, InstanceID, ClientPropose, ClientProposePayload, MessageType
+from .node import NodeID, Node
+from .timer import Timer
+from .message import PaxosValue, InstanceID, ClientPropose, ClientProposePayload, MessageType, RequestAck
+from .message import ReadRequest, ReadRequestPayload, ReadResponse, ReadStatus
+from .shard import shard_of, local_instance
+from .tracing import TraceEvent
+from .transport import LineReader
 
-import time
 import sys
-from typing import Dict
+from typing import Callable, Dict, Iterable, Iterator, Optional, Tuple
 
 
 class Client(Node):
     BASE_TIMEOUT = 0.5
     TIMEOUT_GROWTH_FACTOR = 2.0
-
-    def __init__(self, id: NodeID, network: Network, plr: float, lifetime: float, first_instance: int = 1) -> None:
-        super().__init__(id, Role.CLIENT, network, plr, lifetime)
+    # Upper bound of the resend timeout of a request
+    MAX_TIMEOUT = 4.0
+    # Default maximum number of requests waiting for an ACK at the same time
+    DEFAULT_WINDOW = 128
+
+    def __init__(self, id: NodeID, network: Network, plr: float, lifetime: float, first_instance: int = 1,
+                 window: int = DEFAULT_WINDOW, values: Iterable[str] = None, **node_options) -> None:
+        super().__init__(id, Role.CLIENT, network, plr, lifetime, **node_options)
+        # The standard input is read without blocking, the node loop watches it only while waiting for a value
+        self._input: Optional[LineReader] = None
+        if values is None:
+            self._input = LineReader(sys.stdin)
+            values = self.read_input()
+        if network.shards > 1:
+            # The input holds the values of the global instances from first_instance on, the client of a shard
+            # requests only the ones of the instances of its shard
+            values = Client.shard_values(values, first_instance, network)
+            first_instance += (network.shard - shard_of(first_instance, network.shards)) % network.shards
+            first_instance = local_instance(first_instance, network.shards)
         self._instance_id: InstanceID = InstanceID(first_instance-1)
         self._pending_requests: Dict[InstanceID, ClientPropose] = {}
 
+        # Values to request are read lazily (from stdin by default), only as long as there is room in the window
+        assert window >= 1, "The request window should allow at least one request in flight"
+        self._window = window
+        # None is yielded while the next value is not available yet
+        self._values: Iterator[Optional[str]] = iter(values)
+        self._input_exhausted = False
+
         # Timeout for receiving an ACK for each instance value request
         self._request_timeouts: Dict[InstanceID, float] = {}
-        self._last_request_time: Dict[InstanceID, float] = {}
+        self._request_timers: Dict[InstanceID, Timer] = {}
+
+        # Statistics used to report the throughput achieved by the client
+        self._requests_acked = 0
+        self._retransmissions = 0
+        self._first_request_time: float = None
+        self._last_ack_time: float = None
+        self._throughput_reported = False
+
+        # Reads of the decided log waiting for the response of the leader, by request ID, with the callback to run
+        # with the response and the resend timer
+        self._next_read_id = 0
+        self._pending_reads: Dict[int, Tuple[ReadRequest, Callable[[InstanceID, ReadStatus, PaxosValue], None]]] = {}
+        self._read_timeouts: Dict[int, float] = {}
+        self._read_timers: Dict[int, Timer] = {}
+
+        self.metrics.gauge('retransmissions', lambda: self._retransmissions)
+        self.metrics.gauge('requests_acked', lambda: self._requests_acked)
+        self.metrics.gauge('pending_requests', lambda: len(self._pending_requests))
+        self.metrics.gauge('pending_reads', lambda: len(self._pending_reads))
+
+        self._message_callbacks = {
+            MessageType.REQUEST_ACK: self.request_ack_callback,
+            MessageType.READ_RESPONSE: self.read_response_callback
+        }
 
     def request_value(self, value: int):
         """Send a request to all proposers to propose a given value"""
@@ -32,39 +82,144 @@ class Client(Node):
                                                        )
                                                        )
         self.send(request_message)
+        self.trace(TraceEvent.CLIENT_REQUEST, self._instance_id)
         self._pending_requests[self._instance_id] = request_message
-        self._last_request_time[self._instance_id] = time.time()
-
-
-    def run(self) -> NoReturn:
-        self.log_info("Start running...")
-        start = time.time()
-
-        for value in sys.stdin:
+        self._request_timeouts[self._instance_id] = Client.BASE_TIMEOUT
+        self._request_timers[self._instance_id] = self.schedule(Client.BASE_TIMEOUT, self.request_timeout,
+                                                                self._instance_id)
+        if self._first_request_time is None:
+            self._first_request_time = self.now
+
+    def admit_requests(self) -> None:
+        """
+        Read new values from the input and request them until the window is full or the input is over
+        """
+        while not self._input_exhausted and len(self._pending_requests) < self._window:
+            try:
+                value = next(self._values)
+            except StopIteration:
+                self._input_exhausted = True
+                break
+            if value is None:
+                # Wake up as soon as more input is available
+                self.transport.watch(self._input, True)
+                return
             self.request_value(value.strip())
-            self._request_timeouts[self._instance_id] = Client.BASE_TIMEOUT
+        if self._input is not None:
+            self.transport.watch(self._input, False)
 
+    def read_input(self) -> Iterator[Optional[str]]:
         while True:
-            if self.lifetime > 0.0:
-                if time.time()-start > self.lifetime:
-                    self.log_warning("Terminating...")
-                    break
-
-            # If an ACK is received remove request for the corresponding instance from the set of pending request
-            message: MessageT = self.listen()
-            if message is not None and message.message_type is MessageType.REQUEST_ACK:
-                instance: InstanceID = message.payload
-                if instance in self._pending_requests:
-                    del self._pending_requests[instance]
-
-            # Check if a value request timed out
-            for instance in self._pending_requests.keys():
-                if (time.time() - self._last_request_time[instance]) > self._request_timeouts[instance]:
-                    # Increase timeout and try resend the request
-                    self._request_timeouts[instance] *= Client.TIMEOUT_GROWTH_FACTOR
-                    self.send(self._pending_requests[instance])
-
-
-
-
-
+            line = self._input.readline()
+            if line is None and self._input.exhausted:
+                return
+            yield line
+
+    @staticmethod
+    def shard_values(values: Iterable[Optional[str]], first_instance: int, network: Network) \
+            -> Iterator[Optional[str]]:
+        offset = 0
+        for value in values:
+            if value is None:
+                yield None
+                continue
+            if shard_of(first_instance + offset, network.shards) == network.shard:
+                yield value
+            offset += 1
+
+    def request_ack_callback(self, ack: RequestAck) -> None:
+        # If an ACK is received remove request for the corresponding instance from the set of pending request
+        instance: InstanceID = ack.payload
+        if instance in self._pending_requests:
+            del self._pending_requests[instance]
+            del self._request_timeouts[instance]
+            self.cancel(self._request_timers.pop(instance))
+            self._requests_acked += 1
+            self._last_ack_time = self.now
+            self.trace(TraceEvent.CLIENT_ACKED, instance)
+
+    def request_timeout(self, instance: InstanceID) -> None:
+        """
+        The request for the instance was not ACKed in time: increase timeout and resend the request
+        """
+        self._request_timeouts[instance] = min(self._request_timeouts[instance] * Client.TIMEOUT_GROWTH_FACTOR,
+                                               Client.MAX_TIMEOUT)
+        self.send(self._pending_requests[instance])
+        self._retransmissions += 1
+        self.trace(TraceEvent.CLIENT_RETRANSMIT, instance)
+        self._request_timers[instance] = self.schedule(self._request_timeouts[instance], self.request_timeout, instance)
+
+    # ---- Reads ---- #
+
+    def read(self, instance: InstanceID, callback: Callable[[InstanceID, ReadStatus, PaxosValue], None] = None) -> int:
+        """
+        Read an instance of the decided log from the leader, without running Paxos: callback is called with the
+        instance, its ReadStatus and its decided value once the leader answers; an instance decided before the leader
+        knew it is UNAVAILABLE, to be read from the decision log of a learner.
+        Returns the ID of the read request
+        """
+        assert instance >= 1, "Instances are numbered from 1"
+        self._next_read_id += 1
+        read_id = self._next_read_id
+        request = ReadRequest(sender=self, receiver_role=Role.PROPOSER, payload=ReadRequestPayload((read_id, instance)))
+        self.send(request)
+        self._pending_reads[read_id] = (request, callback if callback is not None else self.log_read)
+        self._read_timeouts[read_id] = Client.BASE_TIMEOUT
+        self._read_timers[read_id] = self.schedule(Client.BASE_TIMEOUT, self.read_timeout, read_id)
+        return read_id
+
+    def read_response_callback(self, response: ReadResponse) -> None:
+        client_id, read_id, instance, status, value = response.payload
+        if client_id != self.id or read_id not in self._pending_reads:
+            return
+        _, callback = self._pending_reads.pop(read_id)
+        del self._read_timeouts[read_id]
+        self.cancel(self._read_timers.pop(read_id))
+        callback(instance, ReadStatus(status), value)
+
+    def read_timeout(self, read_id: int) -> None:
+        """
+        No leader answered the read in time, e.g. because it is not holding a lease: resend it with a higher timeout
+        """
+        self._read_timeouts[read_id] = min(self._read_timeouts[read_id] * Client.TIMEOUT_GROWTH_FACTOR,
+                                           Client.MAX_TIMEOUT)
+        self.send(self._pending_reads[read_id][0])
+        self.metrics.increment('read_retransmissions')
+        self._read_timers[read_id] = self.schedule(self._read_timeouts[read_id], self.read_timeout, read_id)
+
+    def log_read(self, instance: InstanceID, status: ReadStatus, value: PaxosValue) -> None:
+        if status == ReadStatus.DECIDED:
+            self.log_info("Read instance {0}: decided value {1}".format(instance, value))
+        elif status == ReadStatus.UNDECIDED:
+            self.log_info("Read instance {0}: not decided".format(instance))
+        else:
+            self.log_info("Read instance {0}: not known to the leader, to be read from a learner".format(instance))
+
+    # ------------- #
+
+    def report_throughput(self) -> None:
+        if self._requests_acked == 0:
+            self.log_warning("No request was acknowledged")
+            return
+
+        elapsed = max(self._last_ack_time - self._first_request_time, 1e-6)
+        self.report('done', acked=self._requests_acked, elapsed=elapsed, retransmissions=self._retransmissions)
+        self.log_warning("{0} requests acknowledged in {1:.3f} sec ({2:.1f} requests/sec, {3} retransmissions)"
+                         .format(self._requests_acked, elapsed, self._requests_acked / elapsed,
+                                 self._retransmissions))
+
+    def on_start(self) -> None:
+        self.admit_requests()
+
+    def tick(self) -> None:
+        self.admit_requests()
+        # Report the throughput once all the values were requested and acknowledged
+        if self._input_exhausted and not self._pending_requests and not self._throughput_reported:
+            self._throughput_reported = True
+            self.report_throughput()
+
+    def on_stop(self) -> None:
+        if not self._throughput_reported:
+            self.report_throughput()
+        if self._input is not None:
+            self._input.close()
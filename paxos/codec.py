@@ -0,0 +1,384 @@
+# Binary wire format of the Paxos messages.
+#
+# Every datagram starts with a fixed header, followed by the sender ID and the payload of the message:
+#
+#     +---------+--------------+-------------+---------------+-----------------+---------+
+#     | version | message type | sender role | receiver role | sender ID       | payload |
+#     | 1 byte  | 1 byte       | 1 byte      | 1 byte        | varint          | ...     |
+#     +---------+--------------+-------------+---------------+-----------------+---------+
+#
+# Instance IDs and node IDs are unsigned LEB128 varints, so small numbers take a single byte, while round IDs are
+# ballots (see ballot.py) encoded as fixed-width 64-bit integers. Paxos values are tagged: None, a zigzag varint for
+# integers or a length-prefixed UTF-8 string.
+#
+# Catch-up messages carry runs of consecutive instances, so their instance IDs are delta encoded; the payload of a
+# catch-up response is also compressed with zlib.
+
+from typing import Callable, Dict, List, NamedTuple, Tuple
+import struct
+import zlib
+
+from paxos.message_type import MessageType
+from paxos.role import Role
+from paxos.message import Message, Prepare, Promise, Propose, Accept, ClientPropose, Decide, RequestAck, DecideAck, \
+    HeartBeat, CatchupRequest, CatchupResponse, PrepareBatch, PromiseBatch, ProposeBatch, AcceptBatch, PrepareRange, \
+    PromiseRange, LeaseRequest, LeaseGrant, ReadRequest, ReadResponse, DecideBatch
+
+WIRE_VERSION = 9
+
+_HEADER = struct.Struct('!BBBB')
+_BALLOT = struct.Struct('!Q')
+
+_ROLES: List[Role] = [Role.CLIENT, Role.PROPOSER, Role.ACCEPTOR, Role.LEARNER]
+_ROLE_CODES: Dict[Role, int] = {role: code for code, role in enumerate(_ROLES)}
+
+_MESSAGE_TYPES: Dict[int, MessageType] = {message_type.value: message_type for message_type in MessageType}
+
+_VALUE_NONE = 0
+_VALUE_INT = 1
+_VALUE_STR = 2
+
+
+class CodecError(Exception):
+    """
+    Raised when a datagram can not be decoded
+    """
+    pass
+
+
+class RemoteSender(NamedTuple):
+    """
+    Identity of the node that sent a decoded message, used in place of the sender Node when rebuilding messages
+    """
+    id: int
+    role: Role
+
+
+# ---- Primitive encoders, also used by the on-disk logs ---- #
+
+def write_varint(out: bytearray, value: int) -> None:
+    if value < 0:
+        raise CodecError("Negative value {0} can not be encoded as varint".format(value))
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def read_varint(buffer: memoryview, pos: int) -> Tuple[int, int]:
+    result = 0
+    shift = 0
+    try:
+        while True:
+            byte = buffer[pos]
+            pos += 1
+            result |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                return result, pos
+            shift += 7
+    except IndexError:
+        raise CodecError("Truncated varint")
+
+
+def write_value(out: bytearray, value) -> None:
+    if value is None:
+        out.append(_VALUE_NONE)
+    elif isinstance(value, int):
+        out.append(_VALUE_INT)
+        # Zigzag encoding maps signed integers to unsigned ones, keeping small magnitudes short
+        write_varint(out, value << 1 if value >= 0 else ((-value) << 1) - 1)
+    elif isinstance(value, str):
+        raw = value.encode('utf-8')
+        out.append(_VALUE_STR)
+        write_varint(out, len(raw))
+        out += raw
+    else:
+        raise CodecError("Unsupported Paxos value type {0}".format(type(value).__name__))
+
+
+def read_value(buffer: memoryview, pos: int) -> Tuple[object, int]:
+    try:
+        tag = buffer[pos]
+    except IndexError:
+        raise CodecError("Truncated value")
+    pos += 1
+    if tag == _VALUE_NONE:
+        return None, pos
+    if tag == _VALUE_INT:
+        zigzag, pos = read_varint(buffer, pos)
+        return (zigzag >> 1) if not zigzag & 1 else -((zigzag + 1) >> 1), pos
+    if tag == _VALUE_STR:
+        length, pos = read_varint(buffer, pos)
+        end = pos + length
+        if end > len(buffer):
+            raise CodecError("Truncated string value")
+        try:
+            return str(buffer[pos:end], 'utf-8'), end
+        except UnicodeDecodeError:
+            raise CodecError("Invalid UTF-8 string value")
+    raise CodecError("Unknown value tag {0}".format(tag))
+
+
+def _write_ballot(out: bytearray, value: int) -> None:
+    try:
+        out += _BALLOT.pack(value)
+    except struct.error:
+        raise CodecError("Ballot {0} does not fit in 64 bits".format(value))
+
+
+def _read_ballot(buffer: memoryview, pos: int) -> Tuple[int, int]:
+    try:
+        return _BALLOT.unpack_from(buffer, pos)[0], pos + _BALLOT.size
+    except struct.error:
+        raise CodecError("Truncated ballot")
+
+
+def _write_bool(out: bytearray, value: bool) -> None:
+    out.append(1 if value else 0)
+
+
+def _read_bool(buffer: memoryview, pos: int) -> Tuple[bool, int]:
+    try:
+        return buffer[pos] != 0, pos + 1
+    except IndexError:
+        raise CodecError("Truncated boolean")
+
+
+# ---- Payload layouts ---- #
+
+# Tuple payloads are described by a string with one character per field:
+# 'u' unsigned varint (instance and node IDs), 'r' fixed-width ballot (round IDs), 'v' Paxos value, 'b' boolean
+_FIELD_WRITERS: Dict[str, Callable] = {'u': write_varint, 'r': _write_ballot, 'v': write_value, 'b': _write_bool}
+_FIELD_READERS: Dict[str, Callable] = {'u': read_varint, 'r': _read_ballot, 'v': read_value, 'b': _read_bool}
+
+_TUPLE_LAYOUTS: Dict[MessageType, str] = {
+    MessageType.PREPARE: 'ru',
+    MessageType.PROMISE: 'rrvu',
+    MessageType.PROPOSE: 'rvu',
+    MessageType.ACCEPT: 'rvu',
+    MessageType.CLIENT_PROPOSE: 'vu',
+    MessageType.DECIDE: 'vu',
+    MessageType.PREPARE_RANGE: 'ru',
+    MessageType.LEASE_REQUEST: 'uru',
+    MessageType.LEASE_GRANT: 'uuu',
+    MessageType.READ_REQUEST: 'uu',
+    MessageType.READ_RESPONSE: 'uuuuv',
+}
+
+# Layout of the accepted values reported by a PromiseRange, after its ballot, first instance, chunk index and chunk count
+_PROMISE_RANGE_HEADER = 'ruuu'
+_ACCEPTED_ENTRY = 'urv'
+
+# Batched payloads are a varint count followed by the entries, each one with the layout of the single message
+_LIST_LAYOUTS: Dict[MessageType, str] = {
+    MessageType.PREPARE_BATCH: _TUPLE_LAYOUTS[MessageType.PREPARE],
+    MessageType.PROMISE_BATCH: _TUPLE_LAYOUTS[MessageType.PROMISE],
+    MessageType.PROPOSE_BATCH: _TUPLE_LAYOUTS[MessageType.PROPOSE],
+    MessageType.ACCEPT_BATCH: _TUPLE_LAYOUTS[MessageType.ACCEPT],
+    MessageType.DECIDE_BATCH: _TUPLE_LAYOUTS[MessageType.DECIDE],
+}
+
+# Payloads made of a single unsigned integer
+_SCALAR_TYPES = {MessageType.REQUEST_ACK, MessageType.DECIDE_ACK, MessageType.HEARTBEAT}
+
+_MESSAGE_CLASSES: Dict[MessageType, type] = {
+    MessageType.PREPARE: Prepare,
+    MessageType.PROMISE: Promise,
+    MessageType.PROPOSE: Propose,
+    MessageType.ACCEPT: Accept,
+    MessageType.CLIENT_PROPOSE: ClientPropose,
+    MessageType.DECIDE: Decide,
+    MessageType.REQUEST_ACK: RequestAck,
+    MessageType.DECIDE_ACK: DecideAck,
+    MessageType.HEARTBEAT: HeartBeat,
+    MessageType.CATCHUP_REQUEST: CatchupRequest,
+    MessageType.CATCHUP_RESPONSE: CatchupResponse,
+    MessageType.PREPARE_BATCH: PrepareBatch,
+    MessageType.PROMISE_BATCH: PromiseBatch,
+    MessageType.PROPOSE_BATCH: ProposeBatch,
+    MessageType.ACCEPT_BATCH: AcceptBatch,
+    MessageType.PREPARE_RANGE: PrepareRange,
+    MessageType.PROMISE_RANGE: PromiseRange,
+    MessageType.LEASE_REQUEST: LeaseRequest,
+    MessageType.LEASE_GRANT: LeaseGrant,
+    MessageType.READ_REQUEST: ReadRequest,
+    MessageType.READ_RESPONSE: ReadResponse,
+    MessageType.DECIDE_BATCH: DecideBatch,
+}
+
+
+def _write_catchup_request(out: bytearray, payload) -> None:
+    source, watermark, highest, ranges = payload
+    write_varint(out, source)
+    write_varint(out, watermark)
+    write_varint(out, highest)
+    write_varint(out, len(ranges))
+    previous = watermark
+    for first, last in ranges:
+        write_varint(out, first - previous)
+        write_varint(out, last - first)
+        previous = last
+
+
+def _read_catchup_request(buffer: memoryview, pos: int):
+    source, pos = read_varint(buffer, pos)
+    watermark, pos = read_varint(buffer, pos)
+    highest, pos = read_varint(buffer, pos)
+    count, pos = read_varint(buffer, pos)
+    ranges = []
+    previous = watermark
+    for _ in range(count):
+        gap, pos = read_varint(buffer, pos)
+        length, pos = read_varint(buffer, pos)
+        ranges.append((previous + gap, previous + gap + length))
+        previous += gap + length
+    return (source, watermark, highest, ranges), pos
+
+
+def _write_catchup_response(out: bytearray, payload) -> None:
+    body = bytearray()
+    write_varint(body, len(payload))
+    previous = 0
+    for instance in sorted(payload):
+        write_varint(body, instance - previous)
+        write_value(body, payload[instance])
+        previous = instance
+    compressed = zlib.compress(body)
+    write_varint(out, len(compressed))
+    out += compressed
+
+
+def _read_catchup_response(buffer: memoryview, pos: int):
+    length, pos = read_varint(buffer, pos)
+    end = pos + length
+    if end > len(buffer):
+        raise CodecError("Truncated catch-up response")
+    try:
+        body = memoryview(zlib.decompress(buffer[pos:end]))
+    except zlib.error:
+        raise CodecError("Corrupted catch-up response")
+
+    count, body_pos = read_varint(body, 0)
+    decided = {}
+    instance = 0
+    for _ in range(count):
+        delta, body_pos = read_varint(body, body_pos)
+        instance += delta
+        decided[instance], body_pos = read_value(body, body_pos)
+    if body_pos != len(body):
+        raise CodecError("Trailing bytes in catch-up response")
+    return decided, end
+
+
+def _write_payload(out: bytearray, message_type: MessageType, payload) -> None:
+    layout = _TUPLE_LAYOUTS.get(message_type)
+    if layout is not None:
+        for kind, field in zip(layout, payload):
+            _FIELD_WRITERS[kind](out, field)
+    elif message_type in _LIST_LAYOUTS:
+        layout = _LIST_LAYOUTS[message_type]
+        write_varint(out, len(payload))
+        for entry in payload:
+            for kind, field in zip(layout, entry):
+                _FIELD_WRITERS[kind](out, field)
+    elif message_type in _SCALAR_TYPES:
+        write_varint(out, payload)
+    elif message_type is MessageType.PROMISE_RANGE:
+        for kind, field in zip(_PROMISE_RANGE_HEADER, payload):
+            _FIELD_WRITERS[kind](out, field)
+        write_varint(out, len(payload[4]))
+        for entry in payload[4]:
+            for kind, field in zip(_ACCEPTED_ENTRY, entry):
+                _FIELD_WRITERS[kind](out, field)
+    elif message_type is MessageType.CATCHUP_REQUEST:
+        _write_catchup_request(out, payload)
+    elif message_type is MessageType.CATCHUP_RESPONSE:
+        _write_catchup_response(out, payload)
+    else:
+        raise CodecError("No wire layout for message type {0}".format(message_type))
+
+
+def _read_payload(buffer: memoryview, pos: int, message_type: MessageType):
+    layout = _TUPLE_LAYOUTS.get(message_type)
+    if layout is not None:
+        fields = []
+        for kind in layout:
+            field, pos = _FIELD_READERS[kind](buffer, pos)
+            fields.append(field)
+        return tuple(fields), pos
+    if message_type in _LIST_LAYOUTS:
+        layout = _LIST_LAYOUTS[message_type]
+        count, pos = read_varint(buffer, pos)
+        entries = []
+        for _ in range(count):
+            fields = []
+            for kind in layout:
+                field, pos = _FIELD_READERS[kind](buffer, pos)
+                fields.append(field)
+            entries.append(tuple(fields))
+        return entries, pos
+    if message_type in _SCALAR_TYPES:
+        return read_varint(buffer, pos)
+    if message_type is MessageType.PROMISE_RANGE:
+        fields = []
+        for kind in _PROMISE_RANGE_HEADER:
+            field, pos = _FIELD_READERS[kind](buffer, pos)
+            fields.append(field)
+        count, pos = read_varint(buffer, pos)
+        entries = []
+        for _ in range(count):
+            entry = []
+            for kind in _ACCEPTED_ENTRY:
+                field, pos = _FIELD_READERS[kind](buffer, pos)
+                entry.append(field)
+            entries.append(tuple(entry))
+        fields.append(entries)
+        return tuple(fields), pos
+    if message_type is MessageType.CATCHUP_REQUEST:
+        return _read_catchup_request(buffer, pos)
+    if message_type is MessageType.CATCHUP_RESPONSE:
+        return _read_catchup_response(buffer, pos)
+    raise CodecError("No wire layout for message type {0}".format(message_type))
+
+
+# ---- Public API ---- #
+
+def encode(message: Message) -> bytes:
+    """
+    Serializes a message into a datagram
+    """
+    message_type = message.message_type
+    out = bytearray(_HEADER.pack(WIRE_VERSION,
+                                 message_type.value,
+                                 _ROLE_CODES[message.sender_role],
+                                 _ROLE_CODES[message.receiver_role]))
+    write_varint(out, message.sender_id)
+    _write_payload(out, message_type, message.payload)
+    return bytes(out)
+
+
+def decode(buffer: memoryview) -> Message:
+    """
+    Rebuilds a message from a datagram, reading directly from the given buffer
+    """
+    if len(buffer) < _HEADER.size:
+        raise CodecError("Datagram shorter than the header")
+
+    version, type_code, sender_role_code, receiver_role_code = _HEADER.unpack_from(buffer)
+    if version != WIRE_VERSION:
+        raise CodecError("Unsupported wire version {0}".format(version))
+    try:
+        message_type = _MESSAGE_TYPES[type_code]
+        sender_role = _ROLES[sender_role_code]
+        receiver_role = _ROLES[receiver_role_code]
+    except (KeyError, IndexError):
+        raise CodecError("Malformed header")
+
+    sender_id, pos = read_varint(buffer, _HEADER.size)
+    payload, pos = _read_payload(buffer, pos, message_type)
+    if pos != len(buffer):
+        raise CodecError("{0} trailing bytes after the payload".format(len(buffer) - pos))
+
+    return _MESSAGE_CLASSES[message_type](sender=RemoteSender(sender_id, sender_role),
+                                          receiver_role=receiver_role,
+                                          payload=payload)
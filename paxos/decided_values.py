@@ -0,0 +1,72 @@
+from typing import Dict, Iterator, List, Tuple
+
+from paxos.message import InstanceID, PaxosValue
+
+
+class DecidedValues:
+    """
+    Values decided by a learner.
+    The instances up to the watermark, the contiguous prefix of decided instances starting from instance 1, are
+    stored in a list indexed by instance; only the instances decided out of order are kept in a dict, and they are
+    moved to the list as soon as the gap before them is filled.
+    """
+
+    def __init__(self, decided: Dict[InstanceID, PaxosValue] = None) -> None:
+        # Value decided for instance i is stored at index i - 1
+        self.__dense: List[PaxosValue] = []
+        self.__sparse: Dict[InstanceID, PaxosValue] = {}
+        self.__highest: InstanceID = InstanceID(0)
+
+        if decided:
+            for instance, value in decided.items():
+                self.add(instance, value)
+
+    @property
+    def watermark(self) -> InstanceID:
+        """
+        All the instances up to the watermark are decided
+        """
+        return InstanceID(len(self.__dense))
+
+    @property
+    def highest(self) -> InstanceID:
+        """
+        Highest decided instance, 0 if none is decided
+        """
+        return self.__highest
+
+    def __len__(self) -> int:
+        return len(self.__dense) + len(self.__sparse)
+
+    def __contains__(self, instance: InstanceID) -> bool:
+        return 0 < instance <= len(self.__dense) or instance in self.__sparse
+
+    def __getitem__(self, instance: InstanceID) -> PaxosValue:
+        if 0 < instance <= len(self.__dense):
+            return self.__dense[instance - 1]
+        return self.__sparse[instance]
+
+    def items(self) -> Iterator[Tuple[InstanceID, PaxosValue]]:
+        for index, value in enumerate(self.__dense):
+            yield InstanceID(index + 1), value
+        yield from self.__sparse.items()
+
+    def add(self, instance: InstanceID, value: PaxosValue) -> bool:
+        """
+        Stores the value decided for instance, returns False if the instance was already decided
+        """
+        if instance in self:
+            return False
+
+        if instance > self.__highest:
+            self.__highest = instance
+        if instance != len(self.__dense) + 1:
+            self.__sparse[instance] = value
+            return True
+
+        self.__dense.append(value)
+        # Filling a gap may extend the contiguous prefix with the instances decided out of order
+        sparse = self.__sparse
+        while sparse and len(self.__dense) + 1 in sparse:
+            self.__dense.append(sparse.pop(len(self.__dense) + 1))
+        return True
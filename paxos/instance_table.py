@@ -0,0 +1,108 @@
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from paxos.message import InstanceID, PaxosValue, RoundID
+
+
+class InstanceRecord:
+    """
+    State of an acceptor for a single instance
+    """
+    __slots__ = ('promised_round', 'accepted_round', 'accepted_value')
+
+    def __init__(self, promised_round: RoundID) -> None:
+        # Latest round the acceptor has participated in
+        self.promised_round = promised_round
+        # Round in which the accepted value, if any, was accepted
+        self.accepted_round = RoundID(0)
+        self.accepted_value: PaxosValue = None
+
+
+class InstanceTable:
+    """
+    Records of the instances started by an acceptor.
+    Instances are mostly started in increasing order, so the records are kept in a list indexed by the offset of the
+    instance from the first instance stored, with None for the instances not started; an instance far beyond the end
+    of the list is stored in a dict instead of growing the list over the hole, and it is moved to the list once the
+    list reaches it.
+    The records of the instances up to a low-water mark can be dropped with truncate: those instances are then
+    considered finished and are never started again.
+    """
+    # Maximum number of missing instances the list is grown over to store a new instance
+    MAX_DENSE_GAP = 1024
+
+    def __init__(self) -> None:
+        self.__base: InstanceID = InstanceID(1)
+        self.__dense: List[Optional[InstanceRecord]] = []
+        self.__sparse: Dict[InstanceID, InstanceRecord] = {}
+        self.__count = 0
+
+    @property
+    def low_water_mark(self) -> InstanceID:
+        """
+        All the instances up to the low-water mark were truncated
+        """
+        return InstanceID(self.__base - 1)
+
+    def __len__(self) -> int:
+        return self.__count
+
+    def __contains__(self, instance: InstanceID) -> bool:
+        return self.get(instance) is not None
+
+    def get(self, instance: InstanceID) -> Optional[InstanceRecord]:
+        offset = instance - self.__base
+        if 0 <= offset < len(self.__dense):
+            return self.__dense[offset]
+        return self.__sparse.get(instance)
+
+    def items_from(self, instance: InstanceID) -> Iterator[Tuple[InstanceID, InstanceRecord]]:
+        """
+        Yields the started instances from instance onwards with their records, the dense ones in increasing order
+        """
+        base = self.__base
+        for offset in range(max(instance - base, 0), len(self.__dense)):
+            record = self.__dense[offset]
+            if record is not None:
+                yield InstanceID(base + offset), record
+        for sparse_instance, record in self.__sparse.items():
+            if sparse_instance >= instance:
+                yield sparse_instance, record
+
+    def start(self, instance: InstanceID, promised_round: RoundID = RoundID(0)) -> Optional[InstanceRecord]:
+        """
+        Creates the record of an instance that was not started yet, returns None if the instance was truncated
+        """
+        offset = instance - self.__base
+        if offset < 0:
+            return None
+        record = InstanceRecord(promised_round)
+        self.__count += 1
+
+        dense = self.__dense
+        if offset < len(dense):
+            assert dense[offset] is None, "Instance {0} already started".format(instance)
+            dense[offset] = record
+        elif offset - len(dense) <= InstanceTable.MAX_DENSE_GAP:
+            # Grow the list up to the instance, moving in the records of the hole stored in the dict
+            for hole in range(self.__base + len(dense), instance):
+                dense.append(self.__sparse.pop(hole, None) if self.__sparse else None)
+            dense.append(record)
+        else:
+            assert instance not in self.__sparse, "Instance {0} already started".format(instance)
+            self.__sparse[instance] = record
+        return record
+
+    def truncate(self, low_water_mark: InstanceID) -> None:
+        """
+        Drops the records of all the instances up to low_water_mark
+        """
+        if low_water_mark < self.__base:
+            return
+        dropped = min(low_water_mark - self.__base + 1, len(self.__dense))
+        self.__count -= sum(1 for record in self.__dense[:dropped] if record is not None)
+        del self.__dense[:dropped]
+        self.__base = InstanceID(low_water_mark + 1)
+
+        for instance in [instance for instance in self.__sparse if instance <= low_water_mark]:
+            del self.__sparse[instance]
+            self.__count -= 1
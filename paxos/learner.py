@@ -1,101 +1,175 @@
 #!/usr/bin/env python3
 
-from typing import NoReturn, Dict, List
-from copy import deepcopy
-import time
+from typing import Dict, List, Optional, Set, Tuple
 
 from .role import Role
 from .network import Network
-from .node import NodeID, Node, MessageT
+from .node import NodeID, Node
 from .message import MessageType, RoundID, PaxosValue, InstanceID
-from .message import Accept, AcceptPayload, Decide, DecidePayload, RequestAck, HeartBeat, CatchupRequest, \
-    CatchupResponse
-import pickle
+from .message import Accept, AcceptPayload, Decide, DecidePayload, DecideAck, HeartBeat, CatchupRequest, \
+    CatchupResponse, AcceptBatch, InstanceRange, DecideBatch
+from .decided_values import DecidedValues
+from .storage import DecisionLog
+from .timer import Timer
+from .tracing import TraceEvent
 
 
 class Learner(Node):
     HEARTBEAT_RATE = 0.33
     HEARTBEAT_TIMEOUT = 4.0
     CATCHUP_RATE = 3.0
-    CATCHUP_TIMEOUT = 0.5
-    CATCHUP_RESPONSE_MAX_ITEMS = 250  # ~ 2kB message
-
-    def __init__(self, id: NodeID, network: Network, plr: float, lifetime: float) -> None:
-        super().__init__(id, Role.LEARNER, network, plr, lifetime)
+    CATCHUP_RESPONSE_MAX_ITEMS = 250  # ~ 2kB message before compression
+    # Limits on the missing ranges carried by a request and on the values sent in reply to a single request
+    CATCHUP_REQUEST_MAX_RANGES = 64
+    CATCHUP_REQUEST_MAX_ITEMS = 2500
+    # Delay before asking for the next ranges when a response made progress but the learner still lags behind
+    CATCHUP_FOLLOWUP_DELAY = 0.05
+    # Maximum time (in sec) a decision stays in memory before being synced to the decision log
+    DECISION_LOG_SYNC_INTERVAL = 0.05
+    # Minimum time (in sec) between two progress reports to the launcher
+    PROGRESS_REPORT_INTERVAL = 0.05
+
+    def __init__(self, id: NodeID, network: Network, plr: float, lifetime: float, decision_log_path: str = None,
+                 **node_options) -> None:
+        super().__init__(id, Role.LEARNER, network, plr, lifetime, **node_options)
         self._message_callbacks = {
-            MessageType.ACCEPT: self.accept_phase_parallel,
+            MessageType.ACCEPT: self.accept_callback,
+            MessageType.ACCEPT_BATCH: self.accept_batch_callback,
             MessageType.DECIDE: self.decide,
+            MessageType.DECIDE_BATCH: self.decide_batch_callback,
             MessageType.HEARTBEAT: self.heartbeat_handler,
             MessageType.CATCHUP_REQUEST: self.catchup_request_callback,
             MessageType.CATCHUP_RESPONSE: self.catchup_response_callback
         }
-        self._decided_values: Dict[InstanceID, PaxosValue] = {}
-        self._accept_messages_received: Dict[InstanceID, Dict[RoundID, int]] = {}
+        # Decided values are appended to the decision log, the values logged by a previous run are recovered
+        if decision_log_path is None and network.shards > 1:
+            decision_log_path = 'results/shard{0}/learner{1}_decided_value'.format(network.shard, self.id)
+        elif decision_log_path is None:
+            decision_log_path = 'results/learner{}_decided_value'.format(self.id)
+        self._decision_log = DecisionLog(decision_log_path)
+        self._decision_log_sync_scheduled = False
+
+        self._decided_values = DecidedValues(self._decision_log.recover_decisions())
+        if self._decided_values:
+            self.log_warning("Recovered {0} decided values from the decision log".format(len(self._decided_values)))
+        # Acceptors that accepted the highest round seen so far for each undecided instance, as a bitmask indexed by
+        # acceptor ID; the entry of an instance is dropped as soon as it is decided
+        self._accept_quorums: Dict[InstanceID, Tuple[RoundID, int]] = {}
 
         # Perform leader election by continuously sending an heartbeat to other learners, if an heartbeat from the
         # leader is not received for enough time a new leader is elected
         self._leader_id: int = 0
         self._known_learners: List[int] = [self.id]
         self._last_heartbeat_sent: float = 0.0
-        self._last_heartbeat_leader: float = time.time()
+        self._last_heartbeat_leader: float = self.now
+        # Instances decided before any leader was elected, ACKed by this learner if it is elected
+        self._unacked_decisions: Set[InstanceID] = set()
+
+        # Highest decided instance announced by each learner in its catch-up requests, used to pick who serves ours
+        self._learner_progress: Dict[int, InstanceID] = {}
+        self._catchup_requests_sent: int = 0
+        self._catchup_followup: Optional[Timer] = None
+
+        # Watermark last reported to the launcher, if any
+        self._reported_watermark: InstanceID = InstanceID(0)
+        self._last_progress_report: float = 0.0
+
+        self.metrics.gauge('watermark', lambda: self._decided_values.watermark)
+        self.metrics.gauge('highest', lambda: self._decided_values.highest)
+        self.metrics.gauge('decided', lambda: len(self._decided_values))
+        self.metrics.gauge('catchup_requests', lambda: self._catchup_requests_sent)
 
-        self._time_last_catchup_sent: float = 0.0
+    def accept_callback(self, accept_message: Accept) -> None:
+        self.accept_phase_parallel(accept_message.sender_id, accept_message.payload)
 
-    def accept_phase_parallel(self, accept_message: Accept) -> None:
-        payload: AcceptPayload = accept_message.payload
+    def accept_batch_callback(self, accept_batch: AcceptBatch) -> None:
+        acceptor_id = accept_batch.sender_id
+        for payload in accept_batch.payload:
+            self.accept_phase_parallel(acceptor_id, payload)
+
+    def accept_phase_parallel(self, acceptor_id: NodeID, payload: AcceptPayload) -> None:
         acceptor_round: RoundID = payload[0]
         accepted_value: PaxosValue = payload[1]
         instance: InstanceID = payload[2]
 
-        if instance not in self._accept_messages_received:
-            self._accept_messages_received[instance] = {}
-            self._accept_messages_received[instance][acceptor_round] = 1
-        elif acceptor_round not in self._accept_messages_received[instance]:
-            self._accept_messages_received[instance][acceptor_round] = 1
+        if instance in self._decided_values:
+            return
+
+        # Only the acceptors of the highest round are counted, each of them once even if its Accept is retransmitted
+        tracked = self._accept_quorums.get(instance)
+        if tracked is None or acceptor_round > tracked[0]:
+            acceptors = 0
+        elif acceptor_round == tracked[0]:
+            acceptors = tracked[1]
         else:
-            self._accept_messages_received[instance][acceptor_round] += 1
+            return
+        acceptors |= 1 << acceptor_id
 
-        if self._accept_messages_received[instance][acceptor_round] == self.net.quorum_size:
-            self._decided_values[instance] = accepted_value
-            self.log_debug("DECIDED value {0} for instance {1}".format(self._decided_values[instance], instance))
+        if bin(acceptors).count('1') < self.net.phase2_quorum_size:
+            self._accept_quorums[instance] = (acceptor_round, acceptors)
+        else:
+            self._accept_quorums.pop(instance, None)
+            self.record_decision(instance, accepted_value)
+            self.metrics.increment('decided_by_accepts')
+            self.trace(TraceEvent.LEARNER_DECIDED, instance)
+            self.log_debug("DECIDED value {0} for instance {1}".format(accepted_value, instance))
+            self.ack_decision(instance)
 
-            file = open('results/learner{}_decided_value'.format(self.id), "wb")
-            pickle.dump(dict(sorted(self._decided_values.items())), file=file)
-            file.close()
+    def decide(self, decide_message: Decide) -> None:
+        self.decide_parallel(decide_message.payload)
 
-            if self.id == self._leader_id:
-                # send ACK to proposers for current instance
-                ack_message: RequestAck = RequestAck(sender=self,
-                                                     receiver_role=Role.PROPOSER,
-                                                     payload=instance)
-                self.send(ack_message)
+    def decide_batch_callback(self, decide_batch: DecideBatch) -> None:
+        for payload in decide_batch.payload:
+            self.decide_parallel(payload)
 
-    def decide(self, decide_message: Decide) -> None:
-        payload: DecidePayload = decide_message.payload
+    def decide_parallel(self, payload: DecidePayload) -> None:
         decided_value: PaxosValue = payload[0]
         instance: InstanceID = payload[1]
 
-        if instance not in self._decided_values.keys():
-            self._decided_values[instance] = decided_value
-            file = open('results/learner{}_decided_value'.format(self.id), "wb")
-            pickle.dump(dict(sorted(self._decided_values.items())), file=file)
-            file.close()
+        if instance not in self._decided_values:
+            self.record_decision(instance, decided_value)
+            self.metrics.increment('decided_by_decide')
+            self.trace(TraceEvent.LEARNER_DECIDE_MESSAGE, instance)
+        # A Decide for a decided instance is retransmitted by a proposer that missed the ACK: ACK it again
+        self.ack_decision(instance)
+
+    def ack_decision(self, instance: InstanceID) -> None:
+        """
+        The leader ACKs the decided instances to the proposers, which can then reclaim their state
+        """
+        if self._leader_id == 0:
+            self._unacked_decisions.add(instance)
+        elif self.id == self._leader_id:
+            ack_message: DecideAck = DecideAck(sender=self,
+                                               receiver_role=Role.PROPOSER,
+                                               payload=instance)
+            self.send(ack_message)
+
+    def record_decision(self, instance: InstanceID, value: PaxosValue) -> None:
+        """
+        Store a decided value and append it to the decision log, which is synced in batches
+        """
+        if not self._decided_values.add(instance, value):
+            return
+
+        self._accept_quorums.pop(instance, None)
+        self._decision_log.append_decision(instance, value)
+        if not self._decision_log_sync_scheduled:
+            self._decision_log_sync_scheduled = True
+            self.schedule(Learner.DECISION_LOG_SYNC_INTERVAL, self.sync_decision_log)
 
-            if self.id == self._leader_id:
-                # send ACK to proposers for current instance
-                ack_message: RequestAck = RequestAck(sender=self,
-                                                     receiver_role=Role.PROPOSER,
-                                                     payload=instance)
-                self.send(ack_message)
+    def sync_decision_log(self) -> None:
+        self._decision_log_sync_scheduled = False
+        self._decision_log.sync()
 
     # --- LEADER ELECTION ORACLE LOGIC --- #
     def send_heartbeat(self) -> None:
-        if (time.time() - self._last_heartbeat_sent) > Learner.HEARTBEAT_RATE or self._last_heartbeat_sent == 0.0:
+        if (self.now - self._last_heartbeat_sent) > Learner.HEARTBEAT_RATE or self._last_heartbeat_sent == 0.0:
             heatbeat: HeartBeat = HeartBeat(sender=self,
                                             receiver_role=Role.LEARNER,
                                             payload=self.id)
             self.send(heatbeat)
-            self._last_heartbeat_sent = time.time()
+            self._last_heartbeat_sent = self.now
 
     def heartbeat_handler(self, hearbeat: HeartBeat) -> None:
         id: float = hearbeat.payload
@@ -104,100 +178,161 @@ class Learner(Node):
             self._known_learners.append(id)
 
         if id == self._leader_id:
-            self._last_heartbeat_leader = time.time()
+            self._last_heartbeat_leader = self.now
 
     def check_leader_timeout(self) -> None:
         if self.id == self._leader_id:
             return
 
-        if (time.time() - self._last_heartbeat_leader) > self.HEARTBEAT_TIMEOUT:
+        if (self.now - self._last_heartbeat_leader) > self.HEARTBEAT_TIMEOUT:
             if self._leader_id in self._known_learners:
                 self._known_learners.remove(self._leader_id)
             self._leader_id = min(self._known_learners)
             self.log_warning("Elected learner {0} as the new leader".format(self._leader_id, self.id))
             self.send_heartbeat()
-            self._last_heartbeat_sent = time.time()
-            self._last_heartbeat_leader = time.time()
+            self._last_heartbeat_sent = self.now
+            self._last_heartbeat_leader = self.now
+
+            unacked, self._unacked_decisions = self._unacked_decisions, set()
+            for instance in sorted(unacked):
+                self.ack_decision(instance)
 
     # ------------------------------------ #
 
     # --- LEARNER CATCH-UP LOGIC --- #
     def send_catchup_request(self) -> None:
-        if self.id == self._leader_id:
-            return
-
-        if (time.time() - self._time_last_catchup_sent) > Learner.CATCHUP_RATE:
-            catchup_request: CatchupRequest = CatchupRequest(sender=self,
-                                                             receiver_role=Role.LEARNER,
-                                                             payload=None
-                                                             )
-            self.send(catchup_request)
-            self._time_last_catchup_sent = time.time()
+        """
+        Periodically ask for the missing decided values, this timer re-arms itself.
+        Requests are sent by every learner, also announcing its progress to the others.
+        """
+        self.schedule(Learner.CATCHUP_RATE, self.send_catchup_request)
+        self.request_missing_ranges()
+
+    def request_missing_ranges(self) -> None:
+        self._catchup_followup = None
+        catchup_request: CatchupRequest = CatchupRequest(sender=self,
+                                                         receiver_role=Role.LEARNER,
+                                                         payload=(self.select_catchup_source(),
+                                                                  self._decided_values.watermark,
+                                                                  self._decided_values.highest,
+                                                                  self.missing_ranges())
+                                                         )
+        self.send(catchup_request)
+        self._catchup_requests_sent += 1
+
+    def missing_ranges(self) -> List[InstanceRange]:
+        """
+        Ranges of undecided instances between the watermark and the highest decided instance
+        """
+        ranges: List[InstanceRange] = []
+        first = None
+        for instance in range(self._decided_values.watermark + 1, self._decided_values.highest + 1):
+            if instance in self._decided_values:
+                if first is not None:
+                    ranges.append(InstanceRange((first, instance - 1)))
+                    first = None
+                    if len(ranges) == Learner.CATCHUP_REQUEST_MAX_RANGES:
+                        break
+            elif first is None:
+                first = instance
+        return ranges
+
+    def select_catchup_source(self) -> int:
+        """
+        Names the single learner that serves the request: the requests are rotated among the learners known to be
+        ahead of this one, so that a single slow learner does not throttle the catch-up; before knowing the progress
+        of the others the leader is asked, or the other learners in turn if this is the leader or none is elected yet.
+        Returns 0 if no other learner is known, then the request only announces the progress of this one
+        """
+        sources = sorted(learner for learner, highest in self._learner_progress.items()
+                         if highest > self._decided_values.watermark and learner in self._known_learners)
+        if not sources:
+            if self._leader_id not in (0, self.id):
+                return self._leader_id
+            sources = sorted(learner for learner in self._known_learners if learner != self.id)
+            if not sources:
+                return 0
+        return sources[self._catchup_requests_sent % len(sources)]
 
     def catchup_request_callback(self, request: CatchupRequest) -> None:
-        if self.id is not self._leader_id:
+        source, watermark, highest, ranges = request.payload
+        if request.sender_id == self.id:
+            return
+        self._learner_progress[request.sender_id] = highest
+        if source != self.id or self._decided_values.highest <= watermark:
             return
 
-        # Response may get too big, so it is split into multiple messages
-        max_len = Learner.CATCHUP_RESPONSE_MAX_ITEMS
-        n_chunks = len(self._decided_values) // max_len
-
-        for i in range(n_chunks):
-            if (time.time() - self._time_last_catchup_sent) > Learner.CATCHUP_RATE:
-                chunk: Dict[InstanceID, PaxosValue] = {k:self._decided_values[k] for k in list(
-                    self._decided_values.keys())[max_len * i:max_len * i + max_len]
-                                                       }
-                catchup_response: CatchupResponse = CatchupResponse(sender=self,
-                                                                    receiver_role=Role.LEARNER,
-                                                                    payload=deepcopy(chunk))
-
-                self.send(catchup_response)
-        if len(self._decided_values) % max_len > 0:
-            chunk: Dict[InstanceID, PaxosValue] = {k: self._decided_values[k] for k in list(
-                self._decided_values.keys())[max_len * n_chunks:]
-                                                   }
-            catchup_response: CatchupResponse = CatchupResponse(sender=self,
-                                                                receiver_role=Role.LEARNER,
-                                                                payload=deepcopy(chunk))
-
-            self.send(catchup_response)
+        # Serve the missing ranges, then the instances decided after the highest one known by the requester
+        ranges = ranges + [(highest + 1, self._decided_values.highest)]
+        budget = Learner.CATCHUP_REQUEST_MAX_ITEMS
+        chunk: Dict[InstanceID, PaxosValue] = {}
+        for first, last in ranges:
+            for instance in range(first, min(last, self._decided_values.highest) + 1):
+                if instance not in self._decided_values:
+                    continue
+                chunk[instance] = self._decided_values[instance]
+                budget -= 1
+                # Response may get too big, so it is split into multiple messages
+                if len(chunk) == Learner.CATCHUP_RESPONSE_MAX_ITEMS or budget == 0:
+                    self.send_catchup_response(chunk)
+                    chunk = {}
+                if budget == 0:
+                    return
+        if chunk:
+            self.send_catchup_response(chunk)
+
+    def send_catchup_response(self, chunk: Dict[InstanceID, PaxosValue]) -> None:
+        catchup_response: CatchupResponse = CatchupResponse(sender=self,
+                                                            receiver_role=Role.LEARNER,
+                                                            payload=chunk)
+        self.send(catchup_response)
+        self.metrics.increment('catchup_values_served', len(chunk))
 
     def catchup_response_callback(self, response: CatchupResponse) -> None:
-        sender_id: int = response.sender_id
         decided_values: Dict[InstanceID, PaxosValue] = response.payload
-        if sender_id is not self._leader_id:
-            return
-
-        self._decided_values.update(decided_values)
-
-        file = open('results/learner{}_decided_value'.format(self.id), "wb")
-        pickle.dump(dict(sorted(self._decided_values.items())), file=file)
-        file.close()
-
-    def check_catchup_timeout(self):
-        if not self._last_catchup_acked and (time.time() - self._time_last_catchup_sent) > Learner.CATCHUP_TIMEOUT:
-            # send new catch up
-            Learner.CATCHUP_TIMEOUT *= 2.0
-            self.send_catchup_request()
+        watermark = self._decided_values.watermark
+        for instance, value in decided_values.items():
+            if instance not in self._decided_values:
+                self.record_decision(instance, value)
+                self.metrics.increment('decided_by_catchup')
+                self.trace(TraceEvent.LEARNER_CATCHUP, instance)
+
+        if decided_values:
+            self._learner_progress[response.sender_id] = max(max(decided_values),
+                                                             self._learner_progress.get(response.sender_id, 0))
+
+        # Responses are multicast to all the learners, any of them that made progress and still lags behind the
+        # sender asks for the next ranges right away
+        behind = self._learner_progress.get(response.sender_id, InstanceID(0)) > self._decided_values.watermark
+        if self._decided_values.watermark > watermark and behind and self._catchup_followup is None:
+            self._catchup_followup = self.schedule(Learner.CATCHUP_FOLLOWUP_DELAY, self.request_missing_ranges)
 
     # ---------------------------------- #
 
-    def run(self) -> NoReturn:
-        self.log_info("Start running...")
-        start = time.time()
-
-        self._last_heartbeat_leader: float = time.time()
-        while True:
-            if self.lifetime > 0.0:
-                if time.time()-start > self.lifetime:
-                    self.log_warning("Terminating...")
-                    break
-
-            self.send_heartbeat()
-            self.send_catchup_request()
-
-            message: MessageT = self.listen()
-            if message is not None and message.message_type in self._message_callbacks:
-                self._message_callbacks[message.message_type](message)
-
-            self.check_leader_timeout()
+    def on_start(self) -> None:
+        self._last_heartbeat_leader = self.now
+        self.send_catchup_request()
+
+    def on_stop(self) -> None:
+        self._decision_log.close()
+
+    def tick(self) -> None:
+        self.check_leader_timeout()
+        self.send_heartbeat()
+        self.report_progress()
+
+    def report_progress(self) -> None:
+        watermark = self._decided_values.watermark
+        if watermark != self._reported_watermark and \
+                self.now - self._last_progress_report >= Learner.PROGRESS_REPORT_INTERVAL:
+            self.report('progress', watermark=watermark, decided=len(self._decided_values))
+            self._reported_watermark = watermark
+            self._last_progress_report = self.now
+
+    def next_wakeup(self) -> float:
+        wakeup = self._last_heartbeat_sent + Learner.HEARTBEAT_RATE
+        if self._decided_values.watermark != self._reported_watermark:
+            wakeup = min(wakeup, self._last_progress_report + Learner.PROGRESS_REPORT_INTERVAL)
+        if self.id != self._leader_id:
+            wakeup = min(wakeup, self._last_heartbeat_leader + Learner.HEARTBEAT_TIMEOUT)
+        return wakeup
@@ -0,0 +1,66 @@
+# Leader leases.
+#
+# The leader piggybacks a lease request on its heartbeats to the acceptors. An acceptor grants the lease to a proposer
+# for LEASE_DURATION seconds of its own clock, starting when it receives the request, and while the lease is granted
+# it refuses the Prepare and Propose messages of every other proposer, so no other proposer can complete phase 1, nor
+# get a value decided with a round it was promised before the lease was granted. The leader considers its lease valid once a quorum of acceptors granted the same request, until
+# LEASE_DURATION seconds after it sent the request, shortened by the maximum clock drift between nodes: the lease
+# always expires at the leader before it expires at any acceptor.
+#
+# The lease is granted by a quorum that intersects every phase 1 quorum and every phase 2 quorum (see lease_quorum_size),
+# so while it is valid no other proposer can gather the promises of a phase 1 quorum or the accepts of a phase 2
+# quorum.
+#
+# The lease is shorter than the heartbeat timeout of the proposers, so when a leader fails its lease has expired at
+# the acceptors by the time the next leader is elected.
+
+# Duration (in sec) of a lease granted by an acceptor
+LEASE_DURATION = 2.0
+# Maximum relative drift between the clocks of two nodes
+LEASE_CLOCK_DRIFT = 0.1
+
+
+def lease_quorum_size(acceptors: int, phase1_quorum_size: int, phase2_quorum_size: int) -> int:
+    """
+    Grants making a lease valid: enough acceptors to intersect the smallest quorum of both phases
+    """
+    return acceptors - min(phase1_quorum_size, phase2_quorum_size) + 1
+
+
+class LeaderLease:
+    """
+    Lease held by a leader proposer, renewed by a new request at every heartbeat
+    """
+
+    def __init__(self, quorum_size: int) -> None:
+        self.__quorum_size = quorum_size
+        # Sequence number and sending time of the latest request, with the acceptors that granted it
+        self.__sequence = 0
+        self.__requested_at = 0.0
+        self.__grants = 0
+        self.__expiry = 0.0
+
+    def request(self, now: float) -> int:
+        """
+        Starts a new lease request, returns its sequence number
+        """
+        self.__sequence += 1
+        self.__requested_at = now
+        self.__grants = 0
+        return self.__sequence
+
+    def granted(self, sequence: int, acceptor_id: int) -> None:
+        if sequence != self.__sequence:
+            return
+        self.__grants |= 1 << acceptor_id
+        if bin(self.__grants).count('1') >= self.__quorum_size:
+            self.__expiry = max(self.__expiry, self.__requested_at + LEASE_DURATION * (1.0 - LEASE_CLOCK_DRIFT))
+
+    def valid(self, now: float) -> bool:
+        return now < self.__expiry
+
+    def revoke(self) -> None:
+        # Grants of the pending request arriving later are ignored
+        self.__sequence += 1
+        self.__grants = 0
+        self.__expiry = 0.0
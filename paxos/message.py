@@ -1,11 +1,14 @@
 from abc import ABC as Abstract, abstractmethod
-from copy import deepcopy
-from typing import NewType
+from enum import IntEnum
+from typing import NewType, TYPE_CHECKING
 from typing import Tuple, List, Dict
 
 from paxos.message_type import MessageType
 from paxos.role import Role
-from paxos.node import Node, NodeID
+
+if TYPE_CHECKING:
+    # Only needed for annotations, the node module depends on the wire codec which depends on this module
+    from paxos.node import Node, NodeID
 
 # Round ID type.
 # This is a measure of message "Freshness".
@@ -23,57 +26,96 @@ InstanceID = NewType('InstanceID', int)
 # This is a package, sent in a datagram.
 # Consists of sequence id, aka timestamp,
 # paxos id, and the proposed or decided paxos value.
-PreparePayload = NewType('PreparePayload', Tuple[RoundID, InstanceID, bool])
+PreparePayload = NewType('PreparePayload', Tuple[RoundID, InstanceID])
 PromisePayload = NewType('PromisePayload', Tuple[RoundID, RoundID, PaxosValue, InstanceID])
-ProposePayload = NewType('ProposePayload', Tuple[RoundID, PaxosValue, InstanceID, bool])
+ProposePayload = NewType('ProposePayload', Tuple[RoundID, PaxosValue, InstanceID])
 AcceptPayload = NewType('AcceptPayload', Tuple[RoundID, PaxosValue, InstanceID])
 ClientProposePayload = NewType('ClientProposePayload', Tuple[PaxosValue, InstanceID])
 DecidePayload = NewType('DecidePayload', Tuple[PaxosValue, InstanceID])
 
+# Batched payloads carry the payloads of many instances in a single datagram
+PrepareBatchPayload = NewType('PrepareBatchPayload', List[PreparePayload])
+PromiseBatchPayload = NewType('PromiseBatchPayload', List[PromisePayload])
+ProposeBatchPayload = NewType('ProposeBatchPayload', List[ProposePayload])
+AcceptBatchPayload = NewType('AcceptBatchPayload', List[AcceptPayload])
+DecideBatchPayload = NewType('DecideBatchPayload', List[DecidePayload])
+
+# A stable leader runs phase 1 once for all the instances starting from the given one; acceptors promise the ballot
+# for the whole range and report the (instance, accepted round, accepted value) of every value accepted in the
+# range, split in multiple messages if needed: every message carries its index and the number of messages of the
+# promise, which counts only once all of them are received
+PrepareRangePayload = NewType('PrepareRangePayload', Tuple[RoundID, InstanceID])
+AcceptedEntry = NewType('AcceptedEntry', Tuple[InstanceID, RoundID, PaxosValue])
+PromiseRangePayload = NewType('PromiseRangePayload', Tuple[RoundID, InstanceID, int, int, List[AcceptedEntry]])
+
+# Lease requests carry the sequence number of the request, the leader round of the proposer and its ACK watermark (all
+# the instances up to it are known to the learners); grants carry the ID of the proposer the lease was granted to, the
+# sequence number of its request and the low-water mark of the acceptor
+LeaseRequestPayload = NewType('LeaseRequestPayload', Tuple[int, RoundID, InstanceID])
+LeaseGrantPayload = NewType('LeaseGrantPayload', Tuple[int, int, InstanceID])
+
+# Reads of the decided log served by the leader: a request carries the ID chosen by the client and the instance to
+# read, the response the ID of the client, the ID of its request, the instance, its ReadStatus and its decided value
+class ReadStatus(IntEnum):
+    UNDECIDED = 0
+    DECIDED = 1
+    # Decided before the decided log of the leader knew it, or dropped from it: to be read from a learner
+    UNAVAILABLE = 2
+
+
+ReadRequestPayload = NewType('ReadRequestPayload', Tuple[int, InstanceID])
+ReadResponsePayload = NewType('ReadResponsePayload', Tuple[int, int, InstanceID, ReadStatus, PaxosValue])
+
+# Catch-up requests carry the ID of the learner asked to serve them (0 for any learner), the watermark of the
+# requester (all the instances up to it are decided), the highest instance it decided and the (first, last) ranges
+# of missing instances in between
+InstanceRange = NewType('InstanceRange', Tuple[InstanceID, InstanceID])
+CatchupRequestPayload = NewType('CatchupRequestPayload', Tuple[int, InstanceID, InstanceID, List[InstanceRange]])
+
 
 class Message(Abstract):
     """
     Immutable message type, which is composed and received by Nodes.
+    Messages are slotted records read through plain accessors, the type of a message is a constant of its class.
     """
+    __slots__ = ('_sender_id', '_sender_role', '_receiver_role', '_payload')
+
+    message_type: MessageType = None
 
     # ---- Constructors ---- #
 
     def __init__(self,
-                 sender: Node,
+                 sender: 'Node',
                  receiver_role: Role,
-                 message_type: MessageType
+                 payload
                  ) -> None:
         """
         Default constructor
         """
-        self.__sender_id = sender.id
-        self.__sender_role = sender.role
-        self.__receiver_role = receiver_role
-        self.__message_type = message_type
+        self._sender_id = sender.id
+        self._sender_role = sender.role
+        self._receiver_role = receiver_role
+        self._payload = payload
 
     # ---- Public readonly fields ---- #
 
     @property
-    def sender_id(self) -> NodeID:
+    def sender_id(self) -> 'NodeID':
         """
         Gets the id of the
         """
-        return deepcopy(self.__sender_id)
+        return self._sender_id
 
     @property
     def sender_role(self) -> Role:
         """
         Gets the role of receiver
         """
-        return deepcopy(self.__sender_role)
+        return self._sender_role
 
     @property
     def receiver_role(self) -> Role:
-        return deepcopy(self.__receiver_role)
-
-    @property
-    def message_type(self) -> MessageType:
-        return deepcopy(self.__message_type)
+        return self._receiver_role
 
     @property
     @abstractmethod
@@ -82,154 +124,198 @@ class Message(Abstract):
 
 
 class Prepare(Message):
-    def __init__(self,
-                 sender: Node,
-                 receiver_role: Role,
-                 payload: PreparePayload
-                 ) -> None:
-        super().__init__(sender, receiver_role, message_type=MessageType.PREPARE)
-        self.__payload = payload
+    __slots__ = ()
+    message_type = MessageType.PREPARE
 
     @property
     def payload(self) -> PreparePayload:
-        return self.__payload
+        return self._payload
 
 
 class Promise(Message):
-    def __init__(self,
-                 sender: Node,
-                 receiver_role: Role,
-                 payload: PromisePayload
-                 ) -> None:
-        super().__init__(sender, receiver_role, message_type=MessageType.PROMISE)
-        self.__payload = payload
+    __slots__ = ()
+    message_type = MessageType.PROMISE
 
     @property
     def payload(self) -> PromisePayload:
-        return self.__payload
+        return self._payload
 
 
 class Propose(Message):
-    def __init__(self,
-                 sender: Node,
-                 receiver_role: Role,
-                 payload: ProposePayload
-                 ) -> None:
-        super().__init__(sender, receiver_role, message_type=MessageType.PROPOSE)
-        self.__payload = payload
+    __slots__ = ()
+    message_type = MessageType.PROPOSE
 
     @property
     def payload(self) -> ProposePayload:
-        return self.__payload
+        return self._payload
 
 
 class Accept(Message):
-    def __init__(self,
-                 sender: Node,
-                 receiver_role: Role,
-                 payload: AcceptPayload
-                 ) -> None:
-        super().__init__(sender, receiver_role, message_type=MessageType.ACCEPT)
-        self.__payload = payload
+    __slots__ = ()
+    message_type = MessageType.ACCEPT
 
     @property
     def payload(self) -> AcceptPayload:
-        return self.__payload
+        return self._payload
 
 
 class ClientPropose(Message):
-    def __init__(self,
-                 sender: Node,
-                 receiver_role: Role,
-                 payload: ClientProposePayload
-                 ) -> None:
-        super().__init__(sender, receiver_role, message_type=MessageType.CLIENT_PROPOSE)
-        self.__payload = payload
+    __slots__ = ()
+    message_type = MessageType.CLIENT_PROPOSE
 
     @property
     def payload(self) -> ClientProposePayload:
-        return self.__payload
+        return self._payload
 
 
 class Decide(Message):
-    def __init__(self,
-                 sender: Node,
-                 receiver_role: Role,
-                 payload: DecidePayload
-                 ) -> None:
-        super().__init__(sender, receiver_role, message_type=MessageType.DECIDE)
-        self.__payload = payload
+    __slots__ = ()
+    message_type = MessageType.DECIDE
 
     @property
     def payload(self) -> DecidePayload:
-        return self.__payload
+        return self._payload
 
 
 class RequestAck(Message):
-    def __init__(self,
-                 sender: Node,
-                 receiver_role: Role,
-                 payload: InstanceID
-                 ) -> None:
-        super().__init__(sender, receiver_role, message_type=MessageType.REQUEST_ACK)
-        self.__payload = payload
+    __slots__ = ()
+    message_type = MessageType.REQUEST_ACK
 
     @property
     def payload(self) -> InstanceID:
-        return self.__payload
+        return self._payload
 
 
 class DecideAck(Message):
-    def __init__(self,
-                 sender: Node,
-                 receiver_role: Role,
-                 payload: InstanceID
-                 ) -> None:
-        super().__init__(sender, receiver_role, message_type=MessageType.DECIDE_ACK)
-        self.__payload = payload
+    __slots__ = ()
+    message_type = MessageType.DECIDE_ACK
 
     @property
     def payload(self) -> InstanceID:
-        return self.__payload
+        return self._payload
 
 
 class HeartBeat(Message):
-    def __init__(self,
-                 sender: Node,
-                 receiver_role: Role,
-                 payload: int
-                 ) -> None:
-        super().__init__(sender, receiver_role, message_type=MessageType.HEARTBEAT)
-        self.__payload = payload
+    __slots__ = ()
+    message_type = MessageType.HEARTBEAT
 
     @property
     def payload(self) -> int:
-        return self.__payload
+        return self._payload
 
 
 class CatchupRequest(Message):
-    def __init__(self,
-                 sender: Node,
-                 receiver_role: Role,
-                 payload: None
-                 ) -> None:
-        super().__init__(sender, receiver_role, message_type=MessageType.CATCHUP_REQUEST)
-        self.__payload = payload
+    __slots__ = ()
+    message_type = MessageType.CATCHUP_REQUEST
 
     @property
-    def payload(self) -> None:
-        return self.__payload
+    def payload(self) -> CatchupRequestPayload:
+        return self._payload
 
 
 class CatchupResponse(Message):
-    def __init__(self,
-                 sender: Node,
-                 receiver_role: Role,
-                 payload: Dict[InstanceID, PaxosValue]
-                 ) -> None:
-        super().__init__(sender, receiver_role, message_type=MessageType.CATCHUP_RESPONSE)
-        self.__payload = payload
+    __slots__ = ()
+    message_type = MessageType.CATCHUP_RESPONSE
 
     @property
     def payload(self) -> Dict[InstanceID, PaxosValue]:
-        return self.__payload
+        return self._payload
+
+
+class PrepareBatch(Message):
+    __slots__ = ()
+    message_type = MessageType.PREPARE_BATCH
+
+    @property
+    def payload(self) -> PrepareBatchPayload:
+        return self._payload
+
+
+class PromiseBatch(Message):
+    __slots__ = ()
+    message_type = MessageType.PROMISE_BATCH
+
+    @property
+    def payload(self) -> PromiseBatchPayload:
+        return self._payload
+
+
+class ProposeBatch(Message):
+    __slots__ = ()
+    message_type = MessageType.PROPOSE_BATCH
+
+    @property
+    def payload(self) -> ProposeBatchPayload:
+        return self._payload
+
+
+class AcceptBatch(Message):
+    __slots__ = ()
+    message_type = MessageType.ACCEPT_BATCH
+
+    @property
+    def payload(self) -> AcceptBatchPayload:
+        return self._payload
+
+
+class DecideBatch(Message):
+    __slots__ = ()
+    message_type = MessageType.DECIDE_BATCH
+
+    @property
+    def payload(self) -> DecideBatchPayload:
+        return self._payload
+
+
+class PrepareRange(Message):
+    __slots__ = ()
+    message_type = MessageType.PREPARE_RANGE
+
+    @property
+    def payload(self) -> PrepareRangePayload:
+        return self._payload
+
+
+class PromiseRange(Message):
+    __slots__ = ()
+    message_type = MessageType.PROMISE_RANGE
+
+    @property
+    def payload(self) -> PromiseRangePayload:
+        return self._payload
+
+
+class LeaseRequest(Message):
+    __slots__ = ()
+    message_type = MessageType.LEASE_REQUEST
+
+    @property
+    def payload(self) -> LeaseRequestPayload:
+        return self._payload
+
+
+class LeaseGrant(Message):
+    __slots__ = ()
+    message_type = MessageType.LEASE_GRANT
+
+    @property
+    def payload(self) -> LeaseGrantPayload:
+        return self._payload
+
+
+class ReadRequest(Message):
+    __slots__ = ()
+    message_type = MessageType.READ_REQUEST
+
+    @property
+    def payload(self) -> ReadRequestPayload:
+        return self._payload
+
+
+class ReadResponse(Message):
+    __slots__ = ()
+    message_type = MessageType.READ_RESPONSE
+
+    @property
+    def payload(self) -> ReadResponsePayload:
+        return self._payload
@@ -17,3 +17,14 @@ class MessageType(Enum):
     HEARTBEAT = 8
     CATCHUP_REQUEST = 9
     CATCHUP_RESPONSE = 10
+    PREPARE_BATCH = 11
+    PROMISE_BATCH = 12
+    PROPOSE_BATCH = 13
+    ACCEPT_BATCH = 14
+    PREPARE_RANGE = 15
+    PROMISE_RANGE = 16
+    LEASE_REQUEST = 17
+    LEASE_GRANT = 18
+    READ_REQUEST = 19
+    READ_RESPONSE = 20
+    DECIDE_BATCH = 21
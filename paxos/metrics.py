@@ -0,0 +1,121 @@
+# Metrics of a node.
+#
+# Every node counts the messages it sends and receives per message type, and the roles record counters and
+# histograms of their activity: recording is a dict increment, or a few arithmetic operations for a histogram, so it
+# is always enabled. Gauges are callbacks evaluated only when a snapshot is taken, so they cost nothing in the node
+# loop. A node started with --metrics=<directory> writes a JSON snapshot of its metrics to
+# <directory>/<role><ID>.json (<role><ID>_shard<k>.json in a sharded deployment) every METRICS_INTERVAL seconds and
+# when it stops; the file is replaced atomically, so it can be read at any time.
+
+from collections import defaultdict
+from typing import Callable, Dict, Optional
+import json
+import math
+import os
+
+# Time (in sec) between two snapshots written by a node
+METRICS_INTERVAL = 1.0
+
+
+class Histogram:
+    """
+    Distribution of positive values in buckets whose upper bounds grow by powers of 2 from the base
+    """
+    __slots__ = ('base', 'buckets', 'count', 'total', 'maximum')
+    BUCKETS = 40
+
+    def __init__(self, base: float) -> None:
+        self.base = base
+        self.buckets = [0] * Histogram.BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        if value > self.maximum:
+            self.maximum = value
+        # The exponent e of value / base = m * 2^e, with 0.5 <= m < 1, is the bucket with upper bound base * 2^e,
+        # except for exact powers of 2 which are the upper bound of the bucket below
+        bucket = 0
+        if value > self.base:
+            mantissa, bucket = math.frexp(value / self.base)
+            if mantissa == 0.5:
+                bucket -= 1
+        self.buckets[min(bucket, Histogram.BUCKETS - 1)] += 1
+
+    def quantile(self, fraction: float) -> Optional[float]:
+        """
+        Upper bound of the bucket holding the given quantile, None if no value was observed
+        """
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        for bucket, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank and count:
+                return min(self.base * 2 ** bucket, self.maximum)
+        return self.maximum
+
+    def snapshot(self) -> dict:
+        return {
+            'count': self.count,
+            'sum': self.total,
+            'max': self.maximum,
+            'p50': self.quantile(0.5),
+            'p99': self.quantile(0.99),
+            # Upper bound of every bucket holding some value, with its count
+            'buckets': {'{0:.6g}'.format(self.base * 2 ** bucket): count
+                        for bucket, count in enumerate(self.buckets) if count},
+        }
+
+
+class Metrics:
+    """
+    Counters, histograms and gauges of a node
+    """
+    # Smallest bucket of the histograms of latencies (in sec) and of counts
+    LATENCY_BASE = 1e-6
+    COUNT_BASE = 1.0
+
+    def __init__(self) -> None:
+        self.counters: Dict[str, int] = defaultdict(int)
+        # Datagrams sent and messages received, by message type
+        self.sent = defaultdict(int)
+        self.received = defaultdict(int)
+        self.histograms: Dict[str, Histogram] = {}
+        self.gauges: Dict[str, Callable[[], float]] = {}
+
+    def increment(self, counter: str, amount: int = 1) -> None:
+        self.counters[counter] += amount
+
+    def histogram(self, name: str, base: float = LATENCY_BASE) -> Histogram:
+        """
+        Registers a histogram, to be kept by the role to observe values without looking it up
+        """
+        histogram = self.histograms[name] = Histogram(base)
+        return histogram
+
+    def gauge(self, name: str, callback: Callable[[], float]) -> None:
+        self.gauges[name] = callback
+
+    def snapshot(self) -> dict:
+        return {
+            'counters': dict(self.counters),
+            'sent': {message_type.name: count for message_type, count in self.sent.items()},
+            'received': {message_type.name: count for message_type, count in self.received.items()},
+            'gauges': {name: callback() for name, callback in self.gauges.items()},
+            'histograms': {name: histogram.snapshot() for name, histogram in self.histograms.items()},
+        }
+
+    @staticmethod
+    def write(path: str, snapshot: dict) -> None:
+        """
+        Writes a snapshot to path, replacing the previous one atomically
+        """
+        temporary_path = path + '.tmp'
+        with open(temporary_path, 'w') as file:
+            json.dump(snapshot, file, indent=1)
+        os.replace(temporary_path, path)
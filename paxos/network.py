@@ -1,6 +1,5 @@
 from typing import Tuple, NewType
 from paxos.role import Role
-from copy import deepcopy
 import socket
 import struct
 
@@ -9,17 +8,42 @@ NetworkGroup = NewType('NetworkGroup', Tuple[str, int])
 
 class Network:
     SOCKET_BUFFSIZE = 2**16
+    # Kernel receive buffer requested for the receiver sockets, capped by the OS; bursts of batched messages overflow
+    # the default one while the node is busy handling the previous ones
+    SOCKET_RECEIVE_BUFFER = 2**22
 
     def __init__(self,
                  quorum_size: int,
                  clients: NetworkGroup,
                  proposers: NetworkGroup,
                  acceptors: NetworkGroup,
-                 learners: NetworkGroup):
+                 learners: NetworkGroup,
+                 acceptor_count: int = None,
+                 phase1_quorum: int = None,
+                 phase2_quorum: int = None,
+                 shard: int = 0,
+                 shards: int = 1):
         """
-        Default constructor
+        Default constructor.
+        By default there are 2 * quorum_size - 1 acceptors and both phases use quorums of quorum_size acceptors; the
+        quorums of the two phases can be sized independently as long as every phase 1 quorum intersects every phase
+        2 quorum, so that a new leader always learns the values that may have been decided.
+        In a sharded deployment the groups are the ones of the given shard, out of shards (see shard.py)
         """
         self.quorum_size = quorum_size
+        self.acceptor_count = acceptor_count if acceptor_count is not None else 2 * quorum_size - 1
+        # Promises needed to complete phase 1 and accepts needed to decide a value
+        self.phase1_quorum_size = phase1_quorum if phase1_quorum is not None else quorum_size
+        self.phase2_quorum_size = phase2_quorum if phase2_quorum is not None else quorum_size
+        self.shard = shard
+        self.shards = shards
+
+        assert 0 < self.phase1_quorum_size <= self.acceptor_count and 0 < self.phase2_quorum_size <= self.acceptor_count, \
+            "Quorum sizes should be between 1 and the number of acceptors ({0})".format(self.acceptor_count)
+        assert self.phase1_quorum_size + self.phase2_quorum_size > self.acceptor_count, \
+            "Phase 1 and phase 2 quorums of {0} and {1} acceptors out of {2} do not intersect".format(
+                self.phase1_quorum_size, self.phase2_quorum_size, self.acceptor_count)
+        assert 0 <= shard < shards, "Shard should be between 0 and {0}".format(shards - 1)
         self.__dict = {
             Role.CLIENT: clients,
             Role.PROPOSER: proposers,
@@ -31,7 +55,15 @@ class Network:
         """
         Gets a network group data by role
         """
-        return deepcopy(self.__dict[role])
+        return self.__dict[role]
+
+    def acceptor_address(self, acceptor_id: int) -> NetworkGroup:
+        """
+        Gets the address reaching a single acceptor: the address of the acceptor group with the port shifted by the ID
+        of the acceptor
+        """
+        address, port = self.__dict[Role.ACCEPTOR]
+        return NetworkGroup((address, port + acceptor_id))
 
     @staticmethod
     def udp_sender_socket() -> socket.SocketType:
@@ -48,6 +80,7 @@ class Network:
         mcast_receiver_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         mcast_receiver_sock.setblocking(False)
         mcast_receiver_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        mcast_receiver_sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, Network.SOCKET_RECEIVE_BUFFER)
         mcast_receiver_sock.bind(socket_address)
 
         # create multicast group and add the receiver socket to it
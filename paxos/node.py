@@ -1,14 +1,21 @@
-from typing import NoReturn, NewType, TypeVar
-from copy import deepcopy
-from abc import ABC as Abstract, abstractmethod
-from paxos.network import Network
+from typing import Callable, Dict, Iterable, NoReturn, NewType, TypeVar, List, Optional
+from abc import ABC as Abstract
+from paxos.batcher import Batcher
+from paxos.codec import CodecError, encode, decode
+from paxos.message_type import MessageType
+from paxos.metrics import METRICS_INTERVAL, Histogram, Metrics
+from paxos.network import Network, NetworkGroup
 from paxos.role import Role
+from paxos.timer import Timer, TimerQueue
+from paxos.tracing import TraceEvent, Tracer
+from paxos.transport import Transport, UdpTransport
 from utils import ColoredString
 
-import pickle
+import json
 import logging
-import socket
+import os
 import random
+import time
 
 
 NodeID = NewType('NodeID', int)
@@ -16,6 +23,10 @@ NodeID = NewType('NodeID', int)
 MessageT = TypeVar('MessageT', bound='Message')
 
 class Node(Abstract, ):
+    # Default flush policy of the batched Prepare, Promise, Propose and Accept messages
+    BATCH_MAX_SIZE = 64
+    BATCH_MAX_DELAY = 0.0
+
     # ---- Constructor ---- #
 
     def __init__(self,
@@ -23,9 +34,18 @@ class Node(Abstract, ):
                  role: Role,
                  network: Network,
                  plr: float = 0.0,
-                 lifetime: float =0.0) -> None:
+                 lifetime: float =0.0,
+                 batch_size: int = BATCH_MAX_SIZE,
+                 batch_delay: float = BATCH_MAX_DELAY,
+                 control: str = None,
+                 metrics: str = None,
+                 trace: str = None,
+                 transport: Transport = None,
+                 clock: Callable[[], float] = time.monotonic) -> None:
         """
-        Default constructor
+        Default constructor.
+        The node sends and receives through UDP multicast sockets and reads the monotonic clock, unless another
+        transport and clock are given (see simulator.py)
         """
         self.__id = id
         self.__role = role
@@ -37,35 +57,140 @@ class Node(Abstract, ):
         assert lifetime >= 0.0, "Positive lifetime expected!"
         self.__lifetime = lifetime
 
-        group_sock_address = self.__net[self.__role]
-        self.__receiver_socket = Network.multicast_receiver_socket(group_sock_address)
-        self.__sender_socket = Network.udp_sender_socket()
+        assert batch_size >= 1 and batch_delay >= 0.0, "Batch size should be at least 1 and delay not negative"
+        self.__batch_size = batch_size
+        self.__batch_delay = batch_delay
+        self.__batchers: List[Batcher] = []
+
+        self.__transport = transport if transport is not None else UdpTransport()
+        self.__transport.bind(self.__net[self.__role])
+        # Address (host:port) of the control channel of the launcher the node reports its status to, if any
+        self.__control_address = None
+        if control is not None:
+            host, port = control.rsplit(':', 1)
+            self.__control_address = (host, int(port))
+
+        # Base name of the files written by the node
+        self.__file_name = '{0}{1}'.format(role.name.lower(), id) if network.shards == 1 else \
+            '{0}{1}_shard{2}'.format(role.name.lower(), id, network.shard)
+        # Counters, histograms and gauges of the node, with the directory their snapshots are written to, if any
+        self.__metrics = Metrics()
+        self.__metrics_path = None
+        if metrics is not None:
+            os.makedirs(metrics, exist_ok=True)
+            self.__metrics_path = os.path.join(metrics, self.__file_name + '.json')
+        # Writer of the per-instance events of the node, if traced
+        self.__tracer = None
+        if trace is not None:
+            os.makedirs(trace, exist_ok=True)
+            self.__tracer = Tracer(os.path.join(trace, self.__file_name + '.trace'), role, id, network.shard)
+        # Time taken by the message callbacks, by message type, while they are timed
+        self.__time_handlers = False
+        self.__handler_timings: Dict[MessageType, Histogram] = {}
+
+        # Monotonic clock, read once per loop iteration and shared by all the handlers of that iteration
+        self.__clock = clock
+        self.__now = clock()
+        self.__start_time = self.__now
+        # Deadlines registered by the role, fired in batches by the node loop
+        self.__timers = TimerQueue()
+
+        # Dictionary containing the callbacks to be executed for each type of message received, filled by the roles
+        self._message_callbacks = {}
 
         # --- Create logger --- #
         self.__logger = logging.getLogger("{0} {1}".format(self.__role.value, self.__id), )
-        handler = logging.StreamHandler()
-        handler.setFormatter(logging.Formatter('[%(name)s] %(message)s'))
-        self.__logger.addHandler(handler)
+        # Loggers are shared by the nodes with the same role and ID, e.g. nodes restarted in the same process
+        if not self.__logger.handlers:
+            handler = logging.StreamHandler()
+            handler.setFormatter(logging.Formatter('[%(name)s] %(message)s'))
+            self.__logger.addHandler(handler)
         self.__logger.setLevel(logging.WARNING)
 
     # ---- Public properties ---- #
 
     @property
     def id(self) -> NodeID:
-        return deepcopy(self.__id)
+        return self.__id
 
     @property
     def role(self) -> Role:
-        return deepcopy(self.__role)
+        return self.__role
 
     @property
     def net(self) -> Network:
         return self.__net
 
+    @property
+    def transport(self) -> Transport:
+        return self.__transport
+
+    @property
+    def metrics(self) -> Metrics:
+        return self.__metrics
+
+    @property
+    def file_name(self) -> str:
+        """
+        Base name of the files written by the node: <role><ID>, or <role><ID>_shard<k> in a sharded deployment
+        """
+        return self.__file_name
+
+    @property
+    def handler_timings(self) -> Dict[MessageType, Histogram]:
+        return self.__handler_timings
+
     @property
     def lifetime(self) -> float:
         return self.__lifetime
 
+    @property
+    def now(self) -> float:
+        """
+        Cached monotonic time of the current loop iteration
+        """
+        return self.__now
+
+    @property
+    def start_time(self) -> float:
+        return self.__start_time
+
+    @property
+    def expired(self) -> bool:
+        """
+        Whether the lifetime of the node, if any, is over
+        """
+        return self.__lifetime > 0.0 and (self.__now - self.__start_time) > self.__lifetime
+
+    def update_clock(self) -> float:
+        self.__now = self.__clock()
+        return self.__now
+
+    def schedule(self, delay: float, callback: Callable, *args) -> Timer:
+        """
+        Executes callback(*args) from the node loop once delay seconds elapsed from the current loop iteration
+        """
+        return self.__timers.schedule(self.__now + delay, callback, *args)
+
+    def cancel(self, timer: Optional[Timer]) -> None:
+        self.__timers.cancel(timer)
+
+    def report(self, event: str, **fields) -> None:
+        """
+        Sends a status event, with the given fields, to the control channel of the launcher, if any
+        """
+        if self.__control_address is None:
+            return
+        status = dict(fields, event=event, role=self.__role.name.lower(), id=self.__id, shard=self.__net.shard)
+        self.__transport.send(json.dumps(status).encode('utf-8'), self.__control_address)
+
+    def trace(self, event: TraceEvent, instance: int) -> None:
+        """
+        Records that the instance went through event at the current loop iteration, if the node is traced
+        """
+        if self.__tracer is not None:
+            self.__tracer.record(self.__now, event, instance)
+
     def log_debug(self, message: str):
         self.__logger.debug(message)
 
@@ -76,44 +201,185 @@ class Node(Abstract, ):
         self.__logger.info(message)
 
     # ---- Public methods ---- #
-    def listen(self) -> MessageT:
+    def receive(self, timeout: Optional[float]) -> List[MessageT]:
         """
-        Starts listening on the network.
-        When message is received -- returns it.
-        This process blocks the paxos.
+        Blocks until at least a datagram is available or timeout seconds elapsed (forever if None),
+        then drains the transport and returns all the messages received.
         """
-        message = None
-        # Try to receive a message
-        try:
-            message_raw = self.__receiver_socket.recv(Network.SOCKET_BUFFSIZE)
-        except socket.error:
-            pass
-        # If no errors, aka, message received parse it
-        else:
-            # Randomly drop the incoming message according to the package loss ratio to emulate an unreliable network
-            # for debug purposes
-            if random.random() >= self._package_loss_ratio:
-                message = pickle.loads(message_raw)
-        return message
+        messages = []
+        for datagram in self.__transport.receive(timeout):
+            message = self.__parse(datagram)
+            if message is not None:
+                messages.append(message)
+        return messages
+
+    def join(self, address: NetworkGroup) -> None:
+        """
+        Receives also the messages sent to address, besides the ones sent to the group of the role
+        """
+        self.__transport.bind(address)
+
+    def send(self, message: MessageT, addresses: Iterable[NetworkGroup] = None) -> None:
+        """
+        Sends message to the group, or only to the given addresses.
+        """
+        message_raw = encode(message)
+        if addresses is None:
+            self.__transport.send(message_raw, self.__net[message.receiver_role])
+            self.__metrics.sent[message.message_type] += 1
+            return
+        for address in addresses:
+            self.__transport.send(message_raw, address)
+            self.__metrics.sent[message.message_type] += 1
+
+    def batcher(self, single_class: type, batch_class: type, receiver_role: Role,
+                addresses: Callable[[], Optional[List[NetworkGroup]]] = None) -> Batcher:
+        """
+        Creates a batcher for the given message type that follows the flush policy of this node
+        """
+        batcher = Batcher(self, single_class, batch_class, receiver_role, self.__batch_size, self.__batch_delay,
+                          addresses)
+        self.__batchers.append(batcher)
+        return batcher
 
+    def flush(self) -> None:
+        """
+        Executed at the end of every iteration of the node loop, once all the received messages were handled;
+        sends the batches that are not waiting for their flush delay.
+        """
+        for batcher in self.__batchers:
+            if batcher.flush_on_iteration_end:
+                batcher.flush()
 
-    def send(self, message: MessageT) -> None:
+    def dispatch(self, message: MessageT) -> None:
         """
-        Sends message to the group.
+        Executes the callback registered for the type of the message, if any
         """
-        receiver_address = self.__net[message.receiver_role]
-        message_raw = pickle.dumps(obj=message)
-        self.__sender_socket.sendto(message_raw, receiver_address)
+        self.__metrics.received[message.message_type] += 1
+        callback = self._message_callbacks.get(message.message_type)
+        if callback is None:
+            return
+        if not self.__time_handlers:
+            callback(message)
+            return
+
+        started = time.perf_counter()
+        callback(message)
+        elapsed = time.perf_counter() - started
+        histogram = self.__handler_timings.get(message.message_type)
+        if histogram is None:
+            histogram = self.__handler_timings[message.message_type] = \
+                self.__metrics.histogram('handler_' + message.message_type.name.lower())
+        histogram.observe(elapsed)
 
-    # ---- Public abstract methods ---- #
+    def time_handlers(self, enabled: bool) -> None:
+        """
+        Starts or stops timing the message callbacks, in the histograms handler_<message type> of the metrics
+        """
+        self.__time_handlers = enabled
 
-    @abstractmethod
     def run(self) -> NoReturn:
         """
         Starts this paxos.
-        This method never returns.
+        The node sleeps until a message arrives, a scheduled timer expires or the deadline returned by next_wakeup is
+        due; this method returns only when the lifetime of the node is over or the node is interrupted.
+        """
+        self.start()
+
+        messages = []
+        try:
+            while not self.expired:
+                wakeup = self.step(messages)
+                messages = self.receive(wakeup - self.__now if wakeup != float('inf') else None)
+                self.update_clock()
+        except KeyboardInterrupt:
+            # Interrupted, or terminated by the launcher (see main.py): stop as if the lifetime was over
+            pass
+
+        self.stop()
+
+    def start(self) -> None:
+        self.log_info("Start running...")
+        self.__start_time = self.update_clock()
+        self.on_start()
+        if self.__metrics_path is not None:
+            self.schedule(METRICS_INTERVAL, self.write_metrics)
+        self.report('ready')
+
+    def step(self, messages: List[MessageT]) -> float:
+        """
+        Executes an iteration of the node loop: handles the messages received, fires the expired timers, then runs
+        the periodic duties of the role and flushes the batches.
+        Returns the time at which the next iteration is due even if no message is received.
+        """
+        for message in messages:
+            self.dispatch(message)
+        self.__timers.run_expired(self.__now)
+        self.tick()
+        self.flush()
+
+        wakeup = min(self.next_wakeup(), self.__timers.next_deadline())
+        if self.__lifetime > 0.0:
+            wakeup = min(wakeup, self.__start_time + self.__lifetime)
+        return wakeup
+
+    def stop(self) -> None:
+        self.log_warning("Terminating...")
+        self.on_stop()
+        if self.__metrics_path is not None:
+            self.write_metrics(periodic=False)
+        if self.__tracer is not None:
+            self.__tracer.close()
+        self.report('stopped')
+        self.__transport.close()
+
+    def write_metrics(self, periodic: bool = True) -> None:
+        """
+        Writes a snapshot of the metrics of the node; a periodic snapshot schedules the next one
+        """
+        if periodic:
+            self.schedule(METRICS_INTERVAL, self.write_metrics)
+        snapshot = dict(self.__metrics.snapshot(), role=self.__role.name.lower(), id=self.__id,
+                        shard=self.__net.shard, uptime=self.__now - self.__start_time)
+        Metrics.write(self.__metrics_path, snapshot)
+
+    # ---- Role hooks ---- #
+
+    def on_start(self) -> None:
+        """
+        Executed once before entering the node loop.
+        """
+        pass
+
+    def on_stop(self) -> None:
+        """
+        Executed once when the lifetime of the node is over.
+        """
+        pass
+
+    def tick(self) -> None:
+        """
+        Executed at every iteration of the node loop, before waiting for new messages.
         """
         pass
 
+    def next_wakeup(self) -> float:
+        """
+        Monotonic time at which the node loop has to wake up even if no message is received.
+        """
+        return float('inf')
 
+    # ---- Private methods ---- #
 
+    def __parse(self, datagram: memoryview) -> MessageT:
+        # Randomly drop the incoming message according to the package loss ratio to emulate an unreliable network
+        # for debug purposes
+        if random.random() < self._package_loss_ratio:
+            self.__metrics.increment('dropped_by_loss')
+            return None
+        try:
+            return decode(datagram)
+        except CodecError as error:
+            self.__metrics.increment('dropped_malformed')
+            self.log_debug("Dropped malformed datagram: {0}".format(error))
+            return None
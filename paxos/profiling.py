@@ -0,0 +1,139 @@
+# Profiling of a running node.
+#
+# main.py creates a Profiler for every node: it is started with the node by --profile=<mode>, or at any time by
+# sending SIGUSR1 to the process, which also stops it. Two modes are available:
+#
+#     cprofile  the deterministic profiler of the standard library, which counts every call and slows the node down
+#     sample    a sampling profiler, which records the stack of the node every interval of CPU time (SIGPROF), so its
+#               overhead does not depend on the number of calls; the time spent waiting for datagrams is not sampled
+#
+# While the profiler runs the node also times its message callbacks, by message type (see Node.time_handlers). The
+# results accumulate over all the periods the profiler ran, and are written whenever it is stopped and when the node
+# terminates to <directory>/<role><ID>.prof (cprofile, to be read with pstats) or <role><ID>.folded (sample, one line
+# per stack with its number of samples, the input of flame graph tools), with a summary in <role><ID>.txt.
+
+from collections import Counter
+from typing import Dict, TextIO
+import cProfile
+import io
+import os
+import pstats
+import signal
+
+from paxos.message_type import MessageType
+from paxos.metrics import Histogram
+
+PROFILER_MODES = ('cprofile', 'sample')
+
+
+class Profiler:
+    """
+    Profiler of the process of a node, which can be started and stopped any number of times
+    """
+    # Default CPU time (in sec) between two samples of the sampling profiler
+    SAMPLE_INTERVAL = 0.005
+    # Functions listed in the summary
+    SUMMARY_ENTRIES = 40
+
+    def __init__(self, mode: str, path: str, interval: float = SAMPLE_INTERVAL) -> None:
+        """
+        The results are written to path followed by the extension of each file
+        """
+        assert mode in PROFILER_MODES, "Profiler mode should be one of {0}".format(PROFILER_MODES)
+        assert interval > 0.0, "The sampling interval should be positive"
+        self.__path = path
+        self.__interval = interval
+        self.__running = False
+        self.__started = False
+
+        self.__profile = cProfile.Profile() if mode == 'cprofile' else None
+        # Samples by stack, the stack as the code objects of its frames from the outermost one
+        self.__samples = Counter()
+
+    @property
+    def running(self) -> bool:
+        return self.__running
+
+    def start(self) -> None:
+        if self.__running:
+            return
+        self.__running = self.__started = True
+        if self.__profile is not None:
+            self.__profile.enable()
+        else:
+            signal.signal(signal.SIGPROF, self.__sample)
+            signal.setitimer(signal.ITIMER_PROF, self.__interval, self.__interval)
+
+    def stop(self) -> None:
+        if not self.__running:
+            return
+        self.__running = False
+        if self.__profile is not None:
+            self.__profile.disable()
+        else:
+            signal.setitimer(signal.ITIMER_PROF, 0.0)
+            signal.signal(signal.SIGPROF, signal.SIG_IGN)
+
+    def dump(self, handler_timings: Dict[MessageType, Histogram]) -> None:
+        """
+        Writes the results collected so far, if the profiler ever ran, with the timings of the message handlers
+        """
+        if not self.__started:
+            return
+        directory = os.path.dirname(self.__path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        summary = io.StringIO()
+        Profiler.write_handler_timings(summary, handler_timings)
+        if self.__profile is not None:
+            self.__profile.dump_stats(self.__path + '.prof')
+            stats = pstats.Stats(self.__profile, stream=summary)
+            stats.sort_stats('cumulative').print_stats(Profiler.SUMMARY_ENTRIES)
+        else:
+            with open(self.__path + '.folded', 'w') as file:
+                for stack, count in self.__samples.items():
+                    file.write('{0} {1}\n'.format(';'.join(Profiler.frame_name(code) for code in stack), count))
+            self.write_sample_summary(summary)
+        with open(self.__path + '.txt', 'w') as file:
+            file.write(summary.getvalue())
+
+    def write_sample_summary(self, output: TextIO) -> None:
+        # Samples in which each function was running (self) or on the stack (inclusive)
+        total = sum(self.__samples.values())
+        own = Counter()
+        inclusive = Counter()
+        for stack, count in self.__samples.items():
+            own[stack[-1]] += count
+            for code in set(stack):
+                inclusive[code] += count
+        output.write("{0} samples, every {1} sec of CPU time\n\n".format(total, self.__interval))
+        for title, counter in (("self", own), ("inclusive", inclusive)):
+            output.write("{0:>8} {1:>7}  function ({2})\n".format("samples", "share", title))
+            for code, count in counter.most_common(Profiler.SUMMARY_ENTRIES):
+                output.write("{0:8} {1:6.1f}%  {2}\n".format(count, count / total * 100.0, Profiler.frame_name(code)))
+            output.write("\n")
+
+    @staticmethod
+    def write_handler_timings(output: TextIO, handler_timings: Dict[MessageType, Histogram]) -> None:
+        total = sum(histogram.total for histogram in handler_timings.values())
+        output.write("{0:20} {1:>9} {2:>10} {3:>9} {4:>9} {5:>9} {6:>7}\n".format(
+            "handler", "messages", "total ms", "mean us", "p50 us", "p99 us", "share"))
+        for message_type, histogram in sorted(handler_timings.items(), key=lambda item: item[1].total, reverse=True):
+            output.write("{0:20} {1:9} {2:10.3f} {3:9.1f} {4:9.1f} {5:9.1f} {6:6.1f}%\n".format(
+                message_type.name.lower(), histogram.count, histogram.total * 1e3,
+                histogram.total / histogram.count * 1e6, histogram.quantile(0.5) * 1e6,
+                histogram.quantile(0.99) * 1e6, histogram.total / total * 100.0 if total else 0.0))
+        output.write("\n")
+
+    @staticmethod
+    def frame_name(code) -> str:
+        return '{0}:{1}:{2}'.format(os.path.basename(code.co_filename), code.co_firstlineno, code.co_name)
+
+    def __sample(self, signum, frame) -> None:
+        stack = []
+        while frame is not None:
+            stack.append(frame.f_code)
+            frame = frame.f_back
+        stack.reverse()
+        self.__samples[tuple(stack)] += 1
@@ -1,76 +1,187 @@
-from typing import NoReturn, List, Dict
-import time
+from typing import List, Dict, Optional, Set, Tuple
 
 from .role import Role
-from .network import Network
-from .node import NodeID, Node, MessageT
+from .network import Network, NetworkGroup
+from .node import NodeID, Node
+from .ballot import MAX_PROPOSER_ID, next_ballot
+from .timer import Timer
 from .message_type import MessageType
+from .metrics import Metrics
+from .tracing import TraceEvent
 from .message import RoundID, PaxosValue, InstanceID, ClientPropose, ClientProposePayload
 from .message import PreparePayload, Prepare, Propose, ProposePayload
 from .message import Promise, PromisePayload, Accept, AcceptPayload, Decide, DecidePayload
-from .message import RequestAck, DecideAck, HeartBeat
+from .message import RequestAck, DecideAck, HeartBeat, DecideBatch
+from .message import PrepareBatch, PromiseBatch, ProposeBatch, AcceptBatch, PrepareRange, PrepareRangePayload, \
+    PromiseRange
+from .message import LeaseRequest, LeaseRequestPayload, LeaseGrant, ReadRequest, ReadResponse, ReadResponsePayload
+from .message import ReadStatus
+from .lease import LeaderLease, lease_quorum_size
+
+class InstanceState:
+    """
+    State of the proposer for a single instance
+    """
+    __slots__ = ('requested_value', 'round_id', 'value_to_propose', 'promises', 'latest_promise_round',
+                 'latest_promise_value', 'accepts', 'round_timeout', 'last_prepare_time', 'round_timer', 'decided',
+                 'decided_value', 'decide_timeout', 'last_decide_time', 'decide_timer', 'widened', 'rounds',
+                 'last_propose_time')
+
+    def __init__(self, requested_value: PaxosValue, round_timeout: float, decide_timeout: float) -> None:
+        # Value requested by a client for the instance
+        self.requested_value = requested_value
+
+        # The ID of the round currently initiated by the proposer and the value to be proposed in its PROPOSE phase
+        self.round_id = RoundID(0)
+        self.value_to_propose: PaxosValue = None
+        # Acceptors (bitmask of their IDs) that promised the current round, and the accepted value and round in which it
+        # was accepted of the latest accepted value among their promises
+        self.promises = 0
+        self.latest_promise_round = RoundID(0)
+        self.latest_promise_value: PaxosValue = None
+        # Acceptors (bitmask of their IDs) that accepted the value of the current round, so that a duplicated or resent
+        # Accept message is only counted once
+        self.accepts = 0
+
+        # Maximum time (in sec) that a round can take; if exceeded the proposer starts a new round with higher timeout
+        self.round_timeout = round_timeout
+        self.last_prepare_time = 0.0
+        self.round_timer: Timer = None
+        # Rounds started by the proposer for the instance, and time at which the value was last proposed
+        self.rounds = 0
+        self.last_propose_time = 0.0
+        # In thrifty mode, whether the Propose was sent to all the acceptors after the chosen quorum did not answer
+        self.widened = False
+
+        self.decided = False
+        self.decided_value: PaxosValue = None
+        # Timeout between sending the decide message to the learner and receiving the ACK; If everything works fine
+        # the learner should learn the decided value directly from the acceptors, but if something goes wrong (i.e.
+        # message is lost) it relies on the proposer to recover the decided value
+        self.decide_timeout = decide_timeout
+        self.last_decide_time = 0.0
+        self.decide_timer: Timer = None
+
 
 class Proposer(Node):
-    # Naive solution to guarantee uniqueness of round ID between multiple proposers
-    primes = [2, 3, 5, 7, 11, 13, 17, 19 , 23, 29, 31]
     BASE_TIMEOUT = 1.5
     TIMEOUT_GROWTH_FACTOR = 2.0
+    # Upper bound of the round, decide and leader phase 1 timeouts
+    MAX_TIMEOUT = 6.0
+    # Instances below the ACK watermark whose decided value is still kept to serve reads
+    DECIDED_LOG_WINDOW = 10000
     HEARBEAT_RATE = 0.33
     HEARTBEAT_TIMEOUT = 4.0
-    PREPARE_PHASE1_IN_ADVANCE = True
+    # In thrifty mode, time (in sec) the chosen quorum of acceptors has to accept a value before the Propose is sent to
+    # all the acceptors, and time since an acceptor was last heard from after which it is not chosen anymore
+    THRIFTY_WIDEN_TIMEOUT = 0.2
+    THRIFTY_LIVENESS = 1.0
+    # Time (in sec) after which the PrepareRange of the leader round is sent again to the acceptors whose promise is not
+    # complete yet, which answer it again with all their chunks; once the leader is stable it is still sent, less often
+    # and to their own address only, to the acceptors that did not promise, which refuse the Propose messages until then
+    LEADER_PREPARE_RESEND = 0.2
+    LEADER_STRAGGLER_RESEND = 1.0
 
     def __init__(self, id: NodeID, network: Network, plr: float, lifetime: float,
-                 disable_timeout: bool = False, disable_pre_execution: bool = False) -> None:
-        super().__init__(id, Role.PROPOSER, network, plr, lifetime)
+                 disable_timeout: bool = False, disable_pre_execution: bool = False, thrifty: bool = False,
+                 leader_fanout: bool = False, **node_options) -> None:
+        super().__init__(id, Role.PROPOSER, network, plr, lifetime, **node_options)
+        assert 0 < id <= MAX_PROPOSER_ID, "Proposer ID should be between 1 and {0}".format(MAX_PROPOSER_ID)
         self.disable_timout = disable_timeout
 
-        # The ID of the round currently initiated by the proposer for each undecided instance
-        self._round_id: Dict[InstanceID, RoundID] = {}
-        # The values to be proposed in the next PROPOSE phase of each undecided instance
-        self._value_to_propose: Dict[InstanceID, PaxosValue] = {}
-        # Promises received from acceptors corresponding to the current round for each undecided instance
-        self._promises_received: Dict[InstanceID, int] = {}
-        # Accepted value and round in which it was accepted of the latest accepted value among the received promises
-        # for each instance
-        self._latest_promise: Dict[InstanceID, List[RoundID, PaxosValue]] = {}
-        # Accept messages received from acceptors associated to this round
-        self._accept_messages_current_round: Dict[InstanceID, int] = {}
-
-        # Keep track of which value has been request by a client for each instance and the list of decided instances
-        self._undecided_instances: List[InstanceID] = []
-        self._client_requests: Dict[InstanceID, PaxosValue] = {}
-        self._decided_values: Dict[InstanceID, PaxosValue] = {}
-
-        # The timeout defines for each instance the maximum time (in sec) that a round can take; if exceeded the
-        # proposer starts a new round with higher timeout
-        self._round_timeouts: Dict[InstanceID, float] = {}
-        self._last_prepare_time: Dict[InstanceID, float] = {}
-
-        # Timeout between sending the decide message to the learner and receiving the ACK; If everything works fine
-        # the learner should learn the decided value directly from the acceptors, but if something goes wrong (i.e.
-        # message is lost) it relies on the proposer to recover the decided value
-        self._acked_decided_values: Dict[InstanceID, bool] = {}
-        self._last_decide_time: Dict[InstanceID, float] = {}
-        self._learners_decide_timeout: Dict[InstanceID, float] = {}
+        # State of every instance requested by a client, until a learner acknowledges its decision
+        self._instances: Dict[InstanceID, InstanceState] = {}
+        # Ordered indexes of the instances still undecided and of the decided ones waiting for the ACK of a learner
+        self._undecided_instances: Dict[InstanceID, InstanceState] = {}
+        self._unacked_instances: Dict[InstanceID, InstanceState] = {}
+        # Instances acknowledged by a learner, whose state was reclaimed: all the instances up to the watermark and
+        # the ones in the set, which are moved under the watermark as soon as the gap before them is filled
+        self._finished_watermark: InstanceID = InstanceID(0)
+        self._finished_instances: Set[InstanceID] = set()
 
         self._leader_id: int = 1
         self._known_proposers: List[int] = [self.id]
         self._last_heartbeat_sent: float = 0.0
-        self._last_heartbeat_leader: float = time.time()
-
-        # Pre-prepare phase 1 flag
-        self._phase1_preprepared: bool = False
-        self._phase1_preprepared_round: RoundID = None
-        self._enable_phase1_optimization = Proposer.PREPARE_PHASE1_IN_ADVANCE and not disable_pre_execution
-
+        self._last_heartbeat_leader: float = self.now
+
+        # Stable leader: the leader runs phase 1 once, with its leader round, for all the instances starting from the
+        # first one not finished yet; once a quorum of acceptors promised the round, every instance is started
+        # directly from phase 2 until another proposer becomes the leader
+        self._stable_leader_enabled = not disable_pre_execution
+        self._stable_leader: bool = False
+        self._leader_round: RoundID = RoundID(0)
+        self._leader_range_first: InstanceID = InstanceID(1)
+        # Chunks of the PromiseRange of the leader round received from each acceptor, and acceptors whose chunks were
+        # all received
+        self._leader_chunks: Dict[int, Set[int]] = {}
+        self._leader_promises: Set[int] = set()
+        # Value accepted in the highest round for each instance of the range, as reported by the acceptors
+        self._leader_reported: Dict[InstanceID, Tuple[RoundID, PaxosValue]] = {}
+        self._leader_prepare_timeout: float = Proposer.BASE_TIMEOUT
+        self._leader_prepare_timer: Timer = None
+        self._leader_resend_timer: Timer = None
+        self._leader_prepare_time: float = 0.0
+        # Highest round seen in the messages of the acceptors or started by this proposer, new rounds are started above
+        # it: a ballot is never used twice, e.g. by the leader round and the round of an instance that timed out, since
+        # the two could propose different values for the same instance
+        self._highest_round_seen: RoundID = RoundID(0)
+
+        # Lease granted by the acceptors to this proposer while it is the leader, renewed with every heartbeat; a
+        # stable leader holding a valid lease serves the reads of the decided log without running any instance
+        self._lease_quorum_size = lease_quorum_size(self.net.acceptor_count, self.net.phase1_quorum_size,
+                                                    self.net.phase2_quorum_size)
+        self._lease = LeaderLease(self._lease_quorum_size)
+        # Latest lease request of every other proposer granted by some acceptors, as its sequence number and the
+        # bitmask of the acceptors that granted it
+        self._rival_grants: Dict[int, Tuple[int, int]] = {}
+        # Values decided for the instances seen by this proposer, kept after their state is reclaimed to serve reads
+        # until they fall DECIDED_LOG_WINDOW instances behind the ACK watermark, then read from the learners; every
+        # instance below _decided_log_first is already dropped
+        self._decided_log: Dict[InstanceID, PaxosValue] = {}
+        self._decided_log_first: InstanceID = InstanceID(1)
+        # Reads of instances still in progress, by instance, answered as soon as the instance is decided
+        self._pending_reads: Dict[InstanceID, List[Tuple[int, int]]] = {}
+
+        # Thrifty mode: the Propose messages are sent only to a quorum of the acceptors heard from recently, the
+        # lowest IDs first, and to all the acceptors if the quorum does not accept in time
+        self._thrifty = thrifty
+        self._acceptor_last_seen: Dict[int, float] = {}
+
+        # Prepare and Propose messages of all the instances started in a loop iteration are sent together
+        self._prepare_batcher = self.batcher(Prepare, PrepareBatch, Role.ACCEPTOR)
+        self._propose_batcher = self.batcher(Propose, ProposeBatch, Role.ACCEPTOR)
+        self._thrifty_propose_batcher = self.batcher(Propose, ProposeBatch, Role.ACCEPTOR, self.thrifty_addresses)
+
+        # Leader fan-out: the acceptors send their Accept messages only to the proposers, and the leader sends the
+        # decisions of all the instances decided in a loop iteration to the learners in a single Decide message
+        self._leader_fanout = leader_fanout
+        self._decide_batcher = self.batcher(Decide, DecideBatch, Role.LEARNER)
+
+        # Time from the start of a round to the quorum of promises, and from the Propose to the quorum of accepts, and
+        # rounds needed to decide an instance
+        self._phase1_latency = self.metrics.histogram('phase1_latency')
+        self._phase2_latency = self.metrics.histogram('phase2_latency')
+        self._rounds_per_instance = self.metrics.histogram('rounds_per_instance', Metrics.COUNT_BASE)
+        self.metrics.gauge('undecided_instances', lambda: len(self._undecided_instances))
+        self.metrics.gauge('unacked_instances', lambda: len(self._unacked_instances))
+        self.metrics.gauge('finished_watermark', lambda: self._finished_watermark)
+        self.metrics.gauge('leader_id', lambda: self._leader_id)
+        self.metrics.gauge('stable_leader', lambda: int(self._stable_leader))
+        self.metrics.gauge('decided_log', lambda: len(self._decided_log))
+        self.metrics.gauge('pending_reads', lambda: sum(len(reads) for reads in self._pending_reads.values()))
 
         # Dictionary containing the callbacks to be executed for each type of message received
         self._message_callbacks = {
             MessageType.CLIENT_PROPOSE: self.client_request_callback,
-            MessageType.PROMISE: self.propose_phase_parallel,
-            MessageType.ACCEPT: self.accept_phase_parallel,
+            MessageType.PROMISE: self.promise_callback,
+            MessageType.PROMISE_BATCH: self.promise_batch_callback,
+            MessageType.PROMISE_RANGE: self.promise_range_callback,
+            MessageType.ACCEPT: self.accept_callback,
+            MessageType.ACCEPT_BATCH: self.accept_batch_callback,
             MessageType.DECIDE_ACK: self.decide_ack_handler,
-            MessageType.HEARTBEAT: self.heartbeat_handler
+            MessageType.HEARTBEAT: self.heartbeat_handler,
+            MessageType.LEASE_GRANT: self.lease_grant_callback,
+            MessageType.READ_REQUEST: self.read_request_callback
         }
 
     def client_request_callback(self, client_request: ClientPropose):
@@ -78,211 +189,464 @@ class Proposer(Node):
         value: PaxosValue = payload[0]
         instance: InstanceID = payload[1]
 
+        # The request of a decided instance is retransmitted by a client that missed the ACK
+        state = self._instances.get(instance)
+        if self.is_finished(instance) or (state is not None and state.decided):
+            self.ack_request(instance)
+            return
 
-        if self.id == self._leader_id:
-            # Send an ACK to the clients confirming a request for the current instance has been received
-            ack_message: RequestAck = RequestAck(sender=self,
-                                                 receiver_role=Role.CLIENT,
-                                                 payload=instance)
-            self.send(ack_message)
-
-        # If a request is received for a new instance, add the instance to the list of undecided ones
-        # and save the corresponding value to propose then initialize new instance
-        if instance not in self._client_requests:
-            self._client_requests[instance] = value
-            self._undecided_instances.append(instance)
-            self._acked_decided_values[instance] = False
-
-            self._round_id[instance] = RoundID(1)
-            self._value_to_propose[instance] = None
-            self._promises_received[instance] = 0
-            self._latest_promise[instance] = [RoundID(0), None]
-            self._last_prepare_time[instance] = 0.0
-            self._round_timeouts[instance] = 1.0*Proposer.BASE_TIMEOUT if not self.disable_timout else float('inf')
-            self._learners_decide_timeout[instance] = 1.0*Proposer.BASE_TIMEOUT
-            self._accept_messages_current_round[instance] = 0
+        # If a request is received for a new instance, add the instance to the undecided ones and save the
+        # corresponding value to propose then initialize new instance
+        if instance not in self._instances and not self.is_finished(instance):
+            state = InstanceState(value,
+                                  Proposer.BASE_TIMEOUT if not self.disable_timout else float('inf'),
+                                  Proposer.BASE_TIMEOUT)
+            self._instances[instance] = state
+            self._undecided_instances[instance] = state
+            self.trace(TraceEvent.PROPOSER_REQUEST, instance)
 
 
             if self.id == self._leader_id:
-                if not self._enable_phase1_optimization:
+                if not self._stable_leader_enabled:
                     self.prepare_phase_parallel(instance)
-                    return
-
-                if self._phase1_preprepared is not True:
-                    self.pre_prepare_phase1(instance)
-
-                if self._phase1_preprepared:
-                    promise: Promise = Promise(sender=self,
-                                               receiver_role=Role.PROPOSER,
-                                               payload=PromisePayload((self._phase1_preprepared_round,
-                                                                       RoundID(0),
-                                                                       None,
-                                                                       instance))
-                                               )
-                    self._round_id[instance] = self._phase1_preprepared_round
-                    self._last_prepare_time[instance] = time.time()
-                    self.propose_phase_parallel(promise_message=promise)
-
+                elif self._stable_leader:
+                    self.propose_in_leader_round(instance)
+                # Otherwise the instance is proposed as soon as the phase 1 of the leader round completes
+
+    def promise_callback(self, promise_message: Promise) -> None:
+        self._acceptor_last_seen[promise_message.sender_id] = self.now
+        self.propose_phase_parallel(promise_message.sender_id, promise_message.payload)
+
+    def promise_batch_callback(self, promise_batch: PromiseBatch) -> None:
+        self._acceptor_last_seen[promise_batch.sender_id] = self.now
+        for payload in promise_batch.payload:
+            self.propose_phase_parallel(promise_batch.sender_id, payload)
+
+    def accept_callback(self, accept_message: Accept) -> None:
+        self._acceptor_last_seen[accept_message.sender_id] = self.now
+        self.accept_phase_parallel(accept_message.sender_id, accept_message.payload)
+
+    def accept_batch_callback(self, accept_batch: AcceptBatch) -> None:
+        self._acceptor_last_seen[accept_batch.sender_id] = self.now
+        for payload in accept_batch.payload:
+            self.accept_phase_parallel(accept_batch.sender_id, payload)
+
+    def promise_range_callback(self, promise_range: PromiseRange) -> None:
+        self._acceptor_last_seen[promise_range.sender_id] = self.now
+        round_id, first, index, chunks, accepted = promise_range.payload
+        for instance, accepted_round, accepted_value in accepted:
+            self._highest_round_seen = max(self._highest_round_seen, accepted_round)
+
+        if self.id != self._leader_id or round_id != self._leader_round:
+            return
 
-    # --- PHASE 1A, 2a and 3 ---- #
-    def pre_prepare_phase1(self, instance: InstanceID):
+        # Once stable, the values reported by the acceptors promising late are already known from the quorum
+        if not self._stable_leader:
+            for instance, accepted_round, accepted_value in accepted:
+                reported = self._leader_reported.get(instance)
+                if reported is None or accepted_round > reported[0]:
+                    self._leader_reported[instance] = (accepted_round, accepted_value)
+        # The promise of an acceptor counts only once it reported all the values it accepted in the range; if some
+        # chunk is lost the PrepareRange is sent again, and answered again with all the chunks
+        received = self._leader_chunks.setdefault(promise_range.sender_id, set())
+        if received and max(received) >= chunks:
+            # The acceptor reported a different number of values in a previous answer, only the last one counts
+            received.clear()
+        received.add(index)
+        if len(received) == chunks:
+            self._leader_promises.add(promise_range.sender_id)
+            if not self._stable_leader and len(self._leader_promises) >= self.net.phase1_quorum_size:
+                self._phase1_latency.observe(self.now - self._leader_prepare_time)
+                self.leader_phase1_completed()
+
+    # --- STABLE LEADER ---- #
+    def start_leader_phase1(self) -> None:
         """
-        Run a prepare phase for this instance and wait to get a promises from a quorum, while still sending and
-        receiving heartbeats :param instance: :return:
+        Run phase 1 for all the instances from the first one not finished yet with a new leader round
         """
-        self.prepare_phase_parallel(instance, preprepare=True)
-
-        promises = 0
-        start = time.time()
-        while promises < self.net.quorum_size and (time.time() - start) < self._round_timeouts[instance]:
-            if self.lifetime > 0.0:
-                if (time.time()-self.start_time) > self.lifetime:
-                    return
-
-            self.send_heartbeat()
-
-            message: MessageT = self.listen()
-            if message is not None and message.message_type is MessageType.PROMISE:
-                promises += 1
-
-            self.check_heartbeat()
+        self.cancel(self._leader_prepare_timer)
+        self._leader_prepare_timer = None
+        self.cancel(self._leader_resend_timer)
+        self._leader_resend_timer = None
+        self._stable_leader = False
+        # The lease was granted for the previous leader round
+        self._lease.revoke()
+        if self.id != self._leader_id:
+            return
+        if not self._stable_leader_enabled:
+            # Every instance runs its own phase 1, the leader is ready right away
+            self.report('leader')
+            return
 
-        if promises < self.net.quorum_size:
-            self._enable_phase1_optimization = False
-            self.log_warning("Unable to receive in time enough promises to execute phase 1 in advance, "
-                             "optimization disabled!")
-            self._phase1_preprepared = False
+        self._leader_round = next_ballot(max(self._leader_round, self._highest_round_seen), self.id)
+        self._highest_round_seen = self._leader_round
+        self._leader_range_first = InstanceID(self._finished_watermark + 1)
+        self._leader_chunks = {}
+        self._leader_promises = set()
+        self._leader_reported = {}
+        self._leader_prepare_time = self.now
+        self.send_prepare_range()
+        self.log_debug("Started leader round {0} for all instances from {1}"
+                       .format(self._leader_round, self._leader_range_first))
+
+        if not self.disable_timout:
+            self._leader_prepare_timer = self.schedule(self._leader_prepare_timeout, self.leader_phase1_timeout)
+
+    def send_prepare_range(self) -> None:
+        """
+        Sends the PrepareRange of the leader round, and again every LEADER_PREPARE_RESEND until the round is promised,
+        then every LEADER_STRAGGLER_RESEND to the acceptors that did not promise it
+        """
+        self._leader_resend_timer = None
+        if self.id != self._leader_id:
             return
+        prepare_range = PrepareRange(sender=self,
+                                     receiver_role=Role.ACCEPTOR,
+                                     payload=PrepareRangePayload((self._leader_round, self._leader_range_first)))
+        if not self._stable_leader:
+            self.send(prepare_range)
+            self._leader_resend_timer = self.schedule(Proposer.LEADER_PREPARE_RESEND, self.send_prepare_range)
+            return
+        stragglers = [self.net.acceptor_address(acceptor_id) for acceptor_id in range(1, self.net.acceptor_count + 1)
+                      if acceptor_id not in self._leader_promises]
+        if stragglers:
+            self.send(prepare_range, stragglers)
+            self._leader_resend_timer = self.schedule(Proposer.LEADER_STRAGGLER_RESEND, self.send_prepare_range)
+
+    def leader_phase1_timeout(self) -> None:
+        self._leader_prepare_timer = None
+        if self.id != self._leader_id or self._stable_leader:
+            return
+        self._leader_prepare_timeout = min(self._leader_prepare_timeout * Proposer.TIMEOUT_GROWTH_FACTOR,
+                                           Proposer.MAX_TIMEOUT)
+        self.metrics.increment('leader_phase1_timeouts')
+        self.log_warning("Phase 1 of leader round {0} timed out, retrying".format(self._leader_round))
+        self.start_leader_phase1()
+
+    def leader_phase1_completed(self) -> None:
+        """
+        A quorum of acceptors promised the leader round: complete the instances some acceptor accepted a value for,
+        with the value accepted in the highest round, then propose every undecided instance
+        """
+        self.cancel(self._leader_prepare_timer)
+        self._leader_prepare_timer = None
+        self.cancel(self._leader_resend_timer)
+        self._leader_prepare_timeout = Proposer.BASE_TIMEOUT
+        self._stable_leader = True
+        self._leader_resend_timer = self.schedule(Proposer.LEADER_STRAGGLER_RESEND, self.send_prepare_range)
+        self.log_info("Stable leader with round {0} for all instances from {1}"
+                      .format(self._leader_round, self._leader_range_first))
+        self.report('leader', round=self._leader_round)
+
+        for instance, (accepted_round, accepted_value) in sorted(self._leader_reported.items()):
+            if instance < self._leader_range_first or self.is_finished(instance):
+                continue
+            state = self._instances.get(instance)
+            if state is None:
+                # Instance started by a previous leader, no client request received by this proposer
+                state = InstanceState(accepted_value,
+                                      Proposer.BASE_TIMEOUT if not self.disable_timout else float('inf'),
+                                      Proposer.BASE_TIMEOUT)
+                self._instances[instance] = state
+                self._undecided_instances[instance] = state
+            if accepted_round > state.latest_promise_round:
+                state.latest_promise_round = accepted_round
+                state.latest_promise_value = accepted_value
+        self._leader_reported = {}
 
-        self._last_prepare_time[instance] = time.time()
-        self._phase1_preprepared_round = self._round_id[instance]
-        self._phase1_preprepared = True
+        for instance in self._undecided_instances:
+            self.propose_in_leader_round(instance)
+
+    def propose_in_leader_round(self, instance: InstanceID) -> None:
+        state = self._instances[instance]
+        state.round_id = self._leader_round
+        state.promises = 0
+        state.accepts = 0
+        state.rounds += 1
+        state.last_prepare_time = self.now
+        self.trace(TraceEvent.PROPOSER_LEADER_ROUND, instance)
+        self.arm_round_timeout(instance)
+        self.propose_value(instance, state)
 
-    def prepare_phase_parallel(self, instance: InstanceID, preprepare: bool= False) -> None:
-        # Start new round
-        self._round_id[instance] *= Proposer.primes[self.id - 1]
+    # --- PHASE 1A, 2a and 3 ---- #
+    def prepare_phase_parallel(self, instance: InstanceID) -> None:
+        state = self._instances[instance]
+        # Start new round, with a ballot higher than any other seen for this instance
+        highest_round = max(state.round_id, state.latest_promise_round, self._highest_round_seen)
+        state.round_id = next_ballot(highest_round, self.id)
+        self._highest_round_seen = state.round_id
         # Discard all promises and accept messages received for previous round
-        self._promises_received[instance] = 0
-        self._accept_messages_current_round[instance] = 0
-
-        prepare_message = Prepare(sender=self,
-                                  receiver_role=Role.ACCEPTOR,
-                                  payload=PreparePayload((self._round_id[instance], instance, preprepare))
-                                  )
-        self.send(prepare_message)
+        state.promises = 0
+        state.accepts = 0
+        state.rounds += 1
+
+        self._prepare_batcher.add(PreparePayload((state.round_id, instance)))
+        self.trace(TraceEvent.PROPOSER_PREPARE, instance)
         # Register time of prepare
-        self._last_prepare_time[instance] = time.time()
+        state.last_prepare_time = self.now
+        self.arm_round_timeout(instance)
         self.log_debug("Started round {0} for instance {1}, with requested value {2}"
-                 .format(self._round_id[instance], instance, self._client_requests[instance])
+                 .format(state.round_id, instance, state.requested_value)
                  )
 
-    def propose_phase_parallel(self, promise_message: Promise) -> None:
-        payload: PromisePayload = promise_message.payload
+    def propose_phase_parallel(self, acceptor_id: int, payload: PromisePayload) -> None:
         acceptor_round: RoundID = payload[0]
         round_accepted: RoundID = payload[1]
         value_accepted: PaxosValue = payload[2]
         instance: InstanceID = payload[3]
 
-        # This proposer did not receive the request from the client for this instance
-        if instance not in self._client_requests.keys():
+        # This proposer did not receive the request from the client for this instance, or it is already finished
+        state = self._instances.get(instance)
+        if state is None:
+            return
+
+        acceptor = 1 << acceptor_id
+        if acceptor_round != state.round_id or state.promises & acceptor:
             return
+        state.promises |= acceptor
+
+        if round_accepted > state.latest_promise_round:
+            state.latest_promise_round = round_accepted
+            state.latest_promise_value = value_accepted
+
+        if bin(state.promises).count('1') == self.net.phase1_quorum_size:
+            self._phase1_latency.observe(self.now - state.last_prepare_time)
+            self.trace(TraceEvent.PROPOSER_PROMISED, instance)
+            self.propose_value(instance, state)
+
+    def propose_value(self, instance: InstanceID, state: InstanceState) -> None:
+        # Set value to propose next to the value received accepted in the highest round, if any, otherwise use
+        # value requested by the clint
+        if state.latest_promise_round == RoundID(0):
+            state.value_to_propose = state.requested_value
+        else:
+            state.value_to_propose = state.latest_promise_value
+
+        payload = ProposePayload((state.round_id, state.value_to_propose, instance))
+        state.last_propose_time = self.now
+        self.trace(TraceEvent.PROPOSER_PROPOSE, instance)
+        if not self._thrifty or state.widened:
+            self._propose_batcher.add(payload)
+        else:
+            self._thrifty_propose_batcher.add(payload)
+            # The round timeout is armed again once the Propose is sent to all the acceptors
+            self.cancel(state.round_timer)
+            state.round_timer = None
+            if self.id == self._leader_id:
+                state.round_timer = self.schedule(Proposer.THRIFTY_WIDEN_TIMEOUT, self.widen_proposal, instance)
+        self.log_debug("Proposing value {0} for instance {1}".format(state.value_to_propose, instance))
 
-        if acceptor_round == self._round_id[instance]:
-            self._promises_received[instance] += 1
-
-            if round_accepted > self._latest_promise[instance][0]:
-                self._latest_promise[instance][0] = round_accepted
-                self._latest_promise[instance][1] = value_accepted
-
-        if self._promises_received[instance] == self.net.quorum_size or self._phase1_preprepared:
-            # Set value to propose next to the value received accepted in the highest round, if any, otherwise use
-            # value requested by the clint
-            if self._latest_promise[instance][0] == RoundID(0):
-                self._value_to_propose[instance] = self._client_requests[instance]
-            else:
-                self._value_to_propose[instance] = self._latest_promise[instance][1]
-
-            propose_message = Propose(sender=self,
-                                      receiver_role=Role.ACCEPTOR,
-                                      payload=ProposePayload((self._round_id[instance],
-                                                              self._value_to_propose[instance],
-                                                              instance,
-                                                              self._phase1_preprepared and self._enable_phase1_optimization)
-                                                             )
-                                      )
-            self.send(message=propose_message)
-            self.log_debug("Proposing value {0} for instance {1}".format(self._value_to_propose[instance], instance))
-
-    def accept_phase_parallel(self, accept_message: Accept) -> None:
-        payload: AcceptPayload = accept_message.payload
+    def accept_phase_parallel(self, acceptor_id: int, payload: AcceptPayload) -> None:
         acceptor_round: RoundID = payload[0]
         accepted_value: PaxosValue = payload[1]
         instance: InstanceID = payload[2]
 
-        # This proposer did not receive the request from the client for this instance
-        if instance not in self._client_requests.keys():
-            return
+        if acceptor_round > self._highest_round_seen:
+            self._highest_round_seen = acceptor_round
 
-        if acceptor_round == self._round_id[instance]:
-            self._accept_messages_current_round[instance] += 1
+        # This proposer did not receive the request from the client for this instance, or it is already finished
+        state = self._instances.get(instance)
+        if state is None:
+            return
 
-            # if a quorum of acceptor accepted this value set this instance as decided
-            if self._accept_messages_current_round[instance] == self.net.quorum_size:
-                self._undecided_instances.remove(instance)
-                self._decided_values[instance] = accepted_value
-                self._last_decide_time[instance] = time.time()
+        acceptor = 1 << acceptor_id
+        if acceptor_round == state.round_id and not state.accepts & acceptor:
+            state.accepts |= acceptor
+
+            # if a quorum of distinct acceptors accepted this value set this instance as decided; with leader fan-out the
+            # learners trust the Decide of the leader, so it is relayed only from this point, once per instance
+            if not state.decided and bin(state.accepts).count('1') >= self.net.phase2_quorum_size:
+                del self._undecided_instances[instance]
+                self._unacked_instances[instance] = state
+                state.decided = True
+                state.decided_value = accepted_value
+                self.metrics.increment('instances_decided')
+                self._phase2_latency.observe(self.now - state.last_propose_time)
+                self._rounds_per_instance.observe(state.rounds)
+                self.trace(TraceEvent.PROPOSER_DECIDED, instance)
+                self._decided_log[instance] = accepted_value
+                self.answer_pending_reads(instance, accepted_value)
+                self.ack_request(instance)
+                if self._leader_fanout and self.id == self._leader_id:
+                    self._decide_batcher.add(DecidePayload((accepted_value, instance)))
+                state.last_decide_time = self.now
+                self.cancel(state.round_timer)
+                state.round_timer = None
+                self.arm_decide_timeout(instance)
 
     # ---------------------------#
 
+    # ---- Thrifty mode ---- #
+
+    def thrifty_addresses(self) -> Optional[List[NetworkGroup]]:
+        """
+        Addresses of the acceptors the Propose messages are sent to, None for all the acceptors if not enough
+        acceptors were heard from recently
+        """
+        live = sorted(acceptor_id for acceptor_id, last_seen in self._acceptor_last_seen.items()
+                      if self.now - last_seen <= Proposer.THRIFTY_LIVENESS)
+        if len(live) < self.net.phase2_quorum_size:
+            return None
+        return [self.net.acceptor_address(acceptor_id) for acceptor_id in live[:self.net.phase2_quorum_size]]
+
+    def widen_proposal(self, instance: InstanceID) -> None:
+        """
+        The chosen quorum did not accept the value in time: send the Propose to all the acceptors
+        """
+        state = self._instances[instance]
+        state.round_timer = None
+        if self.id != self._leader_id or state.decided:
+            return
+
+        state.widened = True
+        self.metrics.increment('thrifty_widened')
+        self._propose_batcher.add(ProposePayload((state.round_id, state.value_to_propose, instance)))
+        self.trace(TraceEvent.PROPOSER_PROPOSE, instance)
+        self.log_debug("Proposing value {0} for instance {1} to all the acceptors".format(state.value_to_propose,
+                                                                                         instance))
+        self.arm_round_timeout(instance)
+
+    # ---------------------- #
+
     # ---- Round timeout and Learner decide timeout ----- #
 
     def decide_ack_handler(self, ack: DecideAck) -> None:
-        instance: InstanceID = DecideAck.payload
-        self._acked_decided_values[instance] = True
+        instance: InstanceID = ack.payload
+        # A learner knows the decision, nothing is left to do for this instance and its state can be reclaimed
+        state = self._instances.pop(instance, None)
+        if state is None:
+            return
+        self._undecided_instances.pop(instance, None)
+        self._unacked_instances.pop(instance, None)
+        self.cancel(state.round_timer)
+        self.cancel(state.decide_timer)
+        self.mark_finished(instance)
+        self.trace(TraceEvent.PROPOSER_ACKED, instance)
+
+    def ack_request(self, instance: InstanceID) -> None:
+        """
+        The leader ACKs the request of a client only once its instance is decided: a proposer that ACKed requests
+        it could not get decided (e.g. a leader that crashed, or that is cut off by the lease of another proposer)
+        would lose them, since the client stops retransmitting
+        """
+        if self.id == self._leader_id:
+            self.send(RequestAck(sender=self,
+                                 receiver_role=Role.CLIENT,
+                                 payload=instance))
+
+    def is_finished(self, instance: InstanceID) -> bool:
+        return instance <= self._finished_watermark or instance in self._finished_instances
 
-    def check_for_timeouts(self) -> None:
+    def mark_finished(self, instance: InstanceID) -> None:
+        if instance != self._finished_watermark + 1:
+            self._finished_instances.add(instance)
+            return
+        self._finished_watermark = instance
+        while self._finished_watermark + 1 in self._finished_instances:
+            self._finished_watermark += 1
+            self._finished_instances.remove(self._finished_watermark)
+
+        while self._decided_log_first <= self._finished_watermark - Proposer.DECIDED_LOG_WINDOW:
+            self._decided_log.pop(self._decided_log_first, None)
+            self._decided_log_first += 1
+
+    def finish_truncated(self, low_water_mark: InstanceID) -> None:
+        """
+        The acceptors forgot the instances up to their low-water mark, which are known to the learners and cannot be
+        proposed anymore: a proposer that missed some of their ACKs finishes them too
+        """
+        if low_water_mark <= self._finished_watermark:
+            return
+        for instance in [instance for instance in self._instances if instance <= low_water_mark]:
+            state = self._instances.pop(instance)
+            self._undecided_instances.pop(instance, None)
+            self._unacked_instances.pop(instance, None)
+            self.cancel(state.round_timer)
+            self.cancel(state.decide_timer)
+            for client_id, request_id in self._pending_reads.pop(instance, ()):
+                self.send_read_response(client_id, request_id, instance, ReadStatus.UNAVAILABLE, None)
+        self._finished_instances = {instance for instance in self._finished_instances if instance > low_water_mark}
+        self._finished_watermark = InstanceID(low_water_mark - 1)
+        self.mark_finished(low_water_mark)
+        self.metrics.increment('truncated_finished')
+
+    def arm_round_timeout(self, instance: InstanceID) -> None:
         """
-        Check for the first undecided instance that timed out and start a new round for it, then look among the
-        decided instances not ACKed by a learner yet for all those which timed out while waiting for the ACK
+        (Re)schedule the timeout of the current round of the instance
         """
+        state = self._instances[instance]
+        self.cancel(state.round_timer)
+        state.round_timer = None
+        if self.id != self._leader_id or state.round_timeout == float('inf'):
+            return
+
+        deadline = state.last_prepare_time + state.round_timeout
+        state.round_timer = self.schedule(deadline - self.now, self.round_timeout, instance)
 
+    def arm_decide_timeout(self, instance: InstanceID) -> None:
+        """
+        (Re)schedule the timeout for receiving the learner ACK of a decided instance
+        """
+        state = self._instances[instance]
+        self.cancel(state.decide_timer)
+        state.decide_timer = None
         if self.id != self._leader_id:
             return
 
-        for instance in self._undecided_instances:
-            if (time.time() - self._last_prepare_time[instance]) > self._round_timeouts[instance]:
-                #print('\033[93m' + "Instance {0} round {1} exceeded timeout!".format(instance, self._round_id[instance]) + "\033[0m")
-                self._round_timeouts[instance] *= Proposer.TIMEOUT_GROWTH_FACTOR
-                self._enable_phase1_optimization = False
-                self.prepare_phase_parallel(instance)
-                # Handle a single time out per loop to improve responsiveness to input messages
-                break
-
-        for instance in self._decided_values.keys():
-            if not self._acked_decided_values[instance]:
-                if (time.time() - self._last_decide_time[instance]) > self._learners_decide_timeout[instance]:
-                    # Timed out waiting the learner ACK: send the decided value to the learners and increase the timeout
-                    self._learners_decide_timeout[instance] *= Proposer.TIMEOUT_GROWTH_FACTOR
-                    decide_message: Decide = Decide(sender=self,
-                                                    receiver_role=Role.LEARNER,
-                                                    payload=DecidePayload((self._decided_values[instance], instance))
-                                                    )
-                    self.send(decide_message)
-
-                    # Handle a single time out per loop to improve responsiveness to input messages
-                    break
+        deadline = state.last_decide_time + state.decide_timeout
+        state.decide_timer = self.schedule(deadline - self.now, self.decide_timeout, instance)
+
+    def round_timeout(self, instance: InstanceID) -> None:
+        """
+        The current round of the instance timed out: start a new round with higher timeout
+        """
+        state = self._instances[instance]
+        state.round_timer = None
+        if self.id != self._leader_id or state.decided:
+            return
+
+        state.round_timeout = min(state.round_timeout * Proposer.TIMEOUT_GROWTH_FACTOR, Proposer.MAX_TIMEOUT)
+        self.metrics.increment('round_retransmissions')
+        self.prepare_phase_parallel(instance)
+
+    def decide_timeout(self, instance: InstanceID) -> None:
+        """
+        Timed out waiting the learner ACK: send the decided value to the learners and increase the timeout
+        """
+        state = self._instances[instance]
+        state.decide_timer = None
+        if self.id != self._leader_id:
+            return
+
+        state.decide_timeout = min(state.decide_timeout * Proposer.TIMEOUT_GROWTH_FACTOR, Proposer.MAX_TIMEOUT)
+        self.metrics.increment('decide_retransmissions')
+        decide_message: Decide = Decide(sender=self,
+                                        receiver_role=Role.LEARNER,
+                                        payload=DecidePayload((state.decided_value, instance))
+                                        )
+        self.send(decide_message)
+        state.last_decide_time = self.now
+        self.arm_decide_timeout(instance)
 
     # --------------------------------------------------- #
 
     # ----- LEADER ELECTION ORACLE --------------- #
 
     def send_heartbeat(self) -> None:
-        if (time.time() - self._last_heartbeat_sent) > self.HEARBEAT_RATE or self._last_heartbeat_sent == 0.0:
+        if (self.now - self._last_heartbeat_sent) > self.HEARBEAT_RATE or self._last_heartbeat_sent == 0.0:
             heatbeat: HeartBeat = HeartBeat(sender=self,
                                             receiver_role=Role.PROPOSER,
                                             payload=self.id)
             self.send(heatbeat)
-            self._last_heartbeat_sent = time.time()
+            self._last_heartbeat_sent = self.now
+
+            # The leader renews its lease at every heartbeat
+            if self.id == self._leader_id:
+                sequence = self._lease.request(self.now)
+                self.send(LeaseRequest(sender=self,
+                                       receiver_role=Role.ACCEPTOR,
+                                       payload=LeaseRequestPayload((sequence, self._leader_round,
+                                                                    self._finished_watermark))))
 
     def heartbeat_handler(self, hearbeat: HeartBeat) -> None:
         id: float = hearbeat.payload
@@ -291,53 +655,127 @@ class Proposer(Node):
             self._known_proposers.append(id)
 
         if id == self._leader_id:
-            self._last_heartbeat_leader = time.time()
+            self._last_heartbeat_leader = self.now
 
     def check_heartbeat(self):
         if self.id == self._leader_id:
             return
 
-        if (time.time() - self._last_heartbeat_leader) > self.HEARTBEAT_TIMEOUT:
-            self._phase1_preprepared = False
-            # It is not safe to pre prepare again phase 1 beacouse the previous leader may still be active and there
-            # is no way to know for sure the id of the last round in which it proposed!
-            self._enable_phase1_optimization = False
+        if (self.now - self._last_heartbeat_leader) > self.HEARTBEAT_TIMEOUT:
+            self._stable_leader = False
+            self._lease.revoke()
+            self._pending_reads = {}
 
             if self._leader_id in self._known_proposers:
                 self._known_proposers.remove(self._leader_id)
             self._leader_id = min(self._known_proposers)
+            self.metrics.increment('leader_changes')
             self.log_warning("Elected proposer {0} as the new leader".format(self._leader_id, self.id))
+
+            if self._leader_id == self.id:
+                # Take over the timeouts of all the instances that are still pending
+                for instance in self._undecided_instances:
+                    self.arm_round_timeout(instance)
+                for instance in self._unacked_instances:
+                    self.arm_decide_timeout(instance)
+                # A new leader round makes the acceptors ignore the previous leader, if still alive
+                self.start_leader_phase1()
             self.send_heartbeat()
-            self._last_heartbeat_sent = time.time()
-            self._last_heartbeat_leader = time.time()
+            self._last_heartbeat_sent = self.now
+            self._last_heartbeat_leader = self.now
 
     # -------------------------------------------- #
 
-    def run(self) -> NoReturn:
-        self.log_info('Start running...')
+    # ----- LEADER LEASE AND READS --------------- #
 
-        # Warn user about disabled features
-        if self.disable_timout:
-            self.log_warning('Disabled round timeouts')
-        if not self._enable_phase1_optimization:
-            self.log_warning('Disabled phase 1 pre-execution')
+    def lease_grant_callback(self, grant: LeaseGrant) -> None:
+        proposer_id, sequence, low_water_mark = grant.payload
+        self._acceptor_last_seen[grant.sender_id] = self.now
+        self.finish_truncated(low_water_mark)
+        if proposer_id == self.id:
+            self._lease.granted(sequence, grant.sender_id)
+            return
+
+        # Acceptors granting the latest lease request of every other proposer: once a quorum of them granted it, that
+        # proposer is the leader and the acceptors refuse the Prepare messages of this one, which steps down
+        granted_sequence, acceptors = self._rival_grants.get(proposer_id, (sequence, 0))
+        if sequence != granted_sequence:
+            acceptors = 0
+        acceptors |= 1 << grant.sender_id
+        self._rival_grants[proposer_id] = (sequence, acceptors)
+        if (bin(acceptors).count('1') >= self._lease_quorum_size and self.id == self._leader_id
+                and not self._lease.valid(self.now)):
+            self.step_down(proposer_id)
+
+    def step_down(self, leader_id: int) -> None:
+        """
+        Follow another proposer holding the lease, e.g. after a partition that isolated this leader; the clients
+        retransmit the requests it did not get decided to the new leader
+        """
+        self._leader_id = leader_id
+        self._last_heartbeat_leader = self.now
+        if leader_id not in self._known_proposers:
+            self._known_proposers.append(leader_id)
+        self.start_leader_phase1()
+        self._pending_reads = {}
+        self.metrics.increment('leader_changes')
+        self.log_warning("Stepped down, proposer {0} holds the lease".format(leader_id))
+
+    def can_serve_reads(self) -> bool:
+        """
+        While the lease is valid no other proposer can get a value decided, so a stable leader knows about every
+        instance decided from the first one of its range
+        """
+        return self.id == self._leader_id and self._stable_leader and self._lease.valid(self.now)
+
+    def read_request_callback(self, read_request: ReadRequest) -> None:
+        request_id, instance = read_request.payload
+        client_id = read_request.sender_id
+        if not self.can_serve_reads():
+            return
 
+        if instance in self._decided_log:
+            self.send_read_response(client_id, request_id, instance, ReadStatus.DECIDED, self._decided_log[instance])
+        elif instance in self._undecided_instances:
+            # Proposed but not decided yet, answered with its decision
+            self._pending_reads.setdefault(instance, []).append((client_id, request_id))
+        elif instance >= self._leader_range_first and not self.is_finished(instance):
+            # Never proposed by the leader, so not decided
+            self.send_read_response(client_id, request_id, instance, ReadStatus.UNDECIDED, None)
+        else:
+            # Decided before this proposer saw it, or dropped from its decided log: the client has to read it from a learner
+            self.send_read_response(client_id, request_id, instance, ReadStatus.UNAVAILABLE, None)
+
+    def answer_pending_reads(self, instance: InstanceID, value: PaxosValue) -> None:
+        for client_id, request_id in self._pending_reads.pop(instance, ()):
+            self.send_read_response(client_id, request_id, instance, ReadStatus.DECIDED, value)
+
+    def send_read_response(self, client_id: int, request_id: int, instance: InstanceID, status: ReadStatus,
+                           value: PaxosValue) -> None:
+        self.send(ReadResponse(sender=self,
+                               receiver_role=Role.CLIENT,
+                               payload=ReadResponsePayload((client_id, request_id, instance, status, value))))
 
-        self.start_time = time.time()
-        self._last_heartbeat_leader: float = time.time()
+    # -------------------------------------------- #
 
-        while True:
-            # Check for termination
-            if self.lifetime > 0.0:
-                if (time.time()-self.start_time) > self.lifetime:
-                    self.log_warning("Terminating...")
-                    break
+    def on_start(self) -> None:
+        # Warn user about disabled features
+        if self.disable_timout:
+            self.log_warning('Disabled round timeouts')
+        if not self._stable_leader_enabled:
+            self.log_warning('Disabled stable leader, phase 1 is executed for every instance')
+        if self._thrifty:
+            self.log_warning('Thrifty mode, values are proposed to a quorum of acceptors first')
 
-            self.send_heartbeat()
+        self._last_heartbeat_leader = self.now
+        self.start_leader_phase1()
 
-            message: MessageT = self.listen()
-            if message is not None and message.message_type in self._message_callbacks:
-                self._message_callbacks[message.message_type](message)
+    def tick(self) -> None:
+        self.check_heartbeat()
+        self.send_heartbeat()
 
-            self.check_heartbeat()
-            self.check_for_timeouts()
+    def next_wakeup(self) -> float:
+        wakeup = self._last_heartbeat_sent + Proposer.HEARBEAT_RATE
+        if self.id != self._leader_id:
+            wakeup = min(wakeup, self._last_heartbeat_leader + Proposer.HEARTBEAT_TIMEOUT)
+        return wakeup
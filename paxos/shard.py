@@ -0,0 +1,75 @@
+# Sharded Multi-Paxos.
+#
+# A sharded deployment runs N independent Paxos groups, each with its own proposers, acceptors and learners, which
+# can run as separate processes on one machine or on different hosts. The instance space is partitioned round-robin:
+# global instance g belongs to shard (g - 1) mod N, where it is local instance (g - 1) div N + 1, so every group
+# numbers its instances from 1 as an unsharded deployment does. The globally ordered log is obtained by interleaving
+# the decisions of the shards.
+#
+# Shard 0 uses the addresses of paxos.conf; shard k uses the addresses of the lines of paxos.conf ending with k, or
+# the default addresses with the port shifted by k * SHARD_PORT_STRIDE. The nodes check at startup that no two groups
+# of any shard, including the addresses of the single acceptors (the acceptor group with the port shifted by the
+# acceptor ID), share an address.
+
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from paxos.message import InstanceID, PaxosValue
+from paxos.network import Network, NetworkGroup
+from paxos.role import Role
+
+# Port offset between the groups of consecutive shards, leaving room for the addresses of the single acceptors
+SHARD_PORT_STRIDE = 100
+
+
+def shard_of(instance: InstanceID, shards: int) -> int:
+    return (instance - 1) % shards
+
+
+def local_instance(instance: InstanceID, shards: int) -> InstanceID:
+    return InstanceID((instance - 1) // shards + 1)
+
+
+def global_instance(shard: int, instance: InstanceID, shards: int) -> InstanceID:
+    return InstanceID((instance - 1) * shards + shard + 1)
+
+
+def shard_group(group: NetworkGroup, shard: int) -> NetworkGroup:
+    """
+    Default address of a group of the given shard
+    """
+    address, port = group
+    return NetworkGroup((address, port + shard * SHARD_PORT_STRIDE))
+
+
+def check_addresses(networks: List[Network]) -> None:
+    """
+    Asserts that the networks of all the shards do not share any address: a shard stride smaller than the number of
+    acceptors, or too many shards for the gap between the ports of two roles, would mix the messages of two groups
+    """
+    owners: Dict[NetworkGroup, Tuple[int, str]] = {}
+    for network in networks:
+        addresses = [(role.name.lower() + 's', network[role]) for role in Role]
+        addresses += [('acceptor {0}'.format(acceptor_id), network.acceptor_address(acceptor_id))
+                      for acceptor_id in range(1, network.acceptor_count + 1)]
+        for name, address in addresses:
+            owner = owners.setdefault(address, (network.shard, name))
+            assert owner == (network.shard, name), \
+                "Address {0}:{1} of the {2} of shard {3} is also the one of the {4} of shard {5}".format(
+                    address[0], address[1], name, network.shard, owner[1], owner[0])
+
+
+def merge_decisions(shard_decisions: List[Iterable[Tuple[InstanceID, PaxosValue]]]) \
+        -> Iterator[Tuple[InstanceID, PaxosValue]]:
+    """
+    Merges the (local instance, value) decisions of every shard, in shard order, into the (global instance, value)
+    decisions of the global log, in increasing order of global instance
+    """
+    shards = len(shard_decisions)
+    decided = [dict(decisions) for decisions in shard_decisions]
+    highest = max((global_instance(shard, max(values), shards) for shard, values in enumerate(decided) if values),
+                  default=0)
+    for instance in range(1, highest + 1):
+        values = decided[shard_of(instance, shards)]
+        local = local_instance(instance, shards)
+        if local in values:
+            yield InstanceID(instance), values[local]
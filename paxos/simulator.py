@@ -0,0 +1,320 @@
+# Deterministic network simulator.
+#
+# Clients, proposers, acceptors and learners run together in a single process on a virtual clock: every node is
+# created with a SimulatedTransport and the clock of the simulator, which plays the node loops as discrete events.
+# A datagram sent to a group is delivered to every node bound to its address after a random delay, unless the
+# network loses it or a partition separates the two nodes, and it may be delayed further (reordered) or delivered
+# twice. The iterations of the node loops take no virtual time, and the clock jumps from an event to the next one,
+# so a run takes only the time the nodes spend handling their messages.
+#
+# All the random draws of the network, and the package loss of the nodes, come from generators seeded by the seed
+# of the simulator, and the events are handled in a deterministic order: a run depends only on the seed, the network
+# conditions and the scripted events, so any failure can be reproduced from its seed.
+#
+# To measure performance, the iterations can instead take the time they actually took to run: every node then
+# behaves as a process with a core of its own, which makes the run depend on the speed of the machine.
+
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+import heapq
+import itertools
+import random
+import time as real_time
+
+from paxos.network import NetworkGroup
+from paxos.node import Node
+from paxos.transport import Transport
+
+
+class NetworkConditions:
+    """
+    Faults of the simulated network, drawn independently for every receiver of a datagram
+    """
+
+    def __init__(self,
+                 loss: float = 0.0,
+                 min_delay: float = 0.0002,
+                 max_delay: float = 0.001,
+                 reordering: float = 0.0,
+                 reorder_delay: float = 0.005,
+                 duplication: float = 0.0) -> None:
+        """
+        A datagram is lost with probability loss, otherwise it is delivered after a delay uniformly drawn between
+        min_delay and max_delay (in sec); with probability reordering it is held for up to reorder_delay more, so the
+        datagrams sent after it overtake it, and with probability duplication it is delivered twice
+        """
+        assert 0.0 <= loss < 1.0 and 0.0 <= reordering <= 1.0 and 0.0 <= duplication <= 1.0, \
+            "Probabilities should be between 0 and 1 (loss excluded)"
+        assert 0.0 <= min_delay <= max_delay and reorder_delay >= 0.0, "Delays should be positive and ordered"
+        self.loss = loss
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.reordering = reordering
+        self.reorder_delay = reorder_delay
+        self.duplication = duplication
+
+    def delay(self, generator: random.Random) -> float:
+        delay = generator.uniform(self.min_delay, self.max_delay)
+        if self.reordering and generator.random() < self.reordering:
+            delay += generator.uniform(0.0, self.reorder_delay)
+        return delay
+
+
+class SimulatedTransport(Transport):
+    """
+    Transport of a node attached to a simulator: datagrams are handed to the simulator and queued in the inbox of the
+    node until its next loop iteration
+    """
+
+    def __init__(self, simulator: 'Simulator') -> None:
+        self.__simulator = simulator
+        self.inbox: List[bytes] = []
+        self.node: Optional[Node] = None
+
+    def bind(self, address: NetworkGroup) -> None:
+        self.__simulator.bind(self, address)
+
+    def send(self, datagram: bytes, address: NetworkGroup) -> None:
+        self.__simulator.transmit(self, datagram, address)
+
+    def receive(self, timeout: Optional[float]) -> Iterator[memoryview]:
+        # The simulator only runs an iteration of the node once its datagrams are delivered, so it never waits
+        inbox, self.inbox = self.inbox, []
+        for datagram in inbox:
+            yield memoryview(datagram)
+
+    def close(self) -> None:
+        self.__simulator.unbind(self)
+
+
+class Simulator:
+    """
+    Discrete event simulation of the nodes created with node_options() and added to it
+    """
+    # Virtual time at which the simulation starts: the roles initialize some timestamps to 0, as for the monotonic
+    # clock of a running machine the origin is far in the past
+    START_TIME = 1000.0
+    # Minimum virtual time between two iterations of the loop of a node, so a node always due cannot stall the clock
+    MIN_STEP = 1e-6
+    # Default virtual time a node takes to wake up once a datagram is delivered
+    ITERATION_DELAY = 0.0001
+
+    def __init__(self, seed: int = 0, conditions: NetworkConditions = None,
+                 iteration_delay: float = ITERATION_DELAY, processing_time: bool = False) -> None:
+        """
+        The datagrams delivered to a node within iteration_delay seconds are handled by the same iteration of its
+        loop, as a busy node drains its socket, which lets the batching of the roles take effect.
+        With processing_time every iteration takes the time it took to run: the datagrams it sends leave when it
+        ends, and the node starts its next iteration only then
+        """
+        assert iteration_delay >= 0.0, "The iteration delay should not be negative"
+        self.seed = seed
+        self.conditions = conditions if conditions is not None else NetworkConditions()
+        self.iteration_delay = iteration_delay
+        self.processing_time = processing_time
+        self.random = random.Random(seed)
+        # The package loss ratio of the nodes draws from the global generator
+        random.seed(seed)
+
+        self.__now = Simulator.START_TIME
+        # Events as (time, sequence number, callback, arguments); the sequence number keeps simultaneous events in
+        # the order they were scheduled
+        self.__events = []
+        self.__sequence = itertools.count()
+
+        self.__receivers: Dict[NetworkGroup, List[SimulatedTransport]] = defaultdict(list)
+        self.__nodes: List[Node] = []
+        # Time of the next iteration scheduled for every running node
+        self.__wakeups: Dict[SimulatedTransport, float] = {}
+        # Side of the partition of every node listed in the current partition
+        self.__sides: Dict[SimulatedTransport, int] = {}
+        # With processing_time, time at which the last iteration of every node ended, and datagrams sent by the
+        # running iteration as (sender, datagram, address)
+        self.__busy: Dict[SimulatedTransport, float] = {}
+        self.__outbox: Optional[List[Tuple[SimulatedTransport, bytes, NetworkGroup]]] = None
+
+        # Statistics of the network: datagrams sent by the nodes, then for every receiver of a multicast datagram
+        self.transmitted = 0
+        self.sent = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.duplicated = 0
+
+    # ---- Nodes ---- #
+
+    def clock(self) -> float:
+        return self.__now
+
+    @property
+    def now(self) -> float:
+        return self.__now
+
+    @property
+    def nodes(self) -> List[Node]:
+        """
+        Nodes running, not stopped or crashed
+        """
+        return [node for node in self.__nodes if node.transport.node is not None]
+
+    def node_options(self) -> dict:
+        """
+        Options to create a node attached to this simulator with, e.g. Acceptor(1, network, 0.0, 0.0,
+        **simulator.node_options())
+        """
+        return {'transport': SimulatedTransport(self), 'clock': self.clock}
+
+    def add(self, node: Node, at: float = None) -> Node:
+        """
+        Starts node at the given virtual time, now by default
+        """
+        transport = node.transport
+        assert isinstance(transport, SimulatedTransport), "The node should be created with the options of node_options"
+        self.__nodes.append(node)
+        self.at(self.__now if at is None else at, self.__start, node)
+        return node
+
+    def stop(self, node: Node) -> None:
+        """
+        Stops node as if its lifetime was over
+        """
+        if node.transport.node is not None:
+            node.update_clock()
+            node.stop()
+
+    def crash(self, node: Node) -> None:
+        """
+        Stops node at once, without letting it run on_stop; the datagrams in flight to it are lost
+        """
+        self.unbind(node.transport)
+
+    def shutdown(self) -> None:
+        for node in self.nodes:
+            self.stop(node)
+
+    # ---- Network ---- #
+
+    def bind(self, transport: SimulatedTransport, address: NetworkGroup) -> None:
+        self.__receivers[address].append(transport)
+
+    def unbind(self, transport: SimulatedTransport) -> None:
+        for receivers in self.__receivers.values():
+            if transport in receivers:
+                receivers.remove(transport)
+        self.__wakeups.pop(transport, None)
+        self.__busy.pop(transport, None)
+        transport.inbox = []
+        transport.node = None
+
+    def transmit(self, sender: SimulatedTransport, datagram: bytes, address: NetworkGroup) -> None:
+        if self.__outbox is not None:
+            self.__outbox.append((sender, datagram, address))
+        else:
+            self.__transmit(self.__now, sender, datagram, address)
+
+    def partition(self, *sides: Iterable[Node]) -> None:
+        """
+        Splits the network: the nodes of different sides cannot reach each other, while the nodes not listed in any
+        side still reach all the others. Replaces the previous partition, if any
+        """
+        self.__sides = {node.transport: side for side, nodes in enumerate(sides) for node in nodes}
+
+    def heal(self) -> None:
+        self.__sides = {}
+
+    def connected(self, sender: SimulatedTransport, receiver: SimulatedTransport) -> bool:
+        sender_side = self.__sides.get(sender)
+        receiver_side = self.__sides.get(receiver)
+        return sender_side is None or receiver_side is None or sender_side == receiver_side
+
+    # ---- Events ---- #
+
+    def at(self, time: float, callback: Callable, *args) -> None:
+        """
+        Executes callback(*args) once the virtual clock reaches time, e.g. to crash a node or partition the network
+        """
+        heapq.heappush(self.__events, (time, next(self.__sequence), callback, args))
+
+    def run(self, until: float = float('inf'), condition: Callable[[], bool] = None) -> bool:
+        """
+        Handles the events until the condition holds, returning True, or the virtual clock reaches until or no event
+        is left, returning False
+        """
+        events = self.__events
+        while events:
+            if condition is not None and condition():
+                return True
+            if events[0][0] > until:
+                self.__now = until
+                return False
+            time, _, callback, args = heapq.heappop(events)
+            self.__now = time
+            callback(*args)
+        return condition is not None and condition()
+
+    def __transmit(self, time: float, sender: SimulatedTransport, datagram: bytes, address: NetworkGroup) -> None:
+        conditions = self.conditions
+        generator = self.random
+        self.transmitted += 1
+        for receiver in self.__receivers.get(address, ()):
+            self.sent += 1
+            if not self.connected(sender, receiver) or generator.random() < conditions.loss:
+                self.dropped += 1
+                continue
+            self.at(time + conditions.delay(generator), self.__deliver, receiver, datagram)
+            if conditions.duplication and generator.random() < conditions.duplication:
+                self.duplicated += 1
+                self.at(time + conditions.delay(generator), self.__deliver, receiver, datagram)
+
+    def __start(self, node: Node) -> None:
+        # The datagrams delivered before are lost, as for a process not started yet
+        transport = node.transport
+        transport.node = node
+        node.start()
+        self.__iterate(transport, None)
+
+    def __deliver(self, transport: SimulatedTransport, datagram: bytes) -> None:
+        if transport.node is None:
+            return
+        self.delivered += 1
+        transport.inbox.append(datagram)
+        self.__wake(transport, self.__now + self.iteration_delay)
+
+    def __wake(self, transport: SimulatedTransport, time: float) -> None:
+        if self.processing_time:
+            time = max(time, self.__busy.get(transport, time))
+        if self.__wakeups.get(transport, float('inf')) <= time:
+            return
+        self.__wakeups[transport] = time
+        self.at(time, self.__iterate, transport, time)
+
+    def __iterate(self, transport: SimulatedTransport, time: Optional[float]) -> None:
+        # Iterations superseded by an earlier one are skipped
+        if time is not None and self.__wakeups.get(transport) != time:
+            return
+        self.__wakeups.pop(transport, None)
+        node = transport.node
+        if node is None:
+            return
+
+        node.update_clock()
+        if node.expired:
+            node.stop()
+            return
+        if self.processing_time:
+            wakeup = self.__timed_step(transport, node)
+        else:
+            wakeup = node.step(node.receive(0.0))
+        if wakeup != float('inf') and transport.node is not None:
+            self.__wake(transport, max(wakeup, self.__now + Simulator.MIN_STEP))
+
+    def __timed_step(self, transport: SimulatedTransport, node: Node) -> float:
+        self.__outbox = []
+        started = real_time.perf_counter()
+        wakeup = node.step(node.receive(0.0))
+        end = self.__now + (real_time.perf_counter() - started)
+
+        outbox, self.__outbox = self.__outbox, None
+        self.__busy[transport] = end
+        for sender, datagram, address in outbox:
+            self.__transmit(end, sender, datagram, address)
+        return wakeup
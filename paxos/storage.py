@@ -0,0 +1,288 @@
+from typing import Dict, Iterable, Iterator, List, Tuple
+import os
+import struct
+import zlib
+
+from paxos.codec import CodecError, read_value, read_varint, write_value, write_varint
+from paxos.message import InstanceID, PaxosValue, RoundID
+
+
+class RecordLog:
+    """
+    Append-only file of checksummed records.
+    Appended records are buffered in memory and written to disk with a single write and fsync by sync(), so that the
+    cost of durability is shared by all the records appended in between.
+
+    Each record is stored as its length and CRC32 followed by its content. An index file next to the log stores the
+    length of the log known to be durable at the last sync: on startup the records before that point are loaded
+    without checking them again, while the tail written after the last sync is validated and truncated at the first
+    torn or corrupted record.
+    """
+    RECORD_HEADER = struct.Struct('!II')
+    # Durable length of the log and number of records before that length, followed by the CRC32 of the two
+    INDEX_ENTRY = struct.Struct('!QI')
+    INDEX_CRC = struct.Struct('!I')
+
+    def __init__(self, path: str) -> None:
+        self.__path = path
+        self.__index_path = path + '.idx'
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.__file = open(path, 'a+b')
+        self.__index_fd = os.open(self.__index_path, os.O_RDWR | os.O_CREAT, 0o644)
+        self.__buffer = bytearray()
+        self.__pending_records = 0
+
+        self.__recovered, self.__length = self.__recover()
+        self.__records = len(self.__recovered)
+
+    @property
+    def path(self) -> str:
+        return self.__path
+
+    @property
+    def records(self) -> int:
+        """
+        Number of records in the log, including the ones appended after the last sync
+        """
+        return self.__records + self.__pending_records
+
+    @property
+    def dirty(self) -> bool:
+        """
+        Whether some records were appended after the last sync
+        """
+        return self.__pending_records > 0
+
+    def recovered_records(self) -> List[memoryview]:
+        """
+        Returns the records found in the log when it was opened; they are handed out only once to free memory
+        """
+        records, self.__recovered = self.__recovered, []
+        return records
+
+    def append(self, record: bytes) -> None:
+        self.__buffer += RecordLog.RECORD_HEADER.pack(len(record), zlib.crc32(record))
+        self.__buffer += record
+        self.__pending_records += 1
+
+    def sync(self) -> None:
+        """
+        Writes all the buffered records and waits for them to be on disk
+        """
+        if not self.__pending_records:
+            return
+
+        self.__file.write(self.__buffer)
+        self.__file.flush()
+        os.fsync(self.__file.fileno())
+
+        self.__length += len(self.__buffer)
+        self.__records += self.__pending_records
+        self.__buffer = bytearray()
+        self.__pending_records = 0
+        self.__write_index()
+
+    def rewrite(self, records: Iterable[bytes]) -> None:
+        """
+        Replaces all the records of the log with the given ones: they are written and synced to a new file, which then
+        atomically takes the place of the log, so a crash leaves either the old log or the new one
+        """
+        assert not self.dirty, "Records appended to {0} must be synced before it is rewritten".format(self.__path)
+        content = bytearray()
+        count = 0
+        for record in records:
+            content += RecordLog.RECORD_HEADER.pack(len(record), zlib.crc32(record))
+            content += record
+            count += 1
+
+        temporary_path = self.__path + '.tmp'
+        with open(temporary_path, 'wb') as file:
+            file.write(content)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary_path, self.__path)
+        # The rename itself must be durable before anything is appended to the new log
+        directory_fd = os.open(os.path.dirname(self.__path) or '.', os.O_RDONLY)
+        try:
+            os.fsync(directory_fd)
+        finally:
+            os.close(directory_fd)
+
+        self.__file.close()
+        self.__file = open(self.__path, 'a+b')
+        self.__length = len(content)
+        self.__records = count
+        self.__write_index()
+
+    def __write_index(self) -> None:
+        # The index is only a hint for recovery, so it is not synced: a stale index just means more to validate
+        entry = RecordLog.INDEX_ENTRY.pack(self.__length, self.__records)
+        os.pwrite(self.__index_fd, entry + RecordLog.INDEX_CRC.pack(zlib.crc32(entry)), 0)
+
+    def close(self) -> None:
+        self.sync()
+        self.__file.close()
+        os.close(self.__index_fd)
+
+    @staticmethod
+    def iter_records(path: str) -> Iterator[bytes]:
+        """
+        Streams the valid records of a log, stopping at the first torn or corrupted record
+        """
+        header_size = RecordLog.RECORD_HEADER.size
+        with open(path, 'rb') as file:
+            while True:
+                header = file.read(header_size)
+                if len(header) < header_size:
+                    return
+                length, crc = RecordLog.RECORD_HEADER.unpack(header)
+                record = file.read(length)
+                if len(record) < length or zlib.crc32(record) != crc:
+                    return
+                yield record
+
+    def __read_index(self) -> int:
+        size = RecordLog.INDEX_ENTRY.size
+        raw = os.pread(self.__index_fd, size + RecordLog.INDEX_CRC.size, 0)
+        if len(raw) < size + RecordLog.INDEX_CRC.size:
+            return 0
+        if zlib.crc32(raw[:size]) != RecordLog.INDEX_CRC.unpack_from(raw, size)[0]:
+            return 0
+        return RecordLog.INDEX_ENTRY.unpack_from(raw)[0]
+
+    def __recover(self) -> Tuple[List[memoryview], int]:
+        self.__file.seek(0)
+        data = memoryview(self.__file.read())
+
+        durable_length = self.__read_index()
+        if durable_length > len(data):
+            # The index does not match the log, validate everything
+            durable_length = 0
+
+        header_size = RecordLog.RECORD_HEADER.size
+        records = []
+        pos = 0
+        while pos + header_size <= len(data):
+            length, crc = RecordLog.RECORD_HEADER.unpack_from(data, pos)
+            end = pos + header_size + length
+            if end > len(data):
+                break
+            record = data[pos + header_size:end]
+            if end > durable_length and zlib.crc32(record) != crc:
+                break
+            records.append(record)
+            pos = end
+
+        if pos < len(data):
+            # Drop the torn tail, so new records are appended right after the last valid one
+            self.__file.truncate(pos)
+        return records, pos
+
+
+class DecisionLog(RecordLog):
+    """
+    Log of the values decided by a learner, one record per decided instance in the order they were decided
+    """
+
+    def append_decision(self, instance: InstanceID, value: PaxosValue) -> None:
+        record = bytearray()
+        write_varint(record, instance)
+        write_value(record, value)
+        self.append(record)
+
+    def recover_decisions(self) -> Dict[InstanceID, PaxosValue]:
+        return dict(DecisionLog.__parse(record) for record in self.recovered_records())
+
+    @staticmethod
+    def read_decisions(path: str) -> Iterator[Tuple[InstanceID, PaxosValue]]:
+        """
+        Streams the (instance, value) pairs stored in the decision log at path
+        """
+        for record in RecordLog.iter_records(path):
+            yield DecisionLog.__parse(memoryview(record))
+
+    @staticmethod
+    def __parse(record: memoryview) -> Tuple[InstanceID, PaxosValue]:
+        instance, pos = read_varint(record, 0)
+        value, pos = read_value(record, pos)
+        if pos != len(record):
+            raise CodecError("Malformed decision record")
+        return InstanceID(instance), value
+
+
+class AcceptorLog(RecordLog):
+    """
+    Write-ahead log of the state of an acceptor: every promise, accept and promise given to a stable leader for a
+    range of instances is logged before the acceptor replies, so that a restarted acceptor can rebuild its state by replaying the log.
+    Once the instances known to be decided by the learners are truncated, the log is compacted by rewriting it with the
+    records of the state of the instances left
+    """
+    PROMISE = 0
+    ACCEPT = 1
+    PROMISE_RANGE = 2
+    TRUNCATE = 3
+
+    def log_promise(self, instance: InstanceID, round_id: RoundID) -> None:
+        self.append(AcceptorLog.promise_record(instance, round_id))
+
+    def log_accept(self, instance: InstanceID, round_id: RoundID, value: PaxosValue) -> None:
+        self.append(AcceptorLog.accept_record(instance, round_id, value))
+
+    def log_promise_range(self, first: InstanceID, round_id: RoundID) -> None:
+        self.append(AcceptorLog.promise_range_record(first, round_id))
+
+    def log_truncate(self, low_water_mark: InstanceID) -> None:
+        self.append(AcceptorLog.truncate_record(low_water_mark))
+
+    @staticmethod
+    def promise_record(instance: InstanceID, round_id: RoundID) -> bytes:
+        record = bytearray((AcceptorLog.PROMISE,))
+        write_varint(record, instance)
+        write_varint(record, round_id)
+        return record
+
+    @staticmethod
+    def accept_record(instance: InstanceID, round_id: RoundID, value: PaxosValue) -> bytes:
+        record = bytearray((AcceptorLog.ACCEPT,))
+        write_varint(record, instance)
+        write_varint(record, round_id)
+        write_value(record, value)
+        return record
+
+    @staticmethod
+    def promise_range_record(first: InstanceID, round_id: RoundID) -> bytes:
+        record = bytearray((AcceptorLog.PROMISE_RANGE,))
+        write_varint(record, first)
+        write_varint(record, round_id)
+        return record
+
+    @staticmethod
+    def truncate_record(low_water_mark: InstanceID) -> bytes:
+        record = bytearray((AcceptorLog.TRUNCATE,))
+        write_varint(record, low_water_mark)
+        return record
+
+    def replay(self) -> Iterator[Tuple[int, InstanceID, RoundID, PaxosValue]]:
+        """
+        Yields the (kind, instance, round, value) entries recovered from the log in the order they were logged; for
+        PROMISE_RANGE entries the instance is the first one of the range, for TRUNCATE entries the low-water mark
+        """
+        for record in self.recovered_records():
+            kind = record[0]
+            if kind == AcceptorLog.TRUNCATE:
+                low_water_mark, _ = read_varint(record, 1)
+                yield kind, InstanceID(low_water_mark), RoundID(0), None
+                continue
+
+            instance, pos = read_varint(record, 1)
+            round_id, pos = read_varint(record, pos)
+            value = None
+            if kind == AcceptorLog.ACCEPT:
+                value, pos = read_value(record, pos)
+            elif kind not in (AcceptorLog.PROMISE, AcceptorLog.PROMISE_RANGE):
+                raise CodecError("Unknown acceptor log record {0}".format(kind))
+            yield kind, InstanceID(instance), RoundID(round_id), value
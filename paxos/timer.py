@@ -0,0 +1,81 @@
+from typing import Callable, List, Tuple
+import heapq
+import itertools
+
+
+class Timer:
+    """
+    Handle of a deadline registered in a TimerQueue, to be passed to TimerQueue.cancel to drop it before it expires.
+    """
+    __slots__ = ('deadline', 'callback', 'args', 'cancelled')
+
+    def __init__(self, deadline: float, callback: Callable, args: tuple) -> None:
+        self.deadline = deadline
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+
+class TimerQueue:
+    """
+    Binary heap of deadlines.
+    Scheduling costs O(log n), cancelling is O(1) (cancelled timers are dropped lazily when they reach the top of
+    the heap) and all the expired timers are fired in a single batch.
+    """
+
+    def __init__(self) -> None:
+        self.__heap: List[Tuple[float, int, Timer]] = []
+        # Sequence number used to break ties between equal deadlines, so timers fire in scheduling order
+        self.__sequence = itertools.count()
+        self.__cancelled = 0
+
+    def __len__(self) -> int:
+        return len(self.__heap) - self.__cancelled
+
+    def schedule(self, deadline: float, callback: Callable, *args) -> Timer:
+        """
+        Registers callback(*args) to be executed once the clock reaches deadline
+        """
+        timer = Timer(deadline, callback, args)
+        heapq.heappush(self.__heap, (deadline, next(self.__sequence), timer))
+        return timer
+
+    def cancel(self, timer: Timer) -> None:
+        if timer is None or timer.cancelled:
+            return
+        timer.cancelled = True
+        self.__cancelled += 1
+
+        # Rebuild the heap when it is mostly made of cancelled timers to keep memory bounded
+        if self.__cancelled > 1024 and self.__cancelled > len(self.__heap) // 2:
+            self.__heap = [entry for entry in self.__heap if not entry[2].cancelled]
+            heapq.heapify(self.__heap)
+            self.__cancelled = 0
+
+    def next_deadline(self) -> float:
+        """
+        Deadline of the earliest pending timer, infinity if there is none
+        """
+        heap = self.__heap
+        while heap and heap[0][2].cancelled:
+            heapq.heappop(heap)
+            self.__cancelled -= 1
+        return heap[0][0] if heap else float('inf')
+
+    def run_expired(self, now: float) -> int:
+        """
+        Fires all the timers whose deadline is not after now, returns the number of timers fired.
+        Timers scheduled by the callbacks themselves are fired in the same batch only if already expired.
+        """
+        fired = 0
+        # The heap is accessed through the attribute since callbacks cancelling timers may rebuild it
+        while self.__heap and self.__heap[0][0] <= now:
+            timer = heapq.heappop(self.__heap)[2]
+            if timer.cancelled:
+                self.__cancelled -= 1
+                continue
+            # Mark the timer as consumed, so cancelling it from now on is a no-op
+            timer.cancelled = True
+            timer.callback(*timer.args)
+            fired += 1
+        return fired
@@ -0,0 +1,90 @@
+# Per-instance tracing of a node.
+#
+# A node started with --trace=<directory> records a timestamped event whenever an instance passes through one of its
+# handlers (a client requesting a value, the proposer starting a round or proposing a value, an acceptor promising or
+# accepting, a learner deciding) and writes them to <directory>/<role><ID>.trace (<role><ID>_shard<k>.trace in a
+# sharded deployment). The events are fixed-size binary records buffered in memory and written in blocks, so a traced
+# node only pays for packing a few bytes per event; a node started without --trace records nothing.
+#
+# The timestamps are read from the clock of the node, the monotonic clock of the machine by default, so the traces of
+# nodes running on the same machine (or in the simulator) share the same time base and can be merged by
+# trace_report.py into per-instance timelines.
+
+from enum import IntEnum
+from typing import Iterator, Tuple
+import struct
+
+from paxos.role import Role
+
+
+class TraceEvent(IntEnum):
+    # A client sent the first request for the instance, resent it after a timeout, received the ACK of the leader (once
+    # the instance is decided)
+    CLIENT_REQUEST = 1
+    CLIENT_RETRANSMIT = 2
+    CLIENT_ACKED = 3
+    # A proposer received the first request for the instance, started a round with its own phase 1 or with the leader
+    # round, received a quorum of promises, proposed a value, saw a quorum of accepts, received the ACK of a learner
+    PROPOSER_REQUEST = 10
+    PROPOSER_PREPARE = 11
+    PROPOSER_LEADER_ROUND = 12
+    PROPOSER_PROMISED = 13
+    PROPOSER_PROPOSE = 14
+    PROPOSER_DECIDED = 15
+    PROPOSER_ACKED = 16
+    # An acceptor promised a round for the instance, accepted a value
+    ACCEPTOR_PROMISE = 20
+    ACCEPTOR_ACCEPT = 21
+    # A learner decided the instance from a quorum of accepts, from a Decide message, from a catch-up response
+    LEARNER_DECIDED = 30
+    LEARNER_DECIDE_MESSAGE = 31
+    LEARNER_CATCHUP = 32
+
+
+class Tracer:
+    """
+    Writer of the trace file of a node
+    """
+    # File header: magic, format version, role (index in Role), node ID and shard
+    HEADER = struct.Struct('!4sBBHH')
+    MAGIC = b'PXTR'
+    VERSION = 1
+    # Event: timestamp, instance and event type
+    EVENT = struct.Struct('!dQB')
+    # Size (in bytes) of the buffered events that triggers a write
+    BUFFER_SIZE = 64 * 1024
+
+    def __init__(self, path: str, role: Role, id: int, shard: int) -> None:
+        self.__file = open(path, 'wb')
+        self.__file.write(Tracer.HEADER.pack(Tracer.MAGIC, Tracer.VERSION, list(Role).index(role), id, shard))
+        self.__buffer = bytearray()
+        self.__pack = Tracer.EVENT.pack
+
+    def record(self, time: float, event: TraceEvent, instance: int) -> None:
+        self.__buffer += self.__pack(time, instance, event)
+        if len(self.__buffer) >= Tracer.BUFFER_SIZE:
+            self.flush()
+
+    def flush(self) -> None:
+        self.__file.write(self.__buffer)
+        self.__buffer = bytearray()
+
+    def close(self) -> None:
+        self.flush()
+        self.__file.close()
+
+    @staticmethod
+    def read(path: str) -> Tuple[Tuple[Role, int, int], Iterator[Tuple[float, int, TraceEvent]]]:
+        """
+        Reads a trace file, returns the role, ID and shard of its node and its events as (time, instance, event);
+        a truncated last event, e.g. of a node killed while writing, is ignored
+        """
+        with open(path, 'rb') as file:
+            data = file.read()
+        magic, version, role, id, shard = Tracer.HEADER.unpack_from(data)
+        if magic != Tracer.MAGIC or version != Tracer.VERSION:
+            raise ValueError("{0} is not a trace file of version {1}".format(path, Tracer.VERSION))
+        body = memoryview(data)[Tracer.HEADER.size:]
+        body = body[:len(body) - len(body) % Tracer.EVENT.size]
+        events = ((time, instance, TraceEvent(event)) for time, instance, event in Tracer.EVENT.iter_unpack(body))
+        return (list(Role)[role], id, shard), events
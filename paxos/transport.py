@@ -0,0 +1,139 @@
+from collections import deque
+from typing import Iterator, Optional, TextIO
+import os
+import selectors
+import socket
+
+from paxos.network import Network, NetworkGroup
+
+
+class Transport:
+    """
+    Datagram transport of a node: the addresses it receives from, sending and receiving.
+    A node uses a UdpTransport by default, the simulator (see simulator.py) replaces it with an in-memory network
+    """
+
+    def bind(self, address: NetworkGroup) -> None:
+        """
+        Receives the datagrams sent to address
+        """
+        raise NotImplementedError
+
+    def send(self, datagram: bytes, address: NetworkGroup) -> None:
+        raise NotImplementedError
+
+    def receive(self, timeout: Optional[float]) -> Iterator[memoryview]:
+        """
+        Blocks until at least a datagram is available or timeout seconds elapsed (forever if None), then yields the
+        datagrams received; each datagram is only valid until the next one is requested
+        """
+        raise NotImplementedError
+
+    def watch(self, fileobj, enabled: bool) -> None:
+        """
+        Starts or stops waking up receive, without yielding any datagram, when fileobj (e.g. a LineReader) is readable
+        """
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class UdpTransport(Transport):
+    """
+    Transport over UDP multicast sockets
+    """
+    # Maximum number of datagrams drained from a socket in a single call to receive
+    MAX_DATAGRAMS_PER_SOCKET = 64
+
+    def __init__(self) -> None:
+        self.__sender_socket = Network.udp_sender_socket()
+        # Datagrams are received into a preallocated buffer and decoded in place
+        self.__receive_buffer = bytearray(Network.SOCKET_BUFFSIZE)
+        self.__receive_view = memoryview(self.__receive_buffer)
+        # The node loop blocks on the selector until a datagram arrives or the next deadline of the node is due
+        self.__selector = selectors.DefaultSelector()
+
+    def bind(self, address: NetworkGroup) -> None:
+        self.__selector.register(Network.multicast_receiver_socket(address), selectors.EVENT_READ)
+
+    def send(self, datagram: bytes, address: NetworkGroup) -> None:
+        self.__sender_socket.sendto(datagram, address)
+
+    def receive(self, timeout: Optional[float]) -> Iterator[memoryview]:
+        for key, _ in self.__selector.select(None if timeout is None else max(timeout, 0.0)):
+            if key.data is not None:
+                # Watched input, read by the node itself
+                continue
+            receiver_socket = key.fileobj
+            for _ in range(UdpTransport.MAX_DATAGRAMS_PER_SOCKET):
+                try:
+                    size = receiver_socket.recv_into(self.__receive_buffer)
+                except socket.error:
+                    break
+                yield self.__receive_view[:size]
+
+    def watch(self, fileobj, enabled: bool) -> None:
+        if enabled and fileobj not in self.__selector.get_map():
+            self.__selector.register(fileobj, selectors.EVENT_READ, data='input')
+        elif not enabled and fileobj in self.__selector.get_map():
+            self.__selector.unregister(fileobj)
+
+    def close(self) -> None:
+        for key in list(self.__selector.get_map().values()):
+            if key.data is None:
+                key.fileobj.close()
+        self.__selector.close()
+        self.__sender_socket.close()
+
+
+class LineReader:
+    """
+    Reads the lines of a file (e.g. the standard input of a client) without ever blocking the node loop, which watches
+    it through the transport while it waits for a line
+    """
+    # Maximum number of bytes read at once
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, file: TextIO) -> None:
+        self.__fd = file.fileno()
+        self.__was_blocking = os.get_blocking(self.__fd)
+        os.set_blocking(self.__fd, False)
+        self.__partial = b''
+        self.__lines = deque()
+        self.__eof = False
+
+    def fileno(self) -> int:
+        return self.__fd
+
+    @property
+    def exhausted(self) -> bool:
+        return self.__eof and not self.__lines
+
+    def readline(self) -> Optional[str]:
+        """
+        Next line, without its line terminator, or None if no complete line is available yet or the input is over;
+        a regular file is never waited for, so None is only returned for it at the end of the file
+        """
+        while not self.__lines and not self.__eof and self.__fill():
+            pass
+        return self.__lines.popleft() if self.__lines else None
+
+    def close(self) -> None:
+        # The descriptor may be shared with other processes, e.g. a terminal
+        os.set_blocking(self.__fd, self.__was_blocking)
+
+    def __fill(self) -> bool:
+        # Returns whether anything was read
+        try:
+            data = os.read(self.__fd, LineReader.CHUNK_SIZE)
+        except BlockingIOError:
+            return False
+        if not data:
+            self.__eof = True
+            if self.__partial:
+                self.__lines.append(self.__partial.decode())
+            return False
+        *lines, self.__partial = (self.__partial + data).split(b'\n')
+        self.__lines.extend(line.decode() for line in lines)
+        return True
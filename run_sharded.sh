@@ -0,0 +1,82 @@
+#!/usr/bin/env bash
+
+# Runs a sharded deployment: every shard is an independent Paxos group with its own acceptors, learners, proposers
+# and clients, the clients of each shard requesting the values of the instances of their shard from the same input.
+# At the end the decision logs of the shards are merged into the globally ordered log of each learner.
+
+projdir="$1"
+conf=./paxos/paxos.conf
+n="$2"
+plr="$3"
+resultdir=./results
+time="$4"
+shards="$5"
+
+if [[ x$projdir == "x" || x$n == "x" || x$plr == "x" || x$time == "x" || x$shards == "x" ]]; then
+	echo "Usage: $0 <project dir> <number of values per client> <plr> <lifetime> <number of shards>"
+    exit 1
+fi
+
+NETWORK_SIZE=2
+
+# following line kills processes that have the config file in its cmdline
+KILLCMD="pkill -f $conf"
+
+$KILLCMD
+
+
+cd $projdir || exit
+mkdir $resultdir
+rm -r $resultdir/*
+
+
+./generate.sh $n > "$resultdir"/propose1.txt
+./generate.sh $n > "$resultdir"/propose2.txt
+
+# node <role> <id> <shard> [extra arguments]
+node() {
+    python3 -u ./main.py $1 $2 $conf $NETWORK_SIZE $plr $time "${@:4}" --shards=$shards --shard=$3
+}
+
+echo "Starting acceptors..."
+for shard in $(seq 0 $((shards - 1))); do
+    node acceptor 1 $shard &
+    node acceptor 2 $shard &
+    node acceptor 3 $shard &
+done
+echo "Starting acceptors...DONE"
+
+sleep 1
+echo "Starting learners..."
+for shard in $(seq 0 $((shards - 1))); do
+    node learner 1 $shard &
+    node learner 2 $shard &
+done
+echo "Starting learners...DONE"
+
+sleep 1
+echo "Starting proposers..."
+for shard in $(seq 0 $((shards - 1))); do
+    node proposer 1 $shard &
+    node proposer 2 $shard &
+done
+echo "Starting proposers...DONE"
+
+
+echo "Waiting to start clients"
+sleep 3
+echo "Starting clients..."
+for shard in $(seq 0 $((shards - 1))); do
+    node client 1 $shard < "$resultdir"/propose1.txt &
+    node client 2 $shard < "$resultdir"/propose2.txt &
+done
+echo "Starting clients...DONE"
+
+sleep $time
+sleep 5
+
+
+$KILLCMD
+wait
+
+./merge_shards.py $shards 2
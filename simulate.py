@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+
+# Runs Multi-Paxos executions in the deterministic network simulator (see paxos/simulator.py): the nodes of run.sh
+# run in this process on a virtual clock, and every execution is checked for integrity, agreement and termination
+# as check_results.py does. Each seed is an independent execution, and the seed of a failed execution reproduces it
+# exactly, e.g. with --verbose to see the logs of its nodes.
+#
+# Usage: ./simulate.py <number of values per client> [options], see ./simulate.py --help
+#
+# For example the following runs 100 executions of 1000 values with 10% loss, reordering and duplication:
+#
+#     ./simulate.py 1000 --seeds=1-100 --loss=0.1 --reordering=0.05 --duplication=0.01
+
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+from typing import List, Tuple
+
+from paxos import Acceptor, Client, Learner, Network, NetworkGroup, Proposer
+from paxos.simulator import NetworkConditions, Simulator
+
+
+def simulated_network(args: argparse.Namespace) -> Network:
+    # Addresses only name the groups, nothing is bound
+    return Network(args.quorum_size,
+                   NetworkGroup(('239.0.0.1', 5000)),
+                   NetworkGroup(('239.0.0.1', 6000)),
+                   NetworkGroup(('239.0.0.1', 7000)),
+                   NetworkGroup(('239.0.0.1', 8000)),
+                   acceptor_count=args.acceptors)
+
+
+def simulate(seed: int, args: argparse.Namespace, directory: str) -> Tuple[bool, str]:
+    """
+    Runs the execution of the given seed, returns whether it satisfied the consensus properties and a summary
+    """
+    simulator = Simulator(seed, NetworkConditions(loss=args.loss, min_delay=args.min_delay, max_delay=args.max_delay,
+                                                  reordering=args.reordering, duplication=args.duplication))
+    network = simulated_network(args)
+    values = [[str(simulator.random.randint(0, 32767)) for _ in range(args.values)]
+              for _ in range(args.clients)]
+
+    acceptors = [simulator.add(Acceptor(i, network, 0.0, 0.0, leader_fanout=args.leader_fanout,
+                                        **simulator.node_options()))
+                 for i in range(1, network.acceptor_count + 1)]
+    learners = [simulator.add(Learner(i, network, 0.0, 0.0, os.path.join(directory, 'learner{0}_{1}'.format(seed, i)),
+                                      **simulator.node_options()))
+                for i in range(1, args.learners + 1)]
+    proposers = [simulator.add(Proposer(i, network, 0.0, 0.0, args.no_timeouts and i == 1,
+                                        args.no_preexecution and i == 1, leader_fanout=args.leader_fanout,
+                                        **simulator.node_options()))
+                 for i in range(1, args.proposers + 1)]
+    clients = [simulator.add(Client(i, network, 0.0, 0.0, values=values[i - 1], **simulator.node_options()),
+                             at=simulator.now + args.client_delay)
+               for i in range(1, args.clients + 1)]
+
+    if args.crash_leader is not None:
+        simulator.at(simulator.now + args.crash_leader, simulator.crash, proposers[0])
+    if args.crash_acceptor is not None:
+        simulator.at(simulator.now + args.crash_acceptor, simulator.crash, acceptors[-1])
+    if args.partition is not None:
+        # Isolates the initial leader from all the other nodes
+        start, end = args.partition
+        simulator.at(simulator.now + start, simulator.partition, proposers[:1],
+                     acceptors + learners + proposers[1:] + clients)
+        simulator.at(simulator.now + end, simulator.heal)
+
+    start_time = time.perf_counter()
+    terminated = simulator.run(until=simulator.now + args.timeout,
+                               condition=lambda: all(learner._decided_values.watermark >= args.values
+                                                     for learner in learners))
+    elapsed = time.perf_counter() - start_time
+    virtual_time = simulator.now - Simulator.START_TIME
+
+    integrity = True
+    agreement = True
+    for instance in range(1, args.values + 1):
+        decided = {learner._decided_values[instance] for learner in learners if instance in learner._decided_values}
+        integrity = integrity and all(any(int(value) == int(client_values[instance - 1]) for client_values in values)
+                                      for value in decided)
+        agreement = agreement and len(decided) <= 1
+    simulator.shutdown()
+
+    summary = "seed {0}: integrity {1}, agreement {2}, termination {3} in {4:.3f} virtual sec ({5:.2f} sec, " \
+              "{6} datagrams, {7} dropped)".format(seed, integrity, agreement, terminated, virtual_time, elapsed,
+                                                    simulator.sent, simulator.dropped)
+    return integrity and agreement and terminated, summary
+
+
+def seed_range(seeds: str) -> List[int]:
+    first, _, last = seeds.partition('-')
+    return list(range(int(first), int(last or first) + 1))
+
+
+def time_range(times: str) -> Tuple[float, float]:
+    start, end = times.split(':')
+    return float(start), float(end)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run Multi-Paxos executions in the deterministic network simulator")
+    parser.add_argument('values', type=int, help="number of values requested by each client")
+    parser.add_argument('--seeds', type=seed_range, default=[0], help="seed or range of seeds first-last to run")
+    parser.add_argument('--loss', type=float, default=0.0, help="probability that a datagram is lost")
+    parser.add_argument('--min-delay', type=float, default=0.0002, help="minimum network delay (in sec)")
+    parser.add_argument('--max-delay', type=float, default=0.001, help="maximum network delay (in sec)")
+    parser.add_argument('--reordering', type=float, default=0.0, help="probability that a datagram is held back")
+    parser.add_argument('--duplication', type=float, default=0.0, help="probability that a datagram is duplicated")
+    parser.add_argument('--acceptors', type=int, default=3)
+    parser.add_argument('--learners', type=int, default=2)
+    parser.add_argument('--proposers', type=int, default=4)
+    parser.add_argument('--clients', type=int, default=2)
+    parser.add_argument('--quorum-size', type=int, default=2)
+    parser.add_argument('--no-timeouts', action='store_true', help="disable the round timeouts of proposer 1")
+    parser.add_argument('--no-preexecution', action='store_true',
+                        help="disable the phase 1 pre-execution (stable leader) of proposer 1")
+    parser.add_argument('--leader-fanout', action='store_true',
+                        help="send the Accept messages to the proposers only, the leader relays the decisions")
+    parser.add_argument('--client-delay', type=float, default=0.5,
+                        help="virtual time (in sec) the clients are started after the other nodes")
+    parser.add_argument('--crash-leader', type=float, default=None, metavar='TIME',
+                        help="crash proposer 1 at the given virtual time (in sec)")
+    parser.add_argument('--crash-acceptor', type=float, default=None, metavar='TIME',
+                        help="crash the acceptor with the highest ID at the given virtual time (in sec)")
+    parser.add_argument('--partition', type=time_range, default=None, metavar='START:END',
+                        help="isolate proposer 1 from the other nodes between the given virtual times (in sec)")
+    parser.add_argument('--timeout', type=float, default=120.0,
+                        help="virtual time (in sec) the learners have to decide all the values")
+    parser.add_argument('--verbose', action='store_true', help="show the logs of the nodes")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        logging.disable(logging.WARNING)
+
+    failed = []
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory() as directory:
+        for seed in args.seeds:
+            passed, summary = simulate(seed, args, directory)
+            print(summary)
+            if not passed:
+                failed.append(seed)
+    elapsed = time.perf_counter() - start
+
+    print("{0} executions, {1} instances in {2:.2f} sec ({3:.0f} instances/sec), failed seeds: {4}".format(
+        len(args.seeds), len(args.seeds) * args.values, elapsed, len(args.seeds) * args.values / elapsed,
+        failed if failed else "none"))
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,16 @@
+#!/usr/bin/env bash
+
+# Runs the failure scenarios of the simulator that past bugs were found with, every one over a range of seeds; exits
+# with an error as soon as one of them fails. Each line can be run on its own to reproduce a scenario.
+
+set -e
+cd "$(dirname "$0")"
+
+# Lossy network, duplicated and reordered datagrams
+./simulate.py 500 --seeds=1-10 --loss=0.1 --duplication=0.1 --reordering=0.1
+# Acceptor crashed while another acceptor missed the PrepareRange of the leader
+./simulate.py 300 --seeds=1-20 --loss=0.1 --crash-acceptor=0.2
+# Leader isolated by a partition, then back while another proposer holds the lease
+./simulate.py 300 --seeds=1-30 --loss=0.1 --partition=0.1:8 --proposers=3 --timeout=60
+# Leader crashed while instances time out during the leader phase 1 of the next one
+./simulate.py 1000 --seeds=1-5 --loss=0.15 --crash-leader=3
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+
+# Merges the trace files written by the nodes started with --trace=<directory> (see paxos/tracing.py) into a timeline
+# of every instance, and reports where the commit latency is spent. The latency of an instance is split in the
+# following segments, each ending at the first time any traced node reached the step:
+#
+#     client    from the first request of a client to its reception by the proposer that proposed the decided value
+#               (lost or retransmitted requests)
+#     phase1    to the Propose of the round that decided the value (phase 1 of the leader or of the instance, retried
+#               rounds after a timeout)
+#     phase2    to the first quorum of accepts seen by a proposer or a learner (lost Propose or Accept messages)
+#     delivery  to the first decision of a learner (the Decide of the leader with leader fan-out)
+#     spread    to the decision of the last learner (lost Accept messages, Decide retransmissions, catch-up)
+#
+# Usage: ./trace_report.py <trace directory> [--slowest=K] [--instance=N ...], see ./trace_report.py --help
+
+import argparse
+import glob
+import os
+import sys
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from paxos.role import Role
+from paxos.tracing import TraceEvent, Tracer
+
+# Events ending every segment of the commit latency
+SEGMENTS = [
+    ('client', (TraceEvent.PROPOSER_REQUEST,)),
+    ('phase1', (TraceEvent.PROPOSER_PROPOSE,)),
+    ('phase2', (TraceEvent.PROPOSER_DECIDED, TraceEvent.LEARNER_DECIDED)),
+    ('delivery', (TraceEvent.LEARNER_DECIDED, TraceEvent.LEARNER_DECIDE_MESSAGE, TraceEvent.LEARNER_CATCHUP)),
+]
+LEARNER_EVENTS = SEGMENTS[-1][1]
+
+# Event of an instance as (time, role, node ID, event)
+Event = Tuple[float, Role, int, TraceEvent]
+
+
+def load(directory: str) -> Tuple[Dict[Tuple[int, int], List[Event]], int]:
+    """
+    Reads all the trace files of directory, returns the events of every (shard, instance) sorted by time and the
+    number of traced learners
+    """
+    instances: Dict[Tuple[int, int], List[Event]] = defaultdict(list)
+    learners = set()
+    for path in sorted(glob.glob(os.path.join(directory, '*.trace'))):
+        (role, id, shard), events = Tracer.read(path)
+        if role == Role.LEARNER:
+            learners.add((id, shard))
+        for time, instance, event in events:
+            instances[(shard, instance)].append((time, role, id, event))
+    for events in instances.values():
+        events.sort(key=lambda event: event[0])
+    shards = len({shard for _, shard in learners}) or 1
+    return instances, len(learners) // shards
+
+
+def breakdown(events: List[Event], learners: int) -> Dict[str, Optional[float]]:
+    """
+    Duration (in sec) of every segment of the latency of an instance, None if the events delimiting it were not traced
+    """
+    first: Dict[TraceEvent, float] = {}
+    # Time of the Propose messages with their proposer, first request received by every proposer and first decision of
+    # every learner
+    proposals: List[Tuple[float, int]] = []
+    received: Dict[int, float] = {}
+    learned: Dict[int, float] = {}
+    for time, role, id, event in events:
+        first.setdefault(event, time)
+        if event == TraceEvent.PROPOSER_PROPOSE:
+            proposals.append((time, id))
+        elif event == TraceEvent.PROPOSER_REQUEST:
+            received.setdefault(id, time)
+        elif event in LEARNER_EVENTS:
+            learned.setdefault(id, time)
+
+    # Ends of the segments, starting from the first request of a client
+    steps = [first.get(TraceEvent.CLIENT_REQUEST)]
+    for name, ends in SEGMENTS:
+        times = [first[event] for event in ends if event in first]
+        steps.append(min(times) if times else None)
+    # The round that decided the value is the last one proposed before the decision
+    if steps[3] is not None:
+        decisive = [(time, id) for time, id in proposals if time <= steps[3]]
+        if decisive:
+            steps[2], proposer = decisive[-1]
+            steps[1] = received.get(proposer, steps[1])
+    steps.append(max(learned.values()) if learned and len(learned) >= learners else None)
+
+    durations = {}
+    for (name, _), start, end in zip(SEGMENTS + [('spread', ())], steps, steps[1:]):
+        durations[name] = end - start if start is not None and end is not None else None
+    durations['total'] = steps[-1] - steps[0] if steps[0] is not None and steps[-1] is not None else None
+    return durations
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    # Nearest rank
+    return sorted_values[min(int(fraction * len(sorted_values)), len(sorted_values) - 1)]
+
+
+def print_timeline(shard: int, instance: int, events: List[Event]) -> None:
+    print("Instance {0}{1}:".format(instance, " of shard {0}".format(shard) if shard else ""))
+    start = events[0][0]
+    for time, role, id, event in events:
+        print("  {0:10.3f} ms  {1:>10} {2:<3} {3}".format((time - start) * 1000.0, role.name.lower(), id,
+                                                          event.name.lower()))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Report where the commit latency of the traced instances is spent")
+    parser.add_argument('directory', help="directory of the trace files, given with --trace to the nodes")
+    parser.add_argument('--slowest', type=int, default=0, help="print the timelines of the K slowest instances")
+    parser.add_argument('--instance', type=int, action='append', default=[],
+                        help="print the timeline of the given instance (of shard 0), can be repeated")
+    args = parser.parse_args()
+
+    instances, learners = load(args.directory)
+    if not instances:
+        print("No trace file found in {0}".format(args.directory))
+        sys.exit(1)
+
+    durations = {key: breakdown(events, learners) for key, events in instances.items()}
+    complete = [key for key, segments in durations.items() if segments['total'] is not None]
+    print("{0} instances traced, {1} requested by a client and decided by all the {2} learners".format(
+        len(instances), len(complete), learners))
+
+    print("{0:10} {1:>10} {2:>10} {3:>10} {4:>10} {5:>7}".format("segment", "mean ms", "p50 ms", "p99 ms", "max ms",
+                                                                 "share"))
+    total = sum(durations[key]['total'] for key in complete)
+    for name in [name for name, _ in SEGMENTS] + ['spread', 'total']:
+        values = sorted(durations[key][name] for key in complete if durations[key][name] is not None)
+        if not values:
+            continue
+        print("{0:10} {1:10.3f} {2:10.3f} {3:10.3f} {4:10.3f} {5:6.1f}%".format(
+            name, sum(values) / len(values) * 1000.0, percentile(values, 0.5) * 1000.0,
+            percentile(values, 0.99) * 1000.0, values[-1] * 1000.0, sum(values) / total * 100.0 if total else 0.0))
+
+    # Hops repeated by the instances, which explain most of the tail
+    counts = defaultdict(int)
+    for events in instances.values():
+        for _, _, _, event in events:
+            counts[event] += 1
+    rounds = (TraceEvent.PROPOSER_PREPARE, TraceEvent.PROPOSER_LEADER_ROUND)
+    retried = sum(1 for events in instances.values() if sum(1 for event in events if event[3] in rounds) > 1)
+    print("Client retransmissions: {0}, instances with more than one round: {1}, Propose sent: {2}, "
+          "learner decisions from accepts/Decide/catch-up: {3}/{4}/{5}".format(
+              counts[TraceEvent.CLIENT_RETRANSMIT], retried, counts[TraceEvent.PROPOSER_PROPOSE],
+              counts[TraceEvent.LEARNER_DECIDED], counts[TraceEvent.LEARNER_DECIDE_MESSAGE],
+              counts[TraceEvent.LEARNER_CATCHUP]))
+
+    for key in sorted(complete, key=lambda key: durations[key]['total'], reverse=True)[:args.slowest]:
+        print_timeline(key[0], key[1], instances[key])
+    for instance in args.instance:
+        if (0, instance) in instances:
+            print_timeline(0, instance, instances[(0, instance)])
+        else:
+            print("Instance {0} not traced".format(instance))